@@ -0,0 +1,213 @@
+"""
+Buffered write path for UserActivityLog.
+
+``log_activity(user, 'login')`` only appends to a bounded in-process queue.
+A background thread drains the queue with ``bulk_create`` when
+``BATCH_SIZE`` rows are waiting or every ``FLUSH_INTERVAL_MS``, whichever
+comes first. It flushes once more at interpreter shutdown. When the queue
+is full, the ``drop`` policy discards the event right away and the
+``block`` policy waits up to ``BLOCK_TIMEOUT_MS`` for room. ``metrics()``
+reports queue depth, drops and flush latency.
+
+Settings (``ACTIVITY_LOG`` in settings.py): ENABLED, MAX_QUEUE, BATCH_SIZE,
+FLUSH_INTERVAL_MS, POLICY, BLOCK_TIMEOUT_MS.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import UserActivityLog
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_QUEUE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL_MS': 200,
+    'POLICY': 'drop',
+    'BLOCK_TIMEOUT_MS': 50,
+}
+
+# Wakes the flusher out of its queue wait when stopping.
+_WAKE = object()
+
+
+class ActivityBuffer:
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval_ms=200,
+                 policy='drop', block_timeout_ms=50):
+        if policy not in ('drop', 'block'):
+            raise ValueError("policy must be 'drop' or 'block'")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.policy = policy
+        self.block_timeout = block_timeout_ms / 1000 if block_timeout_ms is not None else None
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+        self._start_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'enqueued': 0, 'dropped': 0, 'flushed': 0, 'failed': 0, 'flushes': 0,
+            'last_flush_ms': 0.0, 'max_flush_ms': 0.0, 'total_flush_ms': 0.0,
+        }
+
+    def log(self, user, activity):
+        """Queue one event. Returns False if it was dropped under backpressure."""
+        self.start()
+        event = UserActivityLog(user_id=getattr(user, 'pk', user), activity=activity, timestamp=timezone.now())
+        try:
+            if self.policy == 'block':
+                self._queue.put(event, timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait(event)
+        except queue.Full:
+            self._count('dropped')
+            return False
+        self._count('enqueued')
+        return True
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='activity-log-flusher', daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def stop(self, timeout=5):
+        """Stop the flusher and write whatever is still queued."""
+        self._stop.set()
+        try:
+            self._queue.put_nowait(_WAKE)
+        except queue.Full:  # then the flusher isn't waiting
+            pass
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self):
+        """Synchronously write every queued event. Returns the row count."""
+        written = 0
+        while True:
+            batch = self._take(self.batch_size)
+            if not batch:
+                return written
+            written += self._write(batch)
+
+    def metrics(self):
+        with self._stats_lock:
+            metrics = dict(self._stats)
+        flushes = metrics.pop('flushes')
+        total = metrics.pop('total_flush_ms')
+        metrics.update({
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self._queue.maxsize,
+            'flushes': flushes,
+            'avg_flush_ms': total / flushes if flushes else 0.0,
+        })
+        return metrics
+
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._write(batch)
+                close_old_connections()
+
+    def _collect(self):
+        # Wait up to one flush interval, returning early with a full batch.
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is _WAKE:
+                break
+            batch.append(event)
+        return batch
+
+    def _take(self, limit):
+        batch = []
+        while len(batch) < limit:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _WAKE:
+                batch.append(event)
+        return batch
+
+    def _write(self, batch):
+        started = time.perf_counter()
+        try:
+            with self._flush_lock:
+                UserActivityLog.objects.bulk_create(batch)
+        except Exception:
+            logger.exception('Failed to write %d activity log rows', len(batch))
+            self._count('failed', len(batch))
+            return 0
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats['flushed'] += len(batch)
+            self._stats['flushes'] += 1
+            self._stats['last_flush_ms'] = elapsed
+            self._stats['max_flush_ms'] = max(self._stats['max_flush_ms'], elapsed)
+            self._stats['total_flush_ms'] += elapsed
+        return len(batch)
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                options = {**DEFAULTS, **getattr(settings, 'ACTIVITY_LOG', {})}
+                _buffer = ActivityBuffer(
+                    max_queue=options['MAX_QUEUE'],
+                    batch_size=options['BATCH_SIZE'],
+                    flush_interval_ms=options['FLUSH_INTERVAL_MS'],
+                    policy=options['POLICY'],
+                    block_timeout_ms=options['BLOCK_TIMEOUT_MS'],
+                )
+    return _buffer
+
+
+def log_activity(user, activity):
+    """Record an activity event without a synchronous INSERT on the request path."""
+    options = {**DEFAULTS, **getattr(settings, 'ACTIVITY_LOG', {})}
+    if not options['ENABLED']:
+        UserActivityLog.objects.create(user_id=getattr(user, 'pk', user), activity=activity)
+        return True
+    return get_buffer().log(user, activity)
+
+
+def metrics():
+    return get_buffer().metrics()
@@ -4,7 +4,7 @@ from .models import (User, UserGoal, UserProfile, UserNotification, UserStatisti
                      ExternalAuth, Workout, WorkoutLesson, Notification,
                      Insight, Goal, Payment, Post, Food, UserActivityLog,
                      PasswordResetRequest, Exercise, MealPlan, UserProgress,
-                     HealthTips, SomeModel)
+                     HealthTips, SomeModel, UserRollup)
 
 # Modellarni bir marta ro'yxatdan o'tkazing
 admin.site.register(UserProfile)
@@ -27,6 +27,7 @@ admin.site.register(UserProgress)
 admin.site.register(HealthTips)
 admin.site.register(SomeModel)
 admin.site.register(Post)
+admin.site.register(UserRollup)
 
 # User modelini UserAdmin bilan ro'yxatdan o'tkazing
 admin.site.register(User, UserAdmin)
@@ -0,0 +1,184 @@
+"""
+Async read-only variants of the catalog and per-user endpoints.
+
+DRF views are synchronous, so under an ASGI server every DRF request
+holds a worker thread. These are plain Django async views that read
+through the async ORM (``aiterator``, ``aget``, ``acount``) and render
+with the existing serializers. Relations are loaded up front with
+``get_related_lookups``, so serializing never queries. They are mounted
+under ``/api/v1/async/`` and are meant to be served by ``config.asgi``.
+
+List pages are keyset-paginated on the primary key: ``?before=<id>``
+returns the next page, and ``?page_size=`` is capped at 500. The row
+count (one ``COUNT(*)``) is only added when ``?count=true``. Per-user
+endpoints authenticate with the same JWT as the rest of the API and
+only return the caller's rows.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views import View
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+
+from .authentication import CachedJWTAuthentication
+from .mixins import get_related_lookups
+from .serializers import (
+    ExerciseSerializer, FoodSerializer, GoalSerializer, HealthTipsSerializer, InsightSerializer,
+    MealPlanSerializer, UserActivityLogSerializer, UserGoalSerializer, UserNotificationSerializer,
+    UserProgressSerializer, UserStatisticSerializer, WorkoutLessonSerializer, WorkoutSerializer,
+)
+
+
+class AsyncReadView(View):
+    http_method_names = ['get', 'head', 'options']
+    serializer_class = None
+    per_user = False
+    page_size = 50
+    max_page_size = 500
+
+    async def get(self, request, pk=None):
+        if self.per_user:
+            try:
+                authenticated = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+            except APIException as exc:
+                # Same body DRF's exception handler would render.
+                detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+                return JsonResponse(detail, status=exc.status_code)
+            if authenticated is None:
+                return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+            # The replica router reads it to keep a recent writer on the primary.
+            request.user = authenticated[0]
+
+        queryset = self.get_queryset(request)
+        if pk is not None:
+            try:
+                instance = await queryset.aget(pk=pk)
+            except queryset.model.DoesNotExist:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            return JsonResponse(self.get_serializer(request, instance).data)
+        return await self.list(request, queryset)
+
+    async def list(self, request, queryset):
+        page_size = self.get_page_size(request)
+        before = request.GET.get('before')
+        page = queryset.order_by('-pk')
+        if before:
+            if not before.isdigit():
+                return JsonResponse({'before': 'Must be an integer id.'}, status=400)
+            page = page.filter(pk__lt=before)
+
+        rows = [obj async for obj in page[:page_size + 1].aiterator(chunk_size=page_size + 1)]
+        data = {'next': None, 'results': self.get_serializer(request, rows[:page_size], many=True).data}
+        if len(rows) > page_size:
+            query = request.GET.copy()
+            query['before'] = rows[page_size - 1].pk
+            data['next'] = request.build_absolute_uri('?' + query.urlencode())
+        if request.GET.get('count') in ('1', 'true'):
+            data['count'] = await queryset.acount()
+        return JsonResponse(data)
+
+    def get_queryset(self, request):
+        queryset = self.serializer_class.Meta.model.objects.all()
+        select, prefetch = self.get_related_lookups()
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        if self.per_user:
+            queryset = queryset.filter(user=request.user)
+        return queryset
+
+    @classmethod
+    def get_related_lookups(cls):
+        # Walking the serializer builds all its fields; do it once per class.
+        if '_related_lookups' not in cls.__dict__:
+            cls._related_lookups = get_related_lookups(cls.serializer_class())
+        return cls._related_lookups
+
+    def get_serializer(self, request, instance, many=False):
+        # Wrapping in a DRF Request gives ?fields= / ?omit= their query_params.
+        return self.serializer_class(instance, many=many, context={'request': Request(request)})
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.GET.get('page_size', self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+
+# Catalog
+class FoodAsyncView(AsyncReadView):
+    serializer_class = FoodSerializer
+
+
+class ExerciseAsyncView(AsyncReadView):
+    serializer_class = ExerciseSerializer
+
+
+class HealthTipsAsyncView(AsyncReadView):
+    serializer_class = HealthTipsSerializer
+
+
+class WorkoutAsyncView(AsyncReadView):
+    serializer_class = WorkoutSerializer
+
+
+class WorkoutLessonAsyncView(AsyncReadView):
+    serializer_class = WorkoutLessonSerializer
+
+
+class GoalAsyncView(AsyncReadView):
+    serializer_class = GoalSerializer
+
+
+class MealPlanAsyncView(AsyncReadView):
+    serializer_class = MealPlanSerializer
+
+
+# Per-user
+class UserProgressAsyncView(AsyncReadView):
+    serializer_class = UserProgressSerializer
+    per_user = True
+
+
+class UserStatisticAsyncView(AsyncReadView):
+    serializer_class = UserStatisticSerializer
+    per_user = True
+
+
+class InsightAsyncView(AsyncReadView):
+    serializer_class = InsightSerializer
+    per_user = True
+
+
+class UserActivityLogAsyncView(AsyncReadView):
+    serializer_class = UserActivityLogSerializer
+    per_user = True
+
+
+class UserGoalAsyncView(AsyncReadView):
+    serializer_class = UserGoalSerializer
+    per_user = True
+
+
+class UserNotificationAsyncView(AsyncReadView):
+    serializer_class = UserNotificationSerializer
+    per_user = True
+
+
+ASYNC_VIEWS = [
+    ('foods', FoodAsyncView),
+    ('exercises', ExerciseAsyncView),
+    ('health-tips', HealthTipsAsyncView),
+    ('workouts', WorkoutAsyncView),
+    ('workout-lessons', WorkoutLessonAsyncView),
+    ('goals', GoalAsyncView),
+    ('meal-plans', MealPlanAsyncView),
+    ('user-progress', UserProgressAsyncView),
+    ('user-statistics', UserStatisticAsyncView),
+    ('insights', InsightAsyncView),
+    ('user-activity-logs', UserActivityLogAsyncView),
+    ('user-goals', UserGoalAsyncView),
+    ('user-notifications', UserNotificationAsyncView),
+]
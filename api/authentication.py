@@ -0,0 +1,81 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+DEFAULTS = {
+    'ALIAS': None,  # off; must name a cache every worker shares (see api.checks)
+    'TIMEOUT': 60,
+}
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'AUTH_USER_CACHE', {})}
+
+
+def _cache():
+    alias = _options()['ALIAS']
+    return caches[alias] if alias else None
+
+
+def _version_key(user_id):
+    return 'auth-user-version:%s' % user_id
+
+
+def get_user_version(user_id):
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        # A fresh token never matches entries cached under an evicted one.
+        cache.add(_version_key(user_id), '%x' % time.time_ns(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+def invalidate_user(user_id):
+    """Drop every cached copy of the user (save, password change, deactivation)."""
+    cache = _cache()
+    if cache is not None:
+        cache.set(_version_key(user_id), '%x' % time.time_ns(), timeout=None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the user from a short-TTL cache keyed
+    by user id and a per-user version, instead of a ``User`` primary-key
+    query on every request. ``invalidate_user()`` bumps the version. It is
+    called from the User ``post_save``/``post_delete`` signals, which covers
+    password changes and deactivation. Without ``AUTH_USER_CACHE['ALIAS']``
+    it is plain JWTAuthentication.
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        cache = _cache()
+        if cache is None:
+            return super().get_user(validated_token)
+        key = 'auth-user:%s:%s' % (user_id, get_user_version(user_id))
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(validated_token)
+            cache.set(key, user, _options()['TIMEOUT'])
+            return user
+
+        # Same checks the uncached path makes, against the cached row.
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN and validated_token.get(
+            api_settings.REVOKE_TOKEN_CLAIM
+        ) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
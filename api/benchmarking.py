@@ -0,0 +1,41 @@
+"""
+Helpers for the ``benchmark_*`` management commands.
+"""
+import contextlib
+import os
+import shutil
+import tempfile
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import setup_databases, teardown_databases
+
+
+@contextlib.contextmanager
+def throwaway_database():
+    """
+    Run the block against a scratch ``default`` database, created and
+    migrated the way the test runner does and dropped afterwards. Seeded
+    rows never reach the configured database, even if the run is
+    interrupted. On SQLite the scratch database is a file in a temporary
+    directory rather than in memory, so timings reflect disk I/O and
+    threads get their own connections.
+    """
+    connection = connections[DEFAULT_DB_ALIAS]
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    original_name = test_settings.get('NAME')
+    directory = None
+    if connection.vendor == 'sqlite':
+        directory = tempfile.mkdtemp(prefix='benchmark-')
+        test_settings['NAME'] = os.path.join(directory, 'benchmark.sqlite3')
+    try:
+        old_config = setup_databases(
+            verbosity=0, interactive=False, aliases={DEFAULT_DB_ALIAS}, serialized_aliases=set(),
+        )
+        try:
+            yield
+        finally:
+            teardown_databases(old_config, verbosity=0)
+    finally:
+        test_settings['NAME'] = original_name
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,71 @@
+"""
+Read-through cache for the catalog list/detail responses.
+
+Entries live in the ``api_responses`` cache alias (local-memory LRU or
+file-based, see ``CACHES`` in settings). Every key embeds a per-model
+generation token, and the ``post_save``/``post_delete`` receivers in
+``api/signals.py`` replace that token. This drops exactly the entries
+built from the changed model and leaves the rest of the cache alone.
+Keys also carry the path, query string, Accept header, active language
+and user, so no response is served to a request it wasn't built for.
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.core.cache import caches
+from django.utils.translation import get_language
+
+CACHE_ALIAS = 'api_responses'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _generation_key(model):
+    return 'gen:%s' % model._meta.label_lower
+
+
+def get_generation(model):
+    cache = get_cache()
+    key = _generation_key(model)
+    generation = cache.get(key)
+    if generation is None:
+        # A fresh token never matches entries written under an evicted one.
+        cache.add(key, '%x' % time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate_model(model):
+    get_cache().set(_generation_key(model), '%x' % time.time_ns(), timeout=None)
+
+
+def make_key(prefix, models, request):
+    generations = ','.join(get_generation(model) for model in models)
+    params = '&'.join('%s=%s' % (name, value) for name, value in sorted(request.query_params.lists()))
+    user = getattr(request, 'user', None)
+    user_id = str(user.pk) if user is not None and user.is_authenticated else ''
+    raw = '|'.join([
+        request.path, params, request.META.get('HTTP_ACCEPT', ''), get_language() or '', user_id, generations,
+    ])
+    return 'response:%s:%s' % (prefix, hashlib.md5(raw.encode('utf-8'), usedforsecurity=False).hexdigest())
+
+
+def record(prefix, outcome):
+    with _stats_lock:
+        _stats[(prefix, outcome)] += 1
+
+
+def stats():
+    """Return ``{prefix: {'hits': n, 'misses': n}}`` for this process."""
+    with _stats_lock:
+        result = {}
+        for (prefix, outcome), count in _stats.items():
+            result.setdefault(prefix, {'hits': 0, 'misses': 0})[outcome] = count
+        return result
@@ -0,0 +1,63 @@
+"""
+System checks for settings that are only correct with a cache every
+worker shares. LocMemCache lives in one process, so with several workers
+an invalidation made in one never reaches the others. It is accepted
+with DEBUG on, where runserver is a single process.
+"""
+from django.conf import settings
+from django.core import checks
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.module_loading import import_string
+
+
+def is_per_process(alias):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND', '')
+    try:
+        return issubclass(import_string(backend), LocMemCache)
+    except ImportError:
+        return False
+
+
+@checks.register(checks.Tags.caches, checks.Tags.security)
+def check_auth_user_cache(app_configs, **kwargs):
+    from .authentication import _options
+
+    alias = _options()['ALIAS']
+    if not alias or settings.DEBUG or not is_per_process(alias):
+        return []
+    return [checks.Error(
+        "AUTH_USER_CACHE['ALIAS'] = %r is a per-process LocMemCache: a deactivated user or "
+        "changed password would keep authenticating on the other workers until TIMEOUT." % alias,
+        hint="Point it at a shared cache such as 'shared' on Redis, or unset it to disable the user cache.",
+        id='api.E001',
+    )]
+
+
+@checks.register(checks.Tags.caches, checks.Tags.database)
+def check_routing_cache(app_configs, **kwargs):
+    from .db_routing import _options
+
+    options = _options()
+    alias = options['CACHE_ALIAS']
+    if not options['REPLICAS'] or options['STICKY_SECONDS'] <= 0 or settings.DEBUG or not is_per_process(alias):
+        return []
+    return [checks.Error(
+        "DATABASE_ROUTING['CACHE_ALIAS'] = %r is a per-process LocMemCache: after a write, the "
+        "user's next request can land on another worker and read a lagging replica." % alias,
+        hint="Use the 'shared' cache (or another cache every worker sees).",
+        id='api.E002',
+    )]
+
+
+@checks.register(checks.Tags.caches)
+def check_response_cache(app_configs, **kwargs):
+    from .cache import CACHE_ALIAS
+
+    if settings.DEBUG or not is_per_process(CACHE_ALIAS):
+        return []
+    return [checks.Error(
+        "CACHES[%r] is a per-process LocMemCache: a write only invalidates the cached "
+        "responses of the worker that made it, the others serve stale lists until TIMEOUT." % CACHE_ALIAS,
+        hint="Set API_CACHE_BACKEND=file, or point the alias at a cache every worker shares.",
+        id='api.E003',
+    )]
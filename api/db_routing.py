@@ -0,0 +1,162 @@
+"""
+Primary/replica database routing.
+
+``PrimaryReplicaMiddleware`` opens a routing context for each request, and
+``PrimaryReplicaRouter`` reads it. Reads made while handling a GET/HEAD
+request go to one of the ``REPLICAS``. Everything else goes to
+``default``: writes, reads in unsafe requests, reads after a write in
+the same request, and code running outside a request (commands,
+background threads).
+
+After an authenticated user writes, their reads stay on the primary for
+``STICKY_SECONDS`` so they never read their own write from a lagging
+replica. The pin lives in the ``CACHE_ALIAS`` cache, ``shared`` by
+default, so whichever worker serves the next request sees it; a
+per-process LocMemCache fails the api.E002 check once replicas are
+configured (see api.checks).
+
+Settings (``DATABASE_ROUTING`` in settings.py): REPLICAS, STICKY_SECONDS,
+CACHE_ALIAS.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+DEFAULTS = {
+    'REPLICAS': [],
+    'STICKY_SECONDS': 5,
+    'CACHE_ALIAS': 'shared',
+}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_context = contextvars.ContextVar('db_routing', default=None)
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'DATABASE_ROUTING', {})}
+
+
+def _pin_key(user_id):
+    return 'db-pin:%s' % user_id
+
+
+def pin_to_primary(user_id):
+    """Send ``user_id``'s reads to the primary for the next STICKY_SECONDS."""
+    options = _options()
+    if options['REPLICAS'] and options['STICKY_SECONDS'] > 0:
+        caches[options['CACHE_ALIAS']].set(_pin_key(user_id), True, options['STICKY_SECONDS'])
+
+
+def is_pinned(user_id):
+    return bool(caches[_options()['CACHE_ALIAS']].get(_pin_key(user_id)))
+
+
+def _resolved_user(request):
+    # Only look at a user that is already known (DRF sets request.user once
+    # it authenticates); resolving a lazy session user here would query.
+    user = request.__dict__.get('user')
+    if isinstance(user, SimpleLazyObject):
+        user = user._wrapped
+    if user is None or user is empty or not user.is_authenticated:
+        return None
+    return user
+
+
+class RoutingContext:
+    def __init__(self, request):
+        self.request = request
+        self.wrote = False
+        self._pinned = None
+
+    def use_replica(self):
+        if self.wrote or self.request.method not in SAFE_METHODS:
+            return False
+        if self._pinned is None:
+            user = _resolved_user(self.request)
+            if user is None:
+                return True
+            self._pinned = is_pinned(user.pk)
+        return not self._pinned
+
+
+class PrimaryReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # Keep async views on the event loop instead of a thread.
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        context = RoutingContext(request)
+        token = _context.set(context)
+        try:
+            response = self.get_response(request)
+        finally:
+            _context.reset(token)
+        self.finish(request, context)
+        return response
+
+    async def __acall__(self, request):
+        context = RoutingContext(request)
+        token = _context.set(context)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _context.reset(token)
+        self.finish(request, context)
+        return response
+
+    def finish(self, request, context):
+        if context.wrote:
+            user = _resolved_user(request)
+            if user is not None:
+                pin_to_primary(user.pk)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        context = _context.get()
+        replicas = _options()['REPLICAS']
+        if context is None or not replicas or not context.use_replica():
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        context = _context.get()
+        if context is not None:
+            context.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary through replication.
+        return db not in _options()['REPLICAS']
+
+
+def copy_sqlite(source=DEFAULT_DB_ALIAS, targets=None):
+    """
+    Stand-in replication for local SQLite replicas: copy the whole primary
+    database into each replica with SQLite's online backup API.
+    """
+    targets = _options()['REPLICAS'] if targets is None else targets
+    primary = connections[source]
+    primary.ensure_connection()
+    for alias in targets:
+        replica = connections[alias]
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
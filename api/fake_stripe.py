@@ -0,0 +1,138 @@
+"""
+A local fake of the Stripe charges API, for tests and offline runs.
+
+It implements the subset ``StripeGateway`` uses: ``POST /v1/charges``
+(honouring ``Idempotency-Key``), ``GET /v1/charges/<id>`` and the
+paginated ``GET /v1/charges`` list with ``created[gte|lte]``, ``limit``
+and ``starting_after``. Point the Stripe client at it with
+``stripe.api_base = server.url``.
+"""
+import itertools
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeStripeServer:
+    def __init__(self, host='127.0.0.1', port=0):
+        self.charges = {}  # id -> charge dict
+        self.idempotency = {}  # key -> charge id
+        self.requests = []  # (method, path) log
+        self._lock = threading.RLock()
+        self._sequence = itertools.count()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%s' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name='fake-stripe', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_charge(self, status='succeeded', amount=1000, customer=None, created=None, failure_message=None):
+        with self._lock:
+            charge = {
+                'id': 'ch_%s' % uuid.uuid4().hex[:24],
+                'object': 'charge',
+                'amount': amount,
+                'currency': 'usd',
+                'customer': customer,
+                'created': int(created if created is not None else time.time()),
+                'paid': status == 'succeeded',
+                'status': status,
+                'failure_message': failure_message,
+                # Tie-breaker for charges created in the same second.
+                '_sequence': next(self._sequence),
+            }
+            self.charges[charge['id']] = charge
+            return charge['id']
+
+    def list_charges(self, query):
+        created_gte = int(query.get('created[gte]', ['0'])[0])
+        created_lte = int(query.get('created[lte]', [str(2 ** 62)])[0])
+        limit = max(1, min(int(query.get('limit', ['10'])[0]), 100))
+        starting_after = query.get('starting_after', [None])[0]
+        with self._lock:
+            # Newest first, like Stripe.
+            charges = sorted(
+                (c for c in self.charges.values() if created_gte <= c['created'] <= created_lte),
+                key=lambda c: (c['created'], c['_sequence']), reverse=True,
+            )
+        if starting_after:
+            ids = [c['id'] for c in charges]
+            charges = charges[ids.index(starting_after) + 1:] if starting_after in ids else []
+        return {
+            'object': 'list',
+            'url': '/v1/charges',
+            'has_more': len(charges) > limit,
+            'data': [self.public(c) for c in charges[:limit]],
+        }
+
+    def create_charge(self, form, idempotency_key):
+        with self._lock:
+            if idempotency_key and idempotency_key in self.idempotency:
+                return 200, self.public(self.charges[self.idempotency[idempotency_key]])
+            customer = form.get('customer', [None])[0]
+            if customer and customer.startswith('cus_decline'):
+                return 402, {'error': {'type': 'card_error', 'code': 'card_declined',
+                                       'message': 'Your card was declined.'}}
+            charge_id = self.add_charge(amount=int(form.get('amount', ['0'])[0]), customer=customer)
+            if idempotency_key:
+                self.idempotency[idempotency_key] = charge_id
+            return 200, self.public(self.charges[charge_id])
+
+    def public(self, charge):
+        return {key: value for key, value in charge.items() if not key.startswith('_')}
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                server.requests.append(('GET', parts.path))
+                if parts.path == '/v1/charges':
+                    return self.respond(200, server.list_charges(parse_qs(parts.query)))
+                if parts.path.startswith('/v1/charges/'):
+                    charge = server.charges.get(parts.path.rsplit('/', 1)[1])
+                    if charge is None:
+                        return self.respond(404, {'error': {'type': 'invalid_request_error',
+                                                            'code': 'resource_missing',
+                                                            'message': 'No such charge'}})
+                    return self.respond(200, server.public(charge))
+                self.respond(404, {'error': {'type': 'invalid_request_error', 'message': 'Unrecognized request URL'}})
+
+            def do_POST(self):
+                parts = urlsplit(self.path)
+                server.requests.append(('POST', parts.path))
+                if parts.path != '/v1/charges':
+                    return self.respond(404, {'error': {'type': 'invalid_request_error',
+                                                        'message': 'Unrecognized request URL'}})
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0)).decode()
+                status, payload = server.create_charge(parse_qs(body), self.headers.get('Idempotency-Key'))
+                self.respond(status, payload)
+
+            def respond(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('Request-Id', 'req_%s' % uuid.uuid4().hex[:14])
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,55 @@
+import math
+
+from rest_framework.exceptions import ValidationError
+
+# Indexed Food columns the nutrition endpoint can filter and sort on.
+NUTRIENT_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+RANGE_LOOKUPS = ('gte', 'lte', 'gt', 'lt', 'between')
+
+
+def _number(param, value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValidationError({param: 'Expected a number.'})
+    if not math.isfinite(number):
+        raise ValidationError({param: 'Expected a finite number.'})
+    return number
+
+
+def nutrient_filters(query_params):
+    """
+    Turn ``protein__gte=20&carbs__lte=10&calories__between=100,500&is_vegetarian=true``
+    into ``QuerySet.filter()`` keyword arguments. Unknown parameters are ignored.
+    """
+    filters = {}
+    for field in NUTRIENT_FIELDS:
+        for lookup in RANGE_LOOKUPS:
+            param = '%s__%s' % (field, lookup)
+            value = query_params.get(param)
+            if value in (None, ''):
+                continue
+            if lookup == 'between':
+                bounds = value.split(',')
+                if len(bounds) != 2:
+                    raise ValidationError({param: 'Expected two comma-separated numbers.'})
+                filters['%s__range' % field] = [_number(param, bound) for bound in bounds]
+            else:
+                filters[param] = _number(param, value)
+
+    vegetarian = query_params.get('is_vegetarian')
+    if vegetarian is not None:
+        if vegetarian.lower() not in ('true', 'false', '1', '0'):
+            raise ValidationError({'is_vegetarian': 'Expected true or false.'})
+        filters['is_vegetarian'] = vegetarian.lower() in ('true', '1')
+    return filters
+
+
+def nutrient_ordering(query_params):
+    """``ordering=-protein`` -> ``('-protein', '-id')`` for the keyset paginator."""
+    ordering = query_params.get('ordering')
+    if not ordering:
+        return None
+    if ordering.lstrip('-') not in NUTRIENT_FIELDS:
+        raise ValidationError({'ordering': 'Must be one of: %s.' % ', '.join(NUTRIENT_FIELDS)})
+    return ordering, ('-id' if ordering.startswith('-') else 'id')
@@ -0,0 +1,200 @@
+"""
+Resized derivatives of uploaded images.
+
+Uploads are kept as they are. After the row commits, a background pool
+(``RUN_IN_PROCESS``) writes one downscaled copy per entry in ``SIZES``
+(longest side, never upscaled) next to the original, under
+``<upload dir>/derived/``. It records them in the model's ``*_variants``
+JSON field as ``{'source': <original name>, 'sizes': {size: name}}``.
+Serializers turn that into a size-keyed URL map. Until the derivatives
+exist, or when the stored ``source`` no longer matches the field, the
+map only holds the original; clearing the image deletes its derivatives.
+``manage.py derive_images`` (re)builds derivatives for existing media in
+parallel.
+
+Settings (``IMAGE_DERIVATIVES`` in settings.py): SIZES, FORMAT, QUALITY,
+WORKERS, RUN_IN_PROCESS.
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from PIL import Image, ImageOps
+
+from .models import Post, UserProfile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SIZES': {'thumb': 128, 'small': 320, 'medium': 640, 'large': 1280},
+    'FORMAT': 'webp',  # or 'jpeg'
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'RUN_IN_PROCESS': True,
+}
+
+# name -> (model, image field, variants field)
+SOURCES = {
+    'profile': (UserProfile, 'profile_image', 'profile_image_variants'),
+    'post': (Post, 'image', 'image_variants'),
+}
+
+_EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'IMAGE_DERIVATIVES', {})}
+
+
+def source_for_model(model):
+    for source, (source_model, _image, _variants) in SOURCES.items():
+        if source_model is model:
+            return source
+    raise LookupError('No image derivatives for %s' % model._meta.label)
+
+
+def is_current(instance, source):
+    """True if the recorded derivatives belong to the image currently on ``instance``."""
+    _model, image_field, variants_field = SOURCES[source]
+    image = getattr(instance, image_field)
+    variants = getattr(instance, variants_field) or {}
+    if not image:
+        # A cleared image leaves derivatives to remove.
+        return not variants.get('sizes')
+    return variants.get('source') == image.name
+
+
+def derivative_name(name, size, extension):
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, 'derived', '%s.%s.%s' % (os.path.splitext(filename)[0], size, extension))
+
+
+def render(image, sizes, image_format, quality):
+    """Yield ``(size, bytes)`` for each size smaller than ``image``, largest first."""
+    image = ImageOps.exif_transpose(image)
+    if image_format == 'jpeg' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    # Each size is scaled down from the previous one, not from the original.
+    for size, edge in sorted(sizes.items(), key=lambda item: -item[1]):
+        if max(image.size) <= edge:
+            continue
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == 'webp':
+            image.save(buffer, format='WEBP', quality=quality, method=4)
+        else:
+            image.save(buffer, format='JPEG', quality=quality, optimize=True, progressive=True)
+        yield size, buffer.getvalue()
+
+
+def derive(source, pk, force=False):
+    """
+    Write the derivatives for one row. Returns the new ``sizes`` map, or None
+    if there was nothing to do (already current, row gone) or the image was
+    cleared, in which case the old derivatives are deleted.
+    """
+    model, image_field, variants_field = SOURCES[source]
+    instance = model.objects.filter(pk=pk).only('pk', image_field, variants_field).first()
+    if instance is None or (not force and is_current(instance, source)):
+        return None
+    image = getattr(instance, image_field)
+    if not image:
+        _clear(instance, source)
+        return None
+    options = _options()
+    storage = image.storage
+    extension = _EXTENSIONS[options['FORMAT']]
+    sizes = {}
+    with image.open('rb') as f, Image.open(f) as original:
+        for size, data in render(original, options['SIZES'], options['FORMAT'], options['QUALITY']):
+            name = derivative_name(image.name, size, extension)
+            if storage.exists(name):
+                storage.delete(name)
+            sizes[size] = storage.save(name, ContentFile(data))
+    variants = {'source': image.name, 'sizes': sizes}
+    # Only if the image wasn't replaced meanwhile; that upload has its own job.
+    updated = model.objects.filter(pk=pk, **{image_field: image.name}).update(**{variants_field: variants})
+    if not updated:
+        for name in sizes.values():
+            storage.delete(name)
+        return None
+    # Derivatives of the image this one replaced.
+    previous = (getattr(instance, variants_field) or {}).get('sizes', {})
+    for name in set(previous.values()) - set(sizes.values()):
+        storage.delete(name)
+    return sizes
+
+
+def _clear(instance, source):
+    """Delete the derivatives of an image that was removed from ``instance``."""
+    model, image_field, variants_field = SOURCES[source]
+    no_image = Q(**{image_field: ''}) | Q(**{'%s__isnull' % image_field: True})
+    # Only if no new image arrived meanwhile; that upload has its own job.
+    if not model.objects.filter(no_image, pk=instance.pk).update(**{variants_field: {}}):
+        return
+    storage = getattr(instance, image_field).storage
+    for name in (getattr(instance, variants_field) or {}).get('sizes', {}).values():
+        storage.delete(name)
+
+
+def variant_urls(instance, source, request=None):
+    """``{'original': url, <size>: url, ...}`` for ``instance``'s image, or None without one."""
+    _model, image_field, variants_field = SOURCES[source]
+    image = getattr(instance, image_field)
+    if not image:
+        return None
+    names = {'original': image.name}
+    if is_current(instance, source):
+        names.update(getattr(instance, variants_field)['sizes'])
+    urls = {size: image.storage.url(name) for size, name in names.items()}
+    if request is not None:
+        urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+    return urls
+
+
+class ImageWorker:
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-worker')
+
+    def submit(self, source, pk):
+        return self._executor.submit(self._run, source, pk)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, source, pk):
+        try:
+            return derive(source, pk)
+        except Exception:
+            logger.exception('Deriving images for %s %s failed', source, pk)
+        finally:
+            close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = ImageWorker(max_workers=_options()['WORKERS'])
+    return _worker
+
+
+def enqueue(instance):
+    """Derive ``instance``'s image in the background once the row is committed."""
+    source = source_for_model(type(instance))
+    if _options()['RUN_IN_PROCESS'] and not is_current(instance, source):
+        transaction.on_commit(lambda: get_worker().submit(source, instance.pk))
@@ -0,0 +1,140 @@
+import asyncio
+import contextlib
+import datetime
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from api.benchmarking import throwaway_database
+from api.mixins import CachedResponseMixin
+from api.models import Food, User, UserProgress
+
+BENCH_PREFIX = 'bench-asgi'
+
+# (label, WSGI path through the DRF viewsets, ASGI path through api.async_views).
+# Neither side is served from the catalog response cache (see uncached()).
+CASES = [
+    ('catalog', '/api/v1/foods/?page_size=50', '/api/v1/async/foods/?page_size=50'),
+    ('per-user', '/api/v1/user-progress/?date_from=2000-01-01&date_to=2100-01-01&page_size=50',
+     '/api/v1/async/user-progress/?page_size=50'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests/sec, threads and traced memory per concurrent connection "
+        "of the synchronous DRF endpoints under the WSGI handler (a thread per "
+        "connection) with the async views under the ASGI handler (one event loop). "
+        "Both run in-process, without a server or sockets, against a scratch "
+        "database created and dropped like the test runner's. The WSGI catalog "
+        "endpoint bypasses its response cache, which the async views don't have."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000, help='Total requests per run.')
+        parser.add_argument('--rows', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # The test clients send Host: testserver.
+        with throwaway_database(), uncached(), \
+                override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            token = self.seed(options['rows'])
+            headers = {'Authorization': 'Bearer %s' % token}
+            for label, wsgi_path, asgi_path in CASES:
+                for mode, path in (('wsgi', wsgi_path), ('asgi', asgi_path)):
+                    run = self.run_wsgi if mode == 'wsgi' else self.run_asgi
+                    rate, threads = self.measure(run, path, headers, options['concurrency'], options['requests'])
+                    memory = self.measure_memory(run, path, headers, options['concurrency'])
+                    self.stdout.write('%-9s %-5s %8.0f req/s  threads %4d  %7.1f KiB/connection' % (
+                        label, mode, rate, threads, memory / 1024))
+
+    def seed(self, rows):
+        user = User.objects.create(username='%s-user' % BENCH_PREFIX, email='%s@example.com' % BENCH_PREFIX)
+        Food.objects.bulk_create(
+            Food(name='%s-%d' % (BENCH_PREFIX, i), preparation_time=10, calories=i, water_intake=0,
+                 description='', ingredients='', instructions='', video_url='')
+            for i in range(rows)
+        )
+        start = datetime.date(2000, 1, 1)
+        UserProgress.objects.bulk_create(
+            UserProgress(user=user, date=start + datetime.timedelta(days=i), weight=70,
+                         calories_burned=300, workout_duration=30)
+            for i in range(rows)
+        )
+        return str(AccessToken.for_user(user))
+
+    def run_wsgi(self, path, headers, concurrency, total):
+        local = threading.local()
+
+        def request(_):
+            client = getattr(local, 'client', None)
+            if client is None:
+                client = local.client = Client(headers=headers)
+            response = client.get(path)
+            assert response.status_code == 200, response.content[:300]
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(request, range(total)))
+
+    def run_asgi(self, path, headers, concurrency, total):
+        async def main():
+            client = AsyncClient()
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def request():
+                async with semaphore:
+                    response = await client.get(path, headers=headers)
+                    assert response.status_code == 200, response.content[:300]
+
+            await asyncio.gather(*(request() for _ in range(total)))
+
+        asyncio.run(main())
+
+    def measure(self, run, path, headers, concurrency, total):
+        run(path, headers, concurrency, concurrency)  # warm up
+        peak_threads = [threading.active_count()]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(0.01):
+                peak_threads[0] = max(peak_threads[0], threading.active_count())
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        started = time.perf_counter()
+        run(path, headers, concurrency, total)
+        elapsed = time.perf_counter() - started
+        done.set()
+        sampler.join()
+        # Minus this thread and the sampler.
+        return total / elapsed, peak_threads[0] - 2
+
+    def measure_memory(self, run, path, headers, concurrency):
+        # Python allocations held while `concurrency` requests are in flight
+        # (thread stacks are not traced, so WSGI's real cost is higher).
+        tracemalloc.start()
+        try:
+            baseline = tracemalloc.get_traced_memory()[0]
+            run(path, headers, concurrency, concurrency)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return (peak - baseline) / concurrency
+
+
+@contextlib.contextmanager
+def uncached():
+    """Serve CachedResponseMixin viewsets straight from the view, as the async views are."""
+    cached_response = CachedResponseMixin.cached_response
+    CachedResponseMixin.cached_response = lambda self, view, request, *args, **kwargs: view(request, *args, **kwargs)
+    try:
+        yield
+    finally:
+        CachedResponseMixin.cached_response = cached_response
@@ -0,0 +1,115 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.sqlite import apply_pragmas
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer a scratch SQLite file from concurrent threads, once the way the "
+        "development profile connects (a new connection per request, default "
+        "pragmas) and once the way the production profile does (a persistent "
+        "connection per worker plus SQLITE_PRODUCTION_PRAGMAS), and compare throughput, "
+        "latency and 'database is locked' errors. The project database is not touched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--requests', type=int, default=300, help='Requests per worker.')
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--rows', type=int, default=20000, help='Rows seeded before the run.')
+
+    def handle(self, *args, **options):
+        profiles = [
+            ('development', False, {}),
+            ('production', True, settings.SQLITE_PRODUCTION_PRAGMAS),
+        ]
+        self.stdout.write('%d workers x %d requests, %d%% writes' % (
+            options['workers'], options['requests'], options['write_ratio'] * 100))
+        for name, persistent, profile_pragmas in profiles:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'bench.sqlite3')
+                self.seed(path, options['rows'])
+                result = self.run_profile(path, persistent, profile_pragmas, options)
+            self.report(name, result)
+
+    def seed(self, path, rows):
+        db = sqlite3.connect(path)
+        db.execute(
+            'CREATE TABLE activity (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'user_id INTEGER NOT NULL, activity VARCHAR(255) NOT NULL, timestamp DATETIME NOT NULL)'
+        )
+        db.execute('CREATE INDEX activity_user_ts ON activity (user_id, timestamp)')
+        db.executemany(
+            'INSERT INTO activity (user_id, activity, timestamp) VALUES (?, ?, datetime())',
+            ((i % 100, 'login') for i in range(rows)),
+        )
+        db.commit()
+        db.close()
+
+    def connect(self, path, pragmas):
+        # Same arguments Django's SQLite backend passes (no explicit timeout).
+        db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        if pragmas:
+            apply_pragmas(db, pragmas)
+        return db
+
+    def run_profile(self, path, persistent, pragmas, options):
+        latencies = []
+        errors = [0]
+        lock = threading.Lock()
+
+        def request(db, rng):
+            user_id = rng.randrange(100)
+            if rng.random() < options['write_ratio']:
+                db.execute('INSERT INTO activity (user_id, activity, timestamp) VALUES (?, ?, datetime())',
+                           (user_id, 'login'))
+            else:
+                db.execute('SELECT id, activity, timestamp FROM activity WHERE user_id = ? '
+                           'ORDER BY timestamp DESC LIMIT 50', (user_id,)).fetchall()
+
+        def worker(seed):
+            rng = random.Random(seed)
+            db = self.connect(path, pragmas) if persistent else None
+            local, failed = [], 0
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                conn = db or self.connect(path, pragmas)
+                try:
+                    request(conn, rng)
+                except sqlite3.OperationalError:
+                    failed += 1
+                finally:
+                    if db is None:
+                        conn.close()
+                local.append((time.perf_counter() - started) * 1000)
+            if db is not None:
+                db.close()
+            with lock:
+                latencies.extend(local)
+                errors[0] += failed
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['workers'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {'elapsed': elapsed, 'latencies': latencies, 'errors': errors[0]}
+
+    def report(self, name, result):
+        latencies = sorted(result['latencies'])
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        self.stdout.write(
+            '%-12s %8.0f req/s  p50 %6.2f ms  p99 %7.2f ms  locked errors %d' % (
+                name, len(latencies) / result['elapsed'], statistics.median(latencies), p99, result['errors'])
+        )
@@ -0,0 +1,148 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from api.models import (
+    User, UserProgress, Insight, UserStatistic, UserActivityLog,
+    HealthTips, Exercise,
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic time-series rows, then show the query plan and timing of "
+        "the filtered queries with and without their index. Everything runs in "
+        "one transaction that is rolled back, so the database is left untouched."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='Rows per table.')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--repeat', type=int, default=20, help='Timed runs per query.')
+
+    def handle(self, *args, **options):
+        # SQLite can only rebuild tables (dropping a unique constraint) with
+        # foreign key checks off, and the pragma is ignored inside a transaction.
+        connection.disable_constraint_checking()
+        try:
+            with transaction.atomic():
+                self.seed(options['rows'], options['users'])
+                for case in self.get_cases():
+                    self.run_case(case, options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            connection.enable_constraint_checking()
+
+    def seed(self, rows, users):
+        self.stdout.write('Seeding %d rows per table for %d users...' % (rows, users))
+        people = User.objects.bulk_create(
+            User(username='bench%d' % i, email='bench%d@example.com' % i) for i in range(users)
+        )
+        self.user = people[0]
+        start = datetime.date(2000, 1, 1)
+        per_user = rows // users
+        days = [start + datetime.timedelta(days=d) for d in range(per_user)]
+
+        UserProgress.objects.bulk_create(
+            UserProgress(user=u, date=day, weight=70, calories_burned=300, workout_duration=30)
+            for u in people for day in days
+        )
+        Insight.objects.bulk_create(
+            Insight(user=u, date=day, weight=70, workout_duration=30, calories_burned=300)
+            for u in people for day in days
+        )
+        UserStatistic.objects.bulk_create(
+            UserStatistic(user=u, date=day, steps=8000, calories_burned=300, exercise_duration=30)
+            for u in people for day in days
+        )
+        UserActivityLog.objects.bulk_create(
+            UserActivityLog(user=u, activity='login') for u in people for _ in days
+        )
+        categories = ['nutrition', 'exercise', 'mental_health']
+        HealthTips.objects.bulk_create(
+            HealthTips(title='tip', content='...', category=categories[i % 3]) for i in range(rows)
+        )
+        Exercise.objects.bulk_create(
+            Exercise(name='ex', description='...', duration=30, calories_burned=random.randint(0, 1000))
+            for _ in range(rows)
+        )
+        self.date_range = [start + datetime.timedelta(days=30), start + datetime.timedelta(days=60)]
+
+    def get_cases(self):
+        # The same filter + keyset page (ORDER BY ... LIMIT 51) the list endpoints run.
+        def constraint(model, name):
+            def drop(editor):
+                # SQLite drops a unique constraint by rebuilding the table from
+                # model._meta, so the constraint must be gone from it meanwhile.
+                constraints = model._meta.constraints
+                model._meta.constraints = [c for c in constraints if c.name != name]
+                try:
+                    editor.remove_constraint(model, next(c for c in constraints if c.name == name))
+                finally:
+                    model._meta.constraints = constraints
+                    model._meta.__dict__.pop('total_unique_constraints', None)
+            return drop
+
+        def index(model, name):
+            return lambda editor: editor.remove_index(
+                model, next(i for i in model._meta.indexes if i.name == name))
+
+        def field_index(model, name):
+            def drop(editor):
+                old_field = model._meta.get_field(name)
+                new_field = old_field.clone()
+                new_field.db_index = False
+                new_field.set_attributes_from_name(name)
+                new_field.model = model
+                editor.alter_field(model, old_field, new_field)
+            return drop
+
+        return [
+            ('UserProgress (user, date) unique',
+             UserProgress.objects.filter(user=self.user, date__range=self.date_range).order_by('-date', '-id')[:51],
+             constraint(UserProgress, 'userprogress_user_date_uniq')),
+            ('Insight (user, date)',
+             Insight.objects.filter(user=self.user, date__range=self.date_range).order_by('-date', '-id')[:51],
+             index(Insight, 'insight_user_date_idx')),
+            ('UserStatistic (user, date) unique',
+             UserStatistic.objects.filter(user=self.user, date__range=self.date_range).order_by('-date', '-id')[:51],
+             constraint(UserStatistic, 'userstatistic_user_date_uniq')),
+            ('UserActivityLog (user, timestamp)',
+             UserActivityLog.objects.filter(user=self.user).order_by('-timestamp', '-id')[:51],
+             index(UserActivityLog, 'activitylog_user_ts_idx')),
+            ('HealthTips.category',
+             HealthTips.objects.filter(category='mental_health').order_by('-id')[:51],
+             field_index(HealthTips, 'category')),
+            ('Exercise.calories_burned',
+             Exercise.objects.filter(calories_burned__gte=990).order_by('-calories_burned', '-id')[:51],
+             field_index(Exercise, 'calories_burned')),
+        ]
+
+    def measure(self, queryset, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            list(queryset.all())
+            timings.append(time.perf_counter() - started)
+        return queryset.explain(), statistics.median(timings) * 1000
+
+    def run_case(self, case, repeat):
+        title, queryset, drop_index = case
+        plan_with, ms_with = self.measure(queryset, repeat)
+        with connection.schema_editor(atomic=False) as editor:
+            drop_index(editor)
+        plan_without, ms_without = self.measure(queryset, repeat)
+
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write('  without index: %8.3f ms  %s' % (ms_without, plan_without.replace('\n', ' / ')))
+        self.stdout.write('  with index:    %8.3f ms  %s' % (ms_with, plan_with.replace('\n', ' / ')))
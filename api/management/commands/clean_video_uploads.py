@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api import uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete unfinished video uploads that have not received a chunk for "
+        "VIDEO_UPLOADS['EXPIRE_AFTER_SECONDS'], with their partial files."
+    )
+
+    def handle(self, *args, **options):
+        count = 0
+        for upload in uploads.expired().iterator():
+            uploads.abort(upload)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('Removed %d abandoned upload(s).' % count))
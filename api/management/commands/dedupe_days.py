@@ -0,0 +1,48 @@
+import os
+
+from django.core import serializers
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.migrations.loader import MigrationLoader
+from django.db.models import Max
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete duplicate UserProgress/UserStatistic rows for the same (user, date), "
+        "keeping the newest of each, so migration 0006 can add its unique constraints. "
+        "The removed rows are written to --output as a fixture first, so "
+        "`manage.py loaddata <file>` restores them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help='Fixture file for the removed rows (JSON).')
+        parser.add_argument('--dry-run', action='store_true', help='Write the fixture but delete nothing.')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        if os.path.exists(path):
+            raise CommandError('%s already exists; pick a new file.' % path)
+
+        # The models as the applied migrations left them: this runs before
+        # 0006, when later columns and tables (and their signals) don't exist.
+        loader = MigrationLoader(connection)
+        apps = loader.project_state(list(loader.applied_migrations)).apps
+        models = [apps.get_model('api', name) for name in ('UserProgress', 'UserStatistic')]
+
+        with transaction.atomic():
+            duplicates = [(model, self.duplicates(model)) for model in models]
+            rows = [row for _model, queryset in duplicates for row in queryset]
+            with open(path, 'w') as f:
+                serializers.serialize('json', rows, indent=2, stream=f)
+            for model, queryset in duplicates:
+                count = queryset.count()
+                if not options['dry_run']:
+                    queryset.delete()
+                self.stdout.write('%s %d duplicate %s row(s).' % (
+                    'Would delete' if options['dry_run'] else 'Deleted', count, model.__name__))
+        self.stdout.write(self.style.SUCCESS('Wrote %d row(s) to %s.' % (len(rows), path)))
+
+    def duplicates(self, model):
+        keep = model.objects.values('user', 'date').annotate(keep_id=Max('id')).values('keep_id')
+        return model.objects.exclude(id__in=keep).order_by('user', 'date', 'id')
@@ -0,0 +1,57 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+
+from api import images
+
+
+class Command(BaseCommand):
+    help = (
+        "Write the resized derivatives of existing profile and post images, "
+        "several images at a time. Rows whose derivatives already match their "
+        "image are skipped unless --force is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*', metavar='source',
+                            help='profile and/or post (default: both).')
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--force', action='store_true', help='Rebuild current derivatives too.')
+
+    def handle(self, *args, **options):
+        sources = options['sources'] or list(images.SOURCES)
+        unknown = set(sources) - set(images.SOURCES)
+        if unknown:
+            raise CommandError('Unknown source(s): %s' % ', '.join(sorted(unknown)))
+
+        def derive(job):
+            source, pk = job
+            try:
+                return images.derive(source, pk, force=options['force'])
+            except Exception as e:
+                # One unreadable upload shouldn't stop the run.
+                return e
+            finally:
+                close_old_connections()
+
+        with ThreadPoolExecutor(max_workers=options['workers'], thread_name_prefix='derive-images') as pool:
+            for source in sources:
+                model, image_field, _variants = images.SOURCES[source]
+                pks = (
+                    model.objects
+                    .exclude(**{image_field: ''})
+                    .exclude(**{'%s__isnull' % image_field: True})
+                    .order_by('pk')
+                    .values_list('pk', flat=True)
+                )
+                jobs = [(source, pk) for pk in pks.iterator()]
+                derived = failed = 0
+                for job, result in zip(jobs, pool.map(derive, jobs)):
+                    if isinstance(result, Exception):
+                        failed += 1
+                        self.stderr.write('%s %s: %s' % (source, job[1], result))
+                    elif result is not None:
+                        derived += 1
+                self.stdout.write(self.style.SUCCESS('%s: derived %d of %d images, %d failed.' % (
+                    source, derived, len(jobs), failed)))
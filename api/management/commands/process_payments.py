@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import payments
+
+
+class Command(BaseCommand):
+    help = (
+        "Charge pending payments, plus processing ones whose worker died. Use it "
+        "as the worker when PAYMENTS['RUN_IN_PROCESS'] is off, or as a sweeper "
+        "next to the in-process pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep polling every N seconds. Default: one pass.')
+        parser.add_argument('--batch', type=int, default=100, help='Payments claimed per pass.')
+
+    def handle(self, *args, **options):
+        while True:
+            counts = {}
+            for payment_id in list(payments.due_payments()[:options['batch']]):
+                result = payments.process_payment(payment_id)
+                if result is not None:
+                    counts[result] = counts.get(result, 0) + 1
+            if counts or not options['interval']:
+                summary = ', '.join('%d %s' % (n, state) for state, n in sorted(counts.items())) or 'nothing due'
+                self.stdout.write(self.style.SUCCESS('Processed payments: %s.' % summary))
+            if not options['interval']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the UserRollup buckets from the raw time-series rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('sources', nargs='*', metavar='source',
+                            help='progress, insight and/or statistic (default: all).')
+
+    def handle(self, *args, **options):
+        sources = options['sources'] or list(rollups.SOURCES)
+        unknown = set(sources) - set(rollups.SOURCES)
+        if unknown:
+            raise CommandError('Unknown source(s): %s' % ', '.join(sorted(unknown)))
+        for source in sources:
+            rollups.rebuild(source)
+            self.stdout.write(self.style.SUCCESS('Rebuilt %s rollups.' % source))
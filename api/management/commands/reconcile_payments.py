@@ -0,0 +1,141 @@
+import datetime
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api import payments
+from api.models import Payment
+
+
+class Command(BaseCommand):
+    help = (
+        "Check settled payments against the processor and correct their status. "
+        "Unreconciled rows are read in primary-key chunks; each chunk becomes one "
+        "paginated charge listing, and up to --concurrency chunks are fetched at "
+        "once. Results are written with bulk_update and the last primary key is "
+        "saved to a checkpoint file after every wave, so an interrupted run "
+        "resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='Payments per gateway batch.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Batches fetched in parallel.')
+        parser.add_argument('--window-slack', type=int, default=300,
+                            help='Seconds added around each batch\'s creation window.')
+        parser.add_argument('--checkpoint', default=os.path.join(settings.BASE_DIR, 'cache', 'reconcile_payments.json'))
+        parser.add_argument('--reset', action='store_true', help='Ignore the checkpoint and start over.')
+        parser.add_argument('--max-chunks', type=int, default=0, help='Stop after N chunks. Default: run to the end.')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        last_pk = 0 if options['reset'] else self.load_checkpoint(checkpoint)
+        if last_pk:
+            self.stdout.write('Resuming after payment %d.' % last_pk)
+        gateway = payments.get_gateway()
+        slack = datetime.timedelta(seconds=options['window_slack'])
+        counts = {'matched': 0, 'corrected': 0, 'pending': 0, 'missing': 0}
+        chunks_left = options['max_chunks'] or None
+
+        with ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix='reconcile') as pool:
+            while True:
+                wave_size = options['concurrency'] if chunks_left is None else min(options['concurrency'], chunks_left)
+                wave = []
+                for _ in range(wave_size):
+                    chunk = list(self.unreconciled(wave[-1][-1].pk if wave else last_pk)[:options['chunk_size']])
+                    if not chunk:
+                        break
+                    wave.append(chunk)
+                if not wave:
+                    break
+
+                # The window follows when the payments were created, not
+                # updated_at: rows backfilled by migration 0010 carry the
+                # migration time there. Charges made later by a retry fall
+                # outside it and are fetched one by one.
+                futures = [
+                    pool.submit(gateway.fetch_charges, [p.stripe_charge_id for p in chunk],
+                                min(p.timestamp for p in chunk) - slack,
+                                max(p.timestamp for p in chunk) + slack)
+                    for chunk in wave
+                ]
+                try:
+                    results = [future.result() for future in futures]
+                except payments.GatewayUnavailable as e:
+                    # The checkpoint still points before this wave.
+                    raise CommandError('Gateway unavailable, stopped after payment %d: %s' % (last_pk, e))
+
+                updated = []
+                now = timezone.now()
+                for chunk, charges in zip(wave, results):
+                    for payment in chunk:
+                        outcome = self.apply(payment, charges.get(payment.stripe_charge_id), now)
+                        counts[outcome] += 1
+                        if outcome in ('matched', 'corrected'):
+                            updated.append(payment)
+                with transaction.atomic():
+                    Payment.objects.bulk_update(updated, ['status', 'success', 'error', 'reconciled_at'])
+                last_pk = wave[-1][-1].pk
+                self.save_checkpoint(checkpoint, last_pk)
+
+                if chunks_left is not None:
+                    chunks_left -= len(wave)
+                    if not chunks_left:
+                        break
+                if len(wave) < wave_size or len(wave[-1]) < options['chunk_size']:
+                    break
+
+        finished = not self.unreconciled(last_pk).exists()
+        if finished and os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        self.stdout.write(self.style.SUCCESS(
+            'Reconciled payments: %(matched)d matched, %(corrected)d corrected, '
+            '%(pending)d still pending, %(missing)d missing.' % counts
+        ))
+        if not finished:
+            self.stdout.write('Stopped after payment %d; run again to continue.' % last_pk)
+
+    def unreconciled(self, after_pk):
+        return (
+            Payment.objects
+            .filter(pk__gt=after_pk, reconciled_at__isnull=True,
+                    status__in=[Payment.STATUS_SUCCEEDED, Payment.STATUS_FAILED])
+            .exclude(stripe_charge_id='')
+            .order_by('pk')
+            .only('pk', 'stripe_charge_id', 'status', 'success', 'error', 'timestamp')
+        )
+
+    def apply(self, payment, charge, now):
+        """Update ``payment`` in memory from the processor's charge and return the outcome."""
+        if charge is None:
+            self.stderr.write('Payment %d: charge %s not found.' % (payment.pk, payment.stripe_charge_id))
+            return 'missing'
+        if charge.status == 'pending':
+            return 'pending'
+        status = Payment.STATUS_SUCCEEDED if charge.status == 'succeeded' else Payment.STATUS_FAILED
+        error = '' if status == Payment.STATUS_SUCCEEDED else charge.failure_message
+        outcome = 'matched' if (payment.status, payment.error) == (status, error) else 'corrected'
+        payment.status, payment.error = status, error
+        payment.success = status == Payment.STATUS_SUCCEEDED
+        payment.reconciled_at = now
+        return outcome
+
+    def load_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f)['last_pk']
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError) as e:
+            raise CommandError('Unreadable checkpoint %s (%s); pass --reset to start over.' % (path, e))
+
+    def save_checkpoint(self, path, last_pk):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp = '%s.tmp' % path
+        with open(tmp, 'w') as f:
+            json.dump({'last_pk': last_pk, 'saved_at': timezone.now().isoformat()}, f)
+        os.replace(tmp, path)
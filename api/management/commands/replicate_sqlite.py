@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from api.db_routing import _options, copy_sqlite
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the configured replicas (local stand-in for replication)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help='Keep copying every N seconds (simulated replica lag). Default: copy once.')
+
+    def handle(self, *args, **options):
+        replicas = _options()['REPLICAS']
+        if not replicas:
+            raise CommandError('No replicas configured (set DB_REPLICAS).')
+        for alias in ['default'] + replicas:
+            if connections[alias].vendor != 'sqlite':
+                raise CommandError('%s is not a SQLite database.' % alias)
+        while True:
+            copy_sqlite(targets=replicas)
+            self.stdout.write(self.style.SUCCESS('Copied default to %s.' % ', '.join(replicas)))
+            if not options['interval']:
+                return
+            time.sleep(options['interval'])
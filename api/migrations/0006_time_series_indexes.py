@@ -0,0 +1,69 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:00
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicate_days(apps, schema_editor):
+    # The unique constraints below need one row per (user, date). Removing
+    # the extra rows is user data, so that is left to an explicit command.
+    conflicts = []
+    for model_name in ('UserProgress', 'UserStatistic'):
+        model = apps.get_model('api', model_name)
+        rows = (
+            model.objects.values('user', 'date')
+            .annotate(rows=Count('id'))
+            .filter(rows__gt=1)
+            .values_list('rows', flat=True)
+        )
+        if rows:
+            conflicts.append('%d %s rows on %d duplicated (user, date) pairs' % (sum(rows), model_name, len(rows)))
+    if conflicts:
+        raise RuntimeError(
+            'Cannot add the unique (user, date) constraints: %s. Review them and run '
+            '`manage.py dedupe_days --output <file>`, which keeps the newest row of each '
+            'pair and saves the removed ones as a fixture, then migrate again.' % '; '.join(conflicts)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_food_exercise_workout_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exercise',
+            name='calories_burned',
+            field=models.IntegerField(db_index=True, help_text='Calories burned'),
+        ),
+        migrations.AlterField(
+            model_name='healthtips',
+            name='category',
+            field=models.CharField(choices=[('nutrition', 'Nutrition'), ('exercise', 'Exercise'), ('mental_health', 'Mental Health')], db_index=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='insight',
+            index=models.Index(fields=['user', 'date'], name='insight_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='useractivitylog',
+            index=models.Index(fields=['user', 'timestamp'], name='activitylog_user_ts_idx'),
+        ),
+        migrations.AlterField(
+            model_name='userstatistic',
+            name='date',
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+        migrations.RunPython(check_duplicate_days, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userprogress',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='userprogress_user_date_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='userstatistic',
+            constraint=models.UniqueConstraint(fields=('user', 'date'), name='userstatistic_user_date_uniq'),
+        ),
+    ]
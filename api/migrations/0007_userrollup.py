@@ -0,0 +1,35 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_time_series_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('progress', 'UserProgress'), ('insight', 'Insight'), ('statistic', 'UserStatistic')], max_length=10)),
+                ('granularity', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=5)),
+                ('period_start', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('weight_sum', models.FloatField(default=0)),
+                ('calories_burned_sum', models.FloatField(default=0)),
+                ('duration_sum', models.IntegerField(default=0)),
+                ('steps_sum', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'source', 'granularity', 'period_start'), name='userrollup_bucket_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_userrollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='food',
+            name='calories',
+            field=models.FloatField(db_index=True),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='protein',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='carbs',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='fat',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='food',
+            name='is_vegetarian',
+            field=models.BooleanField(db_index=True, default=False),
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:00
+
+import api.models
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def backfill_payments(apps, schema_editor):
+    # Rows before the intent flow were written after a synchronous charge;
+    # they must not be picked up by the payment worker.
+    Payment = apps.get_model('api', 'Payment')
+    for payment in Payment.objects.all().iterator():
+        payment.idempotency_key = api.models.new_idempotency_key()
+        payment.status = 'succeeded' if payment.success else 'failed'
+        payment.save(update_fields=['idempotency_key', 'status'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_useractivitylog_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='stripe_customer_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='payment',
+            name='stripe_charge_id',
+            field=models.CharField(blank=True, default='', max_length=50),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], db_index=True, default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='payment',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_payments, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(default=api.models.new_idempotency_key, editable=False, max_length=64, unique=True),
+        ),
+    ]
@@ -0,0 +1,501 @@
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Count, Max
+from django.http import StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import serializers, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.validators import UniqueTogetherValidator
+
+from . import cache as response_cache
+from . import rollups
+from .models import UserRollup
+from .renderers import NDJSONRenderer
+
+
+def _split_param(value):
+    if not value:
+        return []
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+class SparseFieldsetSerializerMixin:
+    """
+    Lets clients pick the serialized fields with ``?fields=a,b`` or drop
+    some with ``?omit=c,d``. Only applies to read (safe method) requests,
+    so write validation always sees the full field set.
+    """
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+
+        requested = _split_param(request.query_params.get(self.fields_query_param))
+        omitted = _split_param(request.query_params.get(self.omit_query_param))
+        if requested:
+            for name in set(self.fields) - set(requested):
+                self.fields.pop(name)
+        for name in omitted:
+            self.fields.pop(name, None)
+
+
+class SparseFieldsetViewSetMixin:
+    """
+    Pushes the serializer's sparse fieldset down into SQL with ``.only()``,
+    so the columns the client did not ask for are never read.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            return queryset
+
+        query_params = self.request.query_params
+        if not ('fields' in query_params or 'omit' in query_params):
+            return queryset
+
+        columns = self.get_sparse_columns(queryset)
+        if columns:
+            queryset = queryset.only(*columns)
+        return queryset
+
+    def get_sparse_columns(self, queryset):
+        """
+        Return the model fields needed by the remaining serializer fields,
+        or ``None`` when a field's source can't be mapped to a column.
+        Fields computed from several columns (``source='*'``) can list
+        them in a ``sparse_columns`` attribute.
+        """
+        model = queryset.model
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+
+        columns = {model._meta.pk.name}
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            declared = getattr(field, 'sparse_columns', None)
+            if declared is not None:
+                columns.update(declared)
+                continue
+            name = field.source.split('.')[0]
+            try:
+                model_field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                return None
+            if model_field.many_to_many:
+                continue
+            if not model_field.concrete:
+                return None
+            columns.add(model_field.name)
+
+        # The keyset paginator reads its ordering key from every row.
+        get_ordering = getattr(self.paginator, 'get_ordering', None)
+        if get_ordering is not None:
+            for key in get_ordering(self.request, queryset, self):
+                columns.add(key.lstrip('-'))
+        return sorted(columns)
+
+
+def get_related_lookups(serializer, prefix=''):
+    """
+    Walk a serializer's fields and return ``(select_related, prefetch_related)``
+    lookups covering every relation it will traverse while serializing.
+    """
+    select, prefetch = [], []
+    model = serializer.Meta.model
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        try:
+            model_field = model._meta.get_field(field.source.split('.')[0])
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+
+        lookup = prefix + model_field.name
+        to_many = model_field.many_to_many or model_field.one_to_many
+        if isinstance(field, serializers.ListSerializer):
+            prefetch.append(lookup)
+            nested_select, nested_prefetch = get_related_lookups(field.child, lookup + '__')
+            prefetch.extend(nested_select + nested_prefetch)
+        elif isinstance(field, serializers.BaseSerializer):
+            nested_select, nested_prefetch = get_related_lookups(field, lookup + '__')
+            if to_many:
+                prefetch.extend([lookup] + nested_select + nested_prefetch)
+            else:
+                select.extend([lookup] + nested_select)
+                prefetch.extend(nested_prefetch)
+        elif isinstance(field, serializers.ManyRelatedField) or to_many:
+            prefetch.append(lookup)
+        elif isinstance(field, serializers.RelatedField) and not field.use_pk_only_optimization():
+            select.append(lookup)
+    return select, prefetch
+
+
+class EagerLoadingViewSetMixin:
+    """
+    Applies ``select_related``/``prefetch_related`` derived from the
+    serializer's nested and related fields, so a page of N rows costs a
+    constant number of queries instead of N+1.
+    """
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        serializer = self.get_serializer_class()(context=self.get_serializer_context())
+        if not hasattr(serializer, 'Meta'):
+            return queryset
+
+        select, prefetch = get_related_lookups(serializer)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class StreamingListMixin:
+    """
+    Opt-in streaming export for ``list``. With ``?stream=1`` the rows come
+    back as one JSON array, with ``Accept: application/x-ndjson`` as one
+    object per line. Rows are read with ``iterator(chunk_size=...)`` and
+    serialized a chunk at a time, so memory stays flat for any row count.
+    """
+    stream_query_param = 'stream'
+    stream_chunk_size = 500
+
+    def get_renderers(self):
+        return super().get_renderers() + [NDJSONRenderer()]
+
+    def list(self, request, *args, **kwargs):
+        ndjson = getattr(request.accepted_renderer, 'format', None) == NDJSONRenderer.format
+        if not (ndjson or request.query_params.get(self.stream_query_param) in ('1', 'true')):
+            return super().list(request, *args, **kwargs)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by('pk')
+        if ndjson:
+            content = self.stream_ndjson(queryset)
+            content_type = NDJSONRenderer.media_type
+        else:
+            content = self.stream_json_array(queryset)
+            content_type = 'application/json'
+        return StreamingHttpResponse(content, content_type=content_type)
+
+    def iter_chunks(self, queryset):
+        chunk = []
+        for instance in queryset.iterator(chunk_size=self.stream_chunk_size):
+            chunk.append(instance)
+            if len(chunk) >= self.stream_chunk_size:
+                yield self.get_serializer(chunk, many=True).data
+                chunk = []
+        if chunk:
+            yield self.get_serializer(chunk, many=True).data
+
+    def stream_ndjson(self, queryset):
+        for rows in self.iter_chunks(queryset):
+            yield b''.join(NDJSONRenderer.render_line(row) for row in rows)
+
+    def stream_json_array(self, queryset):
+        yield b'['
+        first = True
+        for rows in self.iter_chunks(queryset):
+            lines = [NDJSONRenderer.render_line(row).rstrip(b'\n') for row in rows]
+            yield (b'' if first else b',') + b','.join(lines)
+            first = False
+        yield b']'
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified validators for models with an ``updated_at``
+    column. The validators come from one cheap query (``MAX(updated_at)``
+    and the row count for lists, the row's ``updated_at`` for details), so
+    a matching ``If-None-Match``/``If-Modified-Since`` gets a 304 before
+    anything is serialized.
+    """
+    conditional_field = 'updated_at'
+
+    def get_conditional_model(self):
+        if self.queryset is not None:
+            return self.queryset.model
+        return self.get_queryset().model
+
+    def has_conditional_field(self):
+        model = self.get_conditional_model()
+        return any(field.name == self.conditional_field for field in model._meta.concrete_fields)
+
+    def list(self, request, *args, **kwargs):
+        if not self.has_conditional_field():
+            return super().list(request, *args, **kwargs)
+        queryset = self.filter_queryset(self.get_queryset())
+        state = queryset.order_by().aggregate(last=Max(self.conditional_field), count=Count('pk'))
+        return self.conditional_response(state['last'], state['count'], super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        if not self.has_conditional_field():
+            return super().retrieve(request, *args, **kwargs)
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        queryset = self.filter_queryset(self.get_queryset()).filter(**filter_kwargs)
+        last = queryset.order_by().values_list(self.conditional_field, flat=True).first()
+        if last is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional_response(last, 1, super().retrieve, request, *args, **kwargs)
+
+    def conditional_response(self, last, count, view, request, *args, **kwargs):
+        etag = self.get_etag(last, count)
+        last_modified = int(last.timestamp()) if last else None
+
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = view(request, *args, **kwargs)
+        if 200 <= response.status_code < 300 or response.status_code == 304:
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            patch_vary_headers(response, ('Accept', 'Authorization'))
+        return response
+
+    def get_etag(self, last, count):
+        # The page depends on the query string (cursor, fields, filters),
+        # the negotiated format and the user, so they all go in the tag.
+        request = self.request
+        key = '|'.join([
+            self.get_conditional_model()._meta.label,
+            request.get_full_path(),
+            request.META.get('HTTP_ACCEPT', ''),
+            str(request.user.pk),
+            last.isoformat() if last else '',
+            str(count),
+        ])
+        return quote_etag(hashlib.md5(key.encode('utf-8'), usedforsecurity=False).hexdigest())
+
+
+class CachedResponseMixin:
+    """
+    Read-through response cache for read-mostly catalog viewsets.
+
+    ``list``/``retrieve`` data is cached per path, query string, Accept
+    header, language and user, together with the ETag/Last-Modified
+    validators, so a hit (and a 304 on a hit) needs no database query.
+    ``cache_models`` lists the models whose ``post_save``/``post_delete``
+    signals invalidate the entry.
+    """
+    cache_models = None
+
+    def get_cache_models(self):
+        if self.cache_models is not None:
+            return self.cache_models
+        return (self.queryset.model,)
+
+    def get_cache_prefix(self):
+        return self.basename
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view, request, *args, **kwargs):
+        prefix = self.get_cache_prefix()
+        key = response_cache.make_key(prefix, self.get_cache_models(), request)
+        entry = response_cache.get_cache().get(key)
+
+        if entry is not None:
+            response_cache.record(prefix, 'hits')
+            data, headers = entry
+            etag, last_modified = headers.get('ETag'), headers.get('Last-Modified')
+            response = get_conditional_response(
+                request, etag=etag,
+                last_modified=last_modified and parse_http_date_safe(last_modified),
+            )
+            if response is None:
+                response = Response(data)
+            for name, value in headers.items():
+                response[name] = value
+            response['X-Cache'] = 'HIT'
+            return response
+
+        response_cache.record(prefix, 'misses')
+        response = view(request, *args, **kwargs)
+        if isinstance(response, Response) and response.status_code == 200:
+            headers = {name: response[name] for name in ('ETag', 'Last-Modified', 'Vary') if response.has_header(name)}
+            response_cache.get_cache().set(key, (response.data, headers))
+        response['X-Cache'] = 'MISS'
+        return response
+
+
+class RollupMixin:
+    """
+    ``GET <list>/rollup/?granularity=day|week|month[&date_from=&date_to=]``
+    answers chart queries for the current user from the UserRollup table,
+    so a year of weekly averages costs 52 rows instead of 365.
+    """
+    rollup_source = None
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def rollup(self, request):
+        from .serializers import UserRollupSerializer
+
+        granularity = request.query_params.get('granularity', 'week')
+        if granularity not in rollups.GRANULARITIES:
+            return Response(
+                {'granularity': 'Must be one of: %s.' % ', '.join(rollups.GRANULARITIES)},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        queryset = UserRollup.objects.filter(
+            user=request.user, source=self.rollup_source, granularity=granularity,
+        )
+        bounds = {}
+        for name in ('date_from', 'date_to'):
+            value = request.query_params.get(name)
+            if not value:
+                continue
+            try:
+                bounds[name] = parse_date(value)
+            except ValueError:
+                bounds[name] = None
+            if bounds[name] is None:
+                return Response({name: 'Expected a YYYY-MM-DD date.'}, status=status.HTTP_400_BAD_REQUEST)
+        if 'date_from' in bounds:
+            # Include the bucket that contains date_from.
+            start, _end = rollups.bucket_range(bounds['date_from'], granularity)
+            queryset = queryset.filter(period_start__gte=start)
+        if 'date_to' in bounds:
+            queryset = queryset.filter(period_start__lte=bounds['date_to'])
+        serializer = UserRollupSerializer(queryset.order_by('period_start'), many=True)
+        return Response(serializer.data)
+
+
+class _PrefetchedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField resolving pks from objects fetched up front."""
+
+    def __init__(self, objects, **kwargs):
+        self.objects = objects
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = self.get_queryset().model._meta.pk.to_python(data)
+        except DjangoValidationError:
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in self.objects:
+            self.fail('does_not_exist', pk_value=data)
+        return self.objects[pk]
+
+
+class BulkUpsertMixin:
+    """
+    ``POST <list>/bulk/`` with a JSON array of rows.
+
+    Each row is validated by the same serializer instance. All valid rows
+    are written with one ``bulk_create(update_conflicts=True)`` keyed on
+    ``bulk_unique_fields``, in a single transaction. Invalid rows are
+    reported per index and do not stop the valid ones. Rows always belong
+    to the requesting user; ``bulk_owner_field`` is not read from the body.
+    """
+    bulk_unique_fields = ('user', 'date')
+    bulk_owner_field = 'user'
+    bulk_max_rows = 1000
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def bulk(self, request):
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response({'detail': 'Expected a list of rows.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > self.bulk_max_rows:
+            return Response({'detail': 'At most %d rows per request.' % self.bulk_max_rows},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer()
+        # Existing (user, date) rows are updated, not rejected.
+        serializer.validators = [
+            validator for validator in serializer.get_validators()
+            if not isinstance(validator, UniqueTogetherValidator)
+        ]
+        serializer.fields.pop(self.bulk_owner_field, None)
+        model = serializer.Meta.model
+        self.prefetch_related_fields(serializer, rows)
+
+        results, instances, seen = [], [], {}
+        for index, row in enumerate(rows):
+            try:
+                data = serializer.run_validation(row)
+            except ValidationError as exc:
+                results.append({'index': index, 'status': 'error', 'errors': exc.detail})
+                continue
+            instance = model(**data, **{self.bulk_owner_field: request.user})
+            key = tuple(getattr(instance, model._meta.get_field(name).attname) for name in self.bulk_unique_fields)
+            if key in seen:
+                results.append({'index': index, 'status': 'error', 'errors': {
+                    'non_field_errors': ['Same %s as row %d.' % (', '.join(self.bulk_unique_fields), seen[key])],
+                }})
+                continue
+            seen[key] = index
+            instances.append(instance)
+            results.append({'index': index, 'status': 'ok'})
+
+        if instances:
+            update_fields = [
+                field.name for field in model._meta.concrete_fields
+                if not field.primary_key and field.name not in self.bulk_unique_fields
+            ]
+            with transaction.atomic():
+                model.objects.bulk_create(
+                    instances,
+                    update_conflicts=True,
+                    unique_fields=self.bulk_unique_fields,
+                    update_fields=update_fields,
+                )
+                self.bulk_written(instances)
+
+        if not instances:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(instances) < len(rows):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_200_OK
+        return Response({'written': len(instances), 'results': results}, status=response_status)
+
+    def prefetch_related_fields(self, serializer, rows):
+        # One query per foreign key for the whole batch instead of one per row.
+        for name, field in list(serializer.fields.items()):
+            if field.read_only or type(field) is not serializers.PrimaryKeyRelatedField:
+                continue
+            queryset = field.get_queryset()
+            pks = set()
+            for row in rows:
+                if not isinstance(row, dict) or row.get(field.field_name) in (None, ''):
+                    continue
+                try:
+                    pks.add(queryset.model._meta.pk.to_python(row[field.field_name]))
+                except DjangoValidationError:
+                    pass
+            serializer.fields[name] = _PrefetchedPrimaryKeyRelatedField(queryset.in_bulk(pks), **field._kwargs)
+
+    def bulk_written(self, instances):
+        # bulk_create sends no post_save, so refresh the rollup buckets here.
+        source = rollups.source_for_model(type(instances[0]))
+        if source is None:
+            return
+        dates_by_user = {}
+        for instance in instances:
+            dates_by_user.setdefault(instance.user_id, set()).add(instance.date)
+        for user_id, dates in dates_by_user.items():
+            rollups.refresh_buckets(source, user_id, dates)
@@ -2,6 +2,7 @@ from django.db import models
 from django.contrib.auth.models import AbstractUser, Group, Permission
 from django.conf import settings
 from django.utils import timezone
+import uuid
 from phonenumber_field.modelfields import PhoneNumberField
 import stripe
 
@@ -30,7 +31,13 @@ class UserActivityLog(models.Model):
     """Foydalanuvchi faoliyati loglari."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     activity = models.CharField(max_length=50)
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # auto_now_add emas: buferlangan yozuvlar hodisa vaqtini saqlashi kerak
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'timestamp'], name='activitylog_user_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.activity} ({self.timestamp})"
@@ -55,17 +62,43 @@ class UserProfile(models.Model):
     weight = models.FloatField(null=True, blank=True)
     height = models.FloatField(null=True, blank=True)
     profile_image = models.ImageField(upload_to='profile_images/', null=True, blank=True)
+    # Kichraytirilgan nusxalar (api/images.py): {'source': ..., 'sizes': {...}}
+    profile_image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    stripe_customer_id = models.CharField(max_length=255, blank=True, default='')
 
     def __str__(self):
         return self.user.username
 
+def new_idempotency_key():
+    return uuid.uuid4().hex
+
 class Payment(models.Model):
     """To'lovlar modeli."""
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE)
-    stripe_charge_id = models.CharField(max_length=50)
+    stripe_charge_id = models.CharField(max_length=50, blank=True, default='')
     amount = models.DecimalField(max_digits=10, decimal_places=2)
     timestamp = models.DateTimeField(auto_now_add=True)
     success = models.BooleanField(default=False)
+    # Worker navbati: pending -> processing -> succeeded/failed
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    # Stripe'ga yuboriladi: qayta urinishda ikki marta yechib olinmaydi
+    idempotency_key = models.CharField(max_length=64, unique=True, default=new_idempotency_key, editable=False)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+    # Stripe bilan solishtirilgan vaqt (reconcile_payments)
+    reconciled_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return self.user_profile.user.username
@@ -85,6 +118,7 @@ class Workout(models.Model):
     level = models.CharField(max_length=50)
     duration = models.IntegerField()  # Mashg'ulot davomiyligi daqiqalarda
     video_url = models.URLField()
+    updated_at = models.DateTimeField(auto_now=True)  # ETag/Last-Modified uchun versiya
 
     def __str__(self):
         return self.name
@@ -129,41 +163,112 @@ class Insight(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='insight_user_date_idx'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
 class UserStatistic(models.Model):
     """Foydalanuvchi statistikasi."""
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    date = models.DateField(auto_now_add=True)
+    date = models.DateField(default=timezone.localdate)
     steps = models.IntegerField(default=0)
     calories_burned = models.FloatField(default=0)
     exercise_duration = models.IntegerField(default=0)  # Daqiqalarda
 
+    class Meta:
+        # Kuniga bitta yozuv: (user, date) bo'yicha upsert uchun ham kerak
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='userstatistic_user_date_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
+class UserRollup(models.Model):
+    """Foydalanuvchi ko'rsatkichlarining kunlik/haftalik/oylik yig'indilari."""
+    SOURCE_CHOICES = [
+        ("progress", "UserProgress"),
+        ("insight", "Insight"),
+        ("statistic", "UserStatistic"),
+    ]
+    GRANULARITY_CHOICES = [
+        ("day", "Day"),
+        ("week", "Week"),
+        ("month", "Month"),
+    ]
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    granularity = models.CharField(max_length=5, choices=GRANULARITY_CHOICES)
+    period_start = models.DateField()
+    count = models.IntegerField(default=0)
+    weight_sum = models.FloatField(default=0)
+    calories_burned_sum = models.FloatField(default=0)
+    duration_sum = models.IntegerField(default=0)  # Daqiqalarda
+    steps_sum = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'source', 'granularity', 'period_start'],
+                name='userrollup_bucket_uniq',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.source}/{self.granularity} {self.period_start}"
+
 class Post(models.Model):
     """Ijtimoiy tarmoqdagi postlar modeli."""
     title = models.CharField(max_length=100)
     content = models.TextField()
     image = models.ImageField(upload_to='images/', null=True, blank=True)
+    # Kichraytirilgan nusxalar (api/images.py)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     video = models.FileField(upload_to='videos/', null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return self.title
 
+class VideoUpload(models.Model):
+    """Post.video uchun bo'lib-bo'lib yuklash (api/uploads.py)."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='video_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    # Butun fayl uchun sha256 (ixtiyoriy), finalize paytida tekshiriladi
+    checksum = models.CharField(max_length=64, blank=True, default='')
+    offset = models.PositiveBigIntegerField(default=0)
+    # Bo'lak yozilayotgan payt; bir vaqtda ikki yozuvchi bo'lmasligi uchun
+    writing_since = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return '%s (%s/%s)' % (self.filename, self.offset, self.size)
+
 class Food(models.Model):
     """Ovqatlanish uchun retseptlar modeli."""
     name = models.CharField(max_length=100)        # Retsept nomi
     preparation_time = models.IntegerField()       # Tayyorlanish vaqti (daqiqalarda)
-    calories = models.FloatField()                 # Kaloriyalar miqdori
+    calories = models.FloatField(db_index=True)    # Kaloriyalar miqdori
+    protein = models.FloatField(default=0, db_index=True)  # Oqsil (grammda)
+    carbs = models.FloatField(default=0, db_index=True)    # Uglevodlar (grammda)
+    fat = models.FloatField(default=0, db_index=True)      # Yog'lar (grammda)
+    is_vegetarian = models.BooleanField(default=False, db_index=True)
     water_intake = models.FloatField()             # Suv iste'moli (litrda)
     description = models.TextField()               # Retsept haqida qisqacha tavsif
     ingredients = models.TextField()               # Ingredientlar ro'yxati
     instructions = models.TextField()              # Tayyorlanish bosqichlari
     video_url = models.URLField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)  # ETag/Last-Modified uchun versiya
 
     def __str__(self):
         return self.name
@@ -173,8 +278,9 @@ class Exercise(models.Model):
     name = models.CharField(max_length=100)
     description = models.TextField()
     duration = models.IntegerField(help_text="Duration in minutes")
-    calories_burned = models.IntegerField(help_text="Calories burned")
+    calories_burned = models.IntegerField(help_text="Calories burned", db_index=True)
     video_url = models.URLField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)  # ETag/Last-Modified uchun versiya
 
     def __str__(self):
         return self.name
@@ -196,6 +302,12 @@ class UserProgress(models.Model):
     calories_burned = models.IntegerField()
     workout_duration = models.IntegerField(help_text="Workout duration in minutes")
 
+    class Meta:
+        # Kuniga bitta yozuv: (user, date) bo'yicha upsert uchun ham kerak
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='userprogress_user_date_uniq'),
+        ]
+
     def __str__(self):
         return f"{self.user.username} - {self.date}"
 
@@ -203,7 +315,7 @@ class HealthTips(models.Model):
     """Salomatlik bo'yicha maslahatlar modeli."""
     title = models.CharField(max_length=200)
     content = models.TextField()
-    category = models.CharField(max_length=100, choices=(
+    category = models.CharField(max_length=100, db_index=True, choices=(
         ('nutrition', 'Nutrition'),
         ('exercise', 'Exercise'),
         ('mental_health', 'Mental Health'),
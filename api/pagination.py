@@ -0,0 +1,161 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from urllib import parse
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Keyset (cursor) pagination for the API list endpoints.
+
+    The ordering always ends in the primary key, so every row has a unique
+    position ``(key, ..., id)``. The cursor carries the position of the
+    last row sent, and the next page is read with a row-value seek::
+
+        WHERE key <= :key AND (key < :key OR (key = :key AND id < :id))
+        ORDER BY key DESC, id DESC LIMIT n
+
+    There is no ``COUNT(*)`` and no OFFSET, even across long runs of equal
+    keys (rows bulk-created with one timestamp, foods with ``protein=0``),
+    so latency stays flat no matter how deep the client pages. Ordering
+    keys must not be nullable. Cursors are opaque base64 tokens.
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    # Candidate ordering keys, most specific first. The first one present
+    # on the model wins; ``id`` is always added as a tie-breaker.
+    ordering_fields = ('created_at', 'timestamp', 'date')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering is None:
+            ordering = self.get_default_ordering(queryset.model)
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        ordering = tuple(ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not {key.lstrip('-') for key in ordering} & {'pk', 'id', pk_name}:
+            # The position has to be unique or the seek skips tied rows.
+            ordering += ('-id' if ordering[-1].startswith('-') else 'id',)
+        return ordering
+
+    def get_default_ordering(self, model):
+        field_names = {field.name for field in model._meta.concrete_fields}
+        for name in self.ordering_fields:
+            if name in field_names:
+                return ('-%s' % name, '-id')
+        return ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+
+        ordering = _reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if self.cursor is not None:
+            queryset = queryset.filter(self.seek_filter(queryset.model, ordering, self.cursor.position))
+
+        # One extra row tells whether there is a page beyond this one.
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, self.cursor is not None
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
+
+    def seek_filter(self, model, ordering, position):
+        """
+        Rows strictly after ``position`` in ``ordering``, spelled out as a
+        row-value comparison. The leading ``<=``/``>=`` on the first key
+        lets the database seek its index instead of scanning.
+        """
+        keys = []
+        for key, value in zip(ordering, position):
+            name = key.lstrip('-')
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            try:
+                value = field.to_python(value)
+            except DjangoValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            keys.append((field.attname, 'lt' if key.startswith('-') else 'gt', value))
+
+        after, tied = Q(), Q()
+        for attname, lookup, value in keys:
+            after |= tied & Q(**{'%s__%s' % (attname, lookup): value})
+            tied &= Q(**{attname: value})
+        attname, lookup, value = keys[0]
+        return Q(**{'%s__%se' % (attname, lookup): value}) & after
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        position = self.get_position(self.page[-1]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        position = self.get_position(self.page[0]) if self.page else self.cursor.position
+        return self.encode_cursor(Cursor(reverse=True, position=position))
+
+    def get_position(self, instance):
+        values = []
+        for key in self.ordering:
+            name = key.lstrip('-')
+            values.append(str(instance[name] if isinstance(instance, dict) else getattr(instance, name)))
+        return values
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            querystring = urlsafe_b64decode(encoded.encode('ascii')).decode()
+            tokens = parse.parse_qs(querystring, keep_blank_values=True)
+            reverse = bool(int(tokens.get('r', ['0'])[0]))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        position = tokens.get('p', [])
+        if len(position) != len(self.ordering):
+            # Malformed, or issued for a different ?ordering=.
+            raise NotFound(self.invalid_cursor_message)
+        return Cursor(reverse=reverse, position=position)
+
+    def encode_cursor(self, cursor):
+        tokens = {'p': cursor.position}
+        if cursor.reverse:
+            tokens['r'] = '1'
+        encoded = urlsafe_b64encode(parse.urlencode(tokens, doseq=True).encode()).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+
+class Cursor:
+    __slots__ = ('reverse', 'position')
+
+    def __init__(self, reverse, position):
+        self.reverse = reverse
+        self.position = position
+
+
+def _reverse_ordering(ordering):
+    return tuple(key[1:] if key.startswith('-') else '-' + key for key in ordering)
+
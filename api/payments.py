@@ -0,0 +1,273 @@
+"""
+Asynchronous payment processing.
+
+``POST /payments/`` only records a pending ``Payment`` and answers 202.
+The charge happens outside the request. After the transaction commits,
+the row is handed to an in-process worker pool (``RUN_IN_PROCESS``).
+``manage.py process_payments`` sweeps whatever that pool never got to:
+rows from before a restart, and rows stuck in ``processing`` past
+``STALE_AFTER_SECONDS``. Every attempt sends the payment's own
+idempotency key, so a retried charge is never taken twice.
+
+The processor sits behind ``PaymentGateway``. ``StripeGateway`` talks to
+Stripe. ``FakeGateway`` keeps charges in memory for tests and local runs.
+``manage.py reconcile_payments`` later checks settled payments against
+the processor through ``fetch_charges``.
+
+Settings (``PAYMENTS`` in settings.py): GATEWAY, CURRENCY, WORKERS,
+RUN_IN_PROCESS, MAX_ATTEMPTS, STALE_AFTER_SECONDS, FAKE_LATENCY_MS.
+"""
+import abc
+import datetime
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+import stripe
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Payment
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'GATEWAY': 'api.payments.StripeGateway',
+    'CURRENCY': 'usd',
+    'WORKERS': 4,
+    'RUN_IN_PROCESS': True,
+    'MAX_ATTEMPTS': 5,
+    'STALE_AFTER_SECONDS': 300,
+    'FAKE_LATENCY_MS': 0,
+}
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'PAYMENTS', {})}
+
+
+class PaymentDeclined(Exception):
+    """The processor refused the charge; retrying won't help."""
+
+
+class GatewayUnavailable(Exception):
+    """Network or processor trouble; the charge may be retried."""
+
+
+@dataclass
+class Charge:
+    id: str
+    paid: bool
+    failure_message: str = ''
+    status: str = 'succeeded'  # Stripe's charge status: succeeded, pending or failed
+
+
+class PaymentGateway(abc.ABC):
+    # A gateway missing a method fails when get_gateway() builds it, not mid-payment.
+
+    @abc.abstractmethod
+    def charge(self, amount_cents, currency, customer, description, idempotency_key):
+        """Charge ``customer`` and return a ``Charge``."""
+
+    @abc.abstractmethod
+    def fetch_charges(self, charge_ids, created_from, created_to):
+        """
+        Return ``{charge id: Charge}`` for the given ids, all created between
+        the two datetimes. Ids the processor doesn't know are left out.
+        """
+
+
+class StripeGateway(PaymentGateway):
+    page_size = 100  # Stripe's maximum list limit
+
+    def charge(self, amount_cents, currency, customer, description, idempotency_key):
+        try:
+            charge = stripe.Charge.create(
+                amount=amount_cents,
+                currency=currency,
+                customer=customer or None,
+                description=description,
+                idempotency_key=idempotency_key,
+            )
+        except (stripe.error.CardError, stripe.error.InvalidRequestError) as e:
+            raise PaymentDeclined(str(e)) from e
+        except stripe.error.StripeError as e:
+            raise GatewayUnavailable(str(e)) from e
+        return self._to_charge(charge)
+
+    def fetch_charges(self, charge_ids, created_from, created_to):
+        # One paginated list over the creation window instead of a GET per
+        # charge; ids not found there (clock skew, late retries) are fetched
+        # one by one.
+        wanted = set(charge_ids)
+        found = {}
+        params = {
+            'limit': self.page_size,
+            'created': {'gte': int(created_from.timestamp()), 'lte': int(created_to.timestamp())},
+        }
+        try:
+            while wanted - found.keys():
+                page = stripe.Charge.list(**params)
+                for charge in page.data:
+                    if charge.id in wanted:
+                        found[charge.id] = self._to_charge(charge)
+                if not page.has_more or not page.data:
+                    break
+                params['starting_after'] = page.data[-1].id
+            for charge_id in wanted - found.keys():
+                try:
+                    found[charge_id] = self._to_charge(stripe.Charge.retrieve(charge_id))
+                except stripe.error.InvalidRequestError:
+                    continue
+        except stripe.error.StripeError as e:
+            raise GatewayUnavailable(str(e)) from e
+        return found
+
+    def _to_charge(self, charge):
+        return Charge(id=charge.id, paid=charge.paid, failure_message=charge.failure_message or '',
+                      status=charge.status)
+
+
+class FakeGateway(PaymentGateway):
+    """
+    In-memory stand-in for Stripe with the same idempotency semantics:
+    repeating a key returns the original charge. Customers whose id
+    starts with ``cus_decline`` are declined, ``cus_unavailable`` raises
+    ``GatewayUnavailable``.
+    """
+
+    def __init__(self, latency_ms=0):
+        self.latency = latency_ms / 1000
+        self.charges = {}  # idempotency key -> Charge
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def charge(self, amount_cents, currency, customer, description, idempotency_key):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if customer.startswith('cus_unavailable'):
+                raise GatewayUnavailable('Simulated network error')
+            if idempotency_key in self.charges:
+                return self.charges[idempotency_key]
+            if customer.startswith('cus_decline'):
+                raise PaymentDeclined('Your card was declined.')
+            charge = Charge(id='ch_fake_%s' % uuid.uuid4().hex[:24], paid=True)
+            self.charges[idempotency_key] = charge
+            return charge
+
+    def fetch_charges(self, charge_ids, created_from, created_to):
+        with self._lock:
+            by_id = {charge.id: charge for charge in self.charges.values()}
+        return {charge_id: by_id[charge_id] for charge_id in charge_ids if charge_id in by_id}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                options = _options()
+                gateway_class = import_string(options['GATEWAY'])
+                if issubclass(gateway_class, FakeGateway):
+                    _gateway = gateway_class(latency_ms=options['FAKE_LATENCY_MS'])
+                else:
+                    _gateway = gateway_class()
+    return _gateway
+
+
+def claim(payment_id):
+    """Move a pending (or stale processing) payment to processing. True if this caller won it."""
+    stale = timezone.now() - datetime.timedelta(seconds=_options()['STALE_AFTER_SECONDS'])
+    return Payment.objects.filter(
+        Q(status=Payment.STATUS_PENDING) | Q(status=Payment.STATUS_PROCESSING, updated_at__lt=stale),
+        pk=payment_id,
+    ).update(status=Payment.STATUS_PROCESSING, attempts=F('attempts') + 1, updated_at=timezone.now()) == 1
+
+
+def process_payment(payment_id, gateway=None):
+    """Charge one payment. Returns its final status, or None if another worker has it."""
+    if not claim(payment_id):
+        return None
+    payment = Payment.objects.select_related('user_profile__user').get(pk=payment_id)
+    options = _options()
+    gateway = gateway or get_gateway()
+    try:
+        charge = gateway.charge(
+            amount_cents=int(payment.amount * 100),
+            currency=options['CURRENCY'],
+            customer=payment.user_profile.stripe_customer_id,
+            description='Charge for %s' % payment.user_profile.user.email,
+            idempotency_key=payment.idempotency_key,
+        )
+    except PaymentDeclined as e:
+        payment.status, payment.error = Payment.STATUS_FAILED, str(e)
+    except GatewayUnavailable as e:
+        # Back to the queue unless it has run out of attempts.
+        retry = payment.attempts < options['MAX_ATTEMPTS']
+        payment.status = Payment.STATUS_PENDING if retry else Payment.STATUS_FAILED
+        payment.error = str(e)
+    else:
+        payment.stripe_charge_id = charge.id
+        payment.status = Payment.STATUS_SUCCEEDED if charge.paid else Payment.STATUS_FAILED
+        payment.error = charge.failure_message
+    payment.success = payment.status == Payment.STATUS_SUCCEEDED
+    payment.save(update_fields=['stripe_charge_id', 'status', 'success', 'error', 'updated_at'])
+    return payment.status
+
+
+def due_payments():
+    """Ids of pending payments and of processing ones whose worker went away."""
+    stale = timezone.now() - datetime.timedelta(seconds=_options()['STALE_AFTER_SECONDS'])
+    return Payment.objects.filter(
+        Q(status=Payment.STATUS_PENDING) | Q(status=Payment.STATUS_PROCESSING, updated_at__lt=stale)
+    ).order_by('pk').values_list('pk', flat=True)
+
+
+class PaymentWorker:
+    def __init__(self, max_workers=4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='payment-worker')
+
+    def submit(self, payment_id):
+        return self._executor.submit(self._run, payment_id)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, payment_id):
+        try:
+            return process_payment(payment_id)
+        except Exception:
+            logger.exception('Payment %s failed to process', payment_id)
+        finally:
+            close_old_connections()
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    if _worker is None:
+        with _worker_lock:
+            if _worker is None:
+                _worker = PaymentWorker(max_workers=_options()['WORKERS'])
+    return _worker
+
+
+def enqueue(payment):
+    """Hand the payment to the in-process workers once the row is committed."""
+    if _options()['RUN_IN_PROCESS']:
+        transaction.on_commit(lambda: get_worker().submit(payment.pk))
@@ -0,0 +1,129 @@
+"""
+In-memory revocation check for blacklisted refresh tokens.
+
+simplejwt's blacklist app runs a ``BlacklistedToken`` query on every
+refresh. This module answers the same question from a per-process JTI set
+instead. The set is loaded from the table on first use, picks up this
+process's blacklists through a ``post_save`` signal, and picks up other
+workers' blacklists with an incremental ``id > last_seen`` query at most
+once per ``SYNC_INTERVAL`` seconds. Entries are kept in a min-heap by
+expiry and dropped once the token could no longer verify anyway, so
+memory stays bounded by the number of live revoked tokens.
+
+Rotation stays safe inside the sync window. Rotating blacklists the old
+token with ``get_or_create``, and a row that already exists means another
+worker rotated it first, so the refresh is rejected.
+
+Settings (``TOKEN_REVOCATION`` in settings.py): SYNC_INTERVAL.
+Expired rows are removed from the table by simplejwt's
+``flushexpiredtokens`` command.
+"""
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+DEFAULTS = {
+    'SYNC_INTERVAL': 5,
+}
+
+
+class RevocationStore:
+    def __init__(self, sync_interval=5):
+        self.sync_interval = sync_interval
+        self._expires = {}  # jti -> expiry (epoch seconds)
+        self._heap = []  # (expiry, jti), soonest first
+        self._last_id = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def is_revoked(self, jti):
+        if self._last_id is None or time.monotonic() - self._synced_at >= self.sync_interval:
+            self.sync()
+        with self._lock:
+            self._prune(time.time())
+            return jti in self._expires
+
+    def add(self, jti, expires_at):
+        expiry = expires_at.timestamp() if hasattr(expires_at, 'timestamp') else expires_at
+        if expiry <= time.time():
+            return
+        with self._lock:
+            if jti not in self._expires:
+                self._expires[jti] = expiry
+                heapq.heappush(self._heap, (expiry, jti))
+
+    def sync(self):
+        """Load the table on first use, then only rows added since the last sync."""
+        with self._sync_lock:
+            rows = BlacklistedToken.objects.order_by('id')
+            if self._last_id is None:
+                rows = rows.filter(token__expires_at__gt=timezone.now())
+                last_id = BlacklistedToken.objects.order_by('-id').values_list('id', flat=True).first() or 0
+            else:
+                rows = rows.filter(id__gt=self._last_id)
+                last_id = self._last_id
+            for row_id, jti, expires_at in rows.values_list('id', 'token__jti', 'token__expires_at').iterator():
+                self.add(jti, expires_at)
+                last_id = max(last_id, row_id)
+            self._last_id = last_id
+            self._synced_at = time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._expires.clear()
+            self._heap.clear()
+        self._last_id = None
+
+    def __len__(self):
+        return len(self._expires)
+
+    def _prune(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            _expiry, jti = heapq.heappop(self._heap)
+            self._expires.pop(jti, None)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                options = {**DEFAULTS, **getattr(settings, 'TOKEN_REVOCATION', {})}
+                _store = RevocationStore(sync_interval=options['SYNC_INTERVAL'])
+    return _store
+
+
+class RevocableRefreshToken(RefreshToken):
+    """RefreshToken whose blacklist check is answered by the in-memory store."""
+
+    def check_blacklist(self):
+        if get_store().is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def revoke(self):
+        """
+        Blacklist this token. Returns False if it was already blacklisted,
+        which on rotation means the token was replayed.
+        """
+        jti = self.payload[api_settings.JTI_CLAIM]
+        expires_at = datetime_from_epoch(self.payload['exp'])
+        token, _created = OutstandingToken.objects.get_or_create(
+            jti=jti, defaults={'token': str(self), 'expires_at': expires_at},
+        )
+        _blacklisted, created = BlacklistedToken.objects.get_or_create(token=token)
+        get_store().add(jti, expires_at)
+        return created
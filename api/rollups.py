@@ -0,0 +1,115 @@
+"""
+Materialized day/week/month rollups of the per-user time-series tables.
+
+A write to UserProgress, Insight or UserStatistic refreshes only the
+buckets containing the written date (one day, one week, one month). The
+buckets are re-aggregated from the raw rows in their ranges, short
+(user, date) index range scans. Charts then read O(buckets) rows from
+UserRollup instead of O(rows) raw rows.
+"""
+import datetime
+import operator
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Trunc
+
+from .models import Insight, UserProgress, UserRollup, UserStatistic
+
+# source -> (model, {rollup column: raw column})
+SOURCES = {
+    'progress': (UserProgress, {
+        'weight_sum': 'weight',
+        'calories_burned_sum': 'calories_burned',
+        'duration_sum': 'workout_duration',
+    }),
+    'insight': (Insight, {
+        'weight_sum': 'weight',
+        'calories_burned_sum': 'calories_burned',
+        'duration_sum': 'workout_duration',
+    }),
+    'statistic': (UserStatistic, {
+        'calories_burned_sum': 'calories_burned',
+        'duration_sum': 'exercise_duration',
+        'steps_sum': 'steps',
+    }),
+}
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+def source_for_model(model):
+    for source, (source_model, _columns) in SOURCES.items():
+        if source_model is model:
+            return source
+    return None
+
+
+def bucket_range(date, granularity):
+    """Return the ``[start, end)`` range of the bucket containing ``date``."""
+    if granularity == 'day':
+        return date, date + datetime.timedelta(days=1)
+    if granularity == 'week':
+        start = date - datetime.timedelta(days=date.weekday())
+        return start, start + datetime.timedelta(days=7)
+    if granularity == 'month':
+        start = date.replace(day=1)
+        if start.month == 12:
+            return start, start.replace(year=start.year + 1, month=1)
+        return start, start.replace(month=start.month + 1)
+    raise ValueError('Unknown granularity: %s' % granularity)
+
+
+def refresh_buckets(source, user_id, dates):
+    """
+    Recompute every bucket of ``source`` touched by ``dates`` for one user:
+    one grouped aggregate and one upsert per granularity, whatever the
+    number of dates.
+    """
+    model, columns = SOURCES[source]
+    dates = set(dates)
+    with transaction.atomic():
+        for granularity in GRANULARITIES:
+            ranges = {bucket_range(date, granularity) for date in dates}
+            in_buckets = reduce(operator.or_, (Q(date__gte=start, date__lt=end) for start, end in ranges))
+            totals = (
+                model.objects.filter(in_buckets, user_id=user_id)
+                .annotate(period_start=Trunc('date', granularity))
+                .values('period_start')
+                .annotate(count=Count('pk'), **{column: Sum(raw) for column, raw in columns.items()})
+                .order_by()
+            )
+            buckets = [
+                UserRollup(
+                    user_id=user_id, source=source, granularity=granularity,
+                    **{name: value or 0 for name, value in row.items()}
+                )
+                for row in totals
+            ]
+            if buckets:
+                UserRollup.objects.bulk_create(
+                    buckets,
+                    update_conflicts=True,
+                    unique_fields=['user', 'source', 'granularity', 'period_start'],
+                    update_fields=['count', 'updated_at'] + list(columns),
+                )
+            # Buckets whose last row was deleted or moved away.
+            empty = {start for start, _end in ranges} - {bucket.period_start for bucket in buckets}
+            if empty:
+                UserRollup.objects.filter(
+                    user_id=user_id, source=source, granularity=granularity, period_start__in=empty,
+                ).delete()
+
+
+def rebuild(source):
+    """Drop and recompute all rollups of ``source`` (backfill / repair)."""
+    model, _columns = SOURCES[source]
+    with transaction.atomic():
+        UserRollup.objects.filter(source=source).delete()
+        days = model.objects.values_list('user_id', 'date').distinct().order_by('user_id')
+        by_user = {}
+        for user_id, date in days.iterator():
+            by_user.setdefault(user_id, set()).add(date)
+        for user_id, dates in by_user.items():
+            refresh_buckets(source, user_id, dates)
@@ -1,10 +1,36 @@
+import re
+from decimal import Decimal
+
 from django.contrib.auth import authenticate
 from rest_framework import serializers
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer as BaseTokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from . import images, rollups
+from .mixins import SparseFieldsetSerializerMixin
 from .models import (UserProfile, ExternalAuth, Goal, UserGoal,
                      Workout, WorkoutLesson, Notification, Insight,
                      UserNotification, UserStatistic, Food, Payment,
                      Post, UserActivityLog, Exercise, MealPlan,
-                     UserProgress, HealthTips, User, SomeModel, PasswordResetRequest)
+                     UserProgress, HealthTips, User, SomeModel, PasswordResetRequest,
+                     UserRollup, VideoUpload)
+from .revocation import RevocableRefreshToken
+
+
+# {'original': url, 'thumb': url, ...} for an image field (api/images.py)
+class ImageVariantsField(serializers.ReadOnlyField):
+    def __init__(self, source_name, **kwargs):
+        self.source_name = source_name
+        super().__init__(source='*', **kwargs)
+
+    @property
+    def sparse_columns(self):
+        # source='*' maps to no column; SparseFieldsetViewSetMixin reads these instead.
+        _model, image_field, variants_field = images.SOURCES[self.source_name]
+        return (image_field, variants_field)
+
+    def to_representation(self, instance):
+        return images.variant_urls(instance, self.source_name, self.context.get('request'))
 
 
 class PasswordResetSerializer(serializers.Serializer):
@@ -12,26 +38,31 @@ class PasswordResetSerializer(serializers.Serializer):
     new_password = serializers.CharField()
 
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'  # yoki kerakli maydonlar ro'yxatini ko'rsating
 
 
+# PaymentCreate Serializer
+class PaymentCreateSerializer(serializers.Serializer):
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0.01'))
+
+
 # UserActivityLog Serializer
-class UserActivityLogSerializer(serializers.ModelSerializer):
+class UserActivityLogSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserActivityLog
         fields = '__all__'
 
 # PasswordResetRequest Serializer
-class PasswordResetRequestSerializer(serializers.ModelSerializer):
+class PasswordResetRequestSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = PasswordResetRequest
         fields = '__all__'
 
 # SomeModel Serializer
-class SomeModelSerializer(serializers.ModelSerializer):
+class SomeModelSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = SomeModel
         fields = '__all__'
@@ -49,7 +80,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
 
 # User Serializer
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = '__all__'  # kerakli maydonlar ro'yxatini ko'rsating
@@ -65,14 +96,37 @@ class UserLoginSerializer(serializers.Serializer):
             return user
         raise serializers.ValidationError("Invalid credentials")
 
+# TokenRefresh Serializer
+class TokenRefreshSerializer(BaseTokenRefreshSerializer):
+    token_class = RevocableRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        data = {'access': str(refresh.access_token)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            # Already blacklisted means another worker rotated it first.
+            if jwt_settings.BLACKLIST_AFTER_ROTATION and not refresh.revoke():
+                raise TokenError("Token is blacklisted")
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
+# Logout Serializer
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
 # ChangePassword Serializer
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True)
     new_password = serializers.CharField(required=True)
 
 # UserProfile Serializer
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     user = UserSerializer()
+    profile_image_variants = ImageVariantsField('profile')
 
     class Meta:
         model = UserProfile
@@ -85,91 +139,129 @@ class UserProfileSerializer(serializers.ModelSerializer):
         return user_profile
 
 # ExternalAuth Serializer
-class ExternalAuthSerializer(serializers.ModelSerializer):
+class ExternalAuthSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = ExternalAuth
         fields = '__all__'
 
 # Goal Serializer
-class GoalSerializer(serializers.ModelSerializer):
+class GoalSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Goal
         fields = '__all__'
 
 # UserGoal Serializer
-class UserGoalSerializer(serializers.ModelSerializer):
+class UserGoalSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserGoal
         fields = '__all__'
 
 # Workout Serializer
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Workout
         fields = '__all__'
 
 # WorkoutLesson Serializer
-class WorkoutLessonSerializer(serializers.ModelSerializer):
+class WorkoutLessonSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = WorkoutLesson
         fields = '__all__'
 
 # Notification Serializer
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ['id', 'title', 'text', 'type', 'created_at', 'updated_at']
 
 # Insight Serializer
-class InsightSerializer(serializers.ModelSerializer):
+class InsightSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Insight
         fields = '__all__'
 
 # UserNotification Serializer
-class UserNotificationSerializer(serializers.ModelSerializer):
+class UserNotificationSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserNotification
         fields = ['id', 'user', 'notification']
 
 # Post Serializer
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    image_variants = ImageVariantsField('post')
+
     class Meta:
         model = Post
         fields = '__all__'
 
+# VideoUpload Serializer
+class VideoUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = VideoUpload
+        fields = ['id', 'post', 'filename', 'size', 'checksum', 'offset', 'created_at', 'completed_at']
+        read_only_fields = ['offset', 'created_at', 'completed_at']
+
+    def validate_checksum(self, value):
+        if value and not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError('Expected a hex sha256 digest.')
+        return value
+
+    def validate_size(self, value):
+        if value < 1:
+            raise serializers.ValidationError('Size must be positive.')
+        return value
+
 # UserStatistic Serializer
-class UserStatisticSerializer(serializers.ModelSerializer):
+class UserStatisticSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
+    # Always the requesting user; also keeps the (user, date) unique check.
+    user = serializers.PrimaryKeyRelatedField(read_only=True, default=serializers.CurrentUserDefault())
+
     class Meta:
         model = UserStatistic
         fields = ['id', 'user', 'date', 'steps', 'calories_burned', 'exercise_duration']
 
 # Food Serializer
-class FoodSerializer(serializers.ModelSerializer):
+class FoodSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Food
         fields = '__all__'
 
 # Exercise Serializer
-class ExerciseSerializer(serializers.ModelSerializer):
+class ExerciseSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Exercise
         fields = '__all__'
 
 # MealPlan Serializer
-class MealPlanSerializer(serializers.ModelSerializer):
+class MealPlanSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = MealPlan
         fields = '__all__'
 
 # UserProgress Serializer
-class UserProgressSerializer(serializers.ModelSerializer):
+class UserProgressSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = UserProgress
         fields = '__all__'
 
 # HealthTips Serializer
-class HealthTipsSerializer(serializers.ModelSerializer):
+class HealthTipsSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = HealthTips
         fields = '__all__'
+
+# UserRollup Serializer
+class UserRollupSerializer(serializers.ModelSerializer):
+    averages = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserRollup
+        fields = ['period_start', 'granularity', 'count', 'weight_sum', 'calories_burned_sum',
+                  'duration_sum', 'steps_sum', 'averages']
+
+    def get_averages(self, obj):
+        if not obj.count:
+            return {}
+        # Only the columns the source has: statistics have no weight, progress no steps.
+        _model, columns = rollups.SOURCES[obj.source]
+        return {column[:-len('_sum')]: getattr(obj, column) / obj.count for column in columns}
@@ -0,0 +1,82 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from . import cache, images, revocation, rollups
+from .authentication import invalidate_user
+from .sqlite import configure_connection
+from .models import Exercise, Food, Goal, HealthTips, MealPlan, User, Workout, WorkoutLesson
+
+# Catalog models served through CachedResponseMixin.
+CACHED_MODELS = (Food, Exercise, HealthTips, Workout, WorkoutLesson, Goal, MealPlan)
+
+
+def invalidate_response_cache(sender, **kwargs):
+    cache.invalidate_model(sender)
+
+
+for model in CACHED_MODELS:
+    post_save.connect(invalidate_response_cache, sender=model, dispatch_uid='api-cache-save-%s' % model._meta.label_lower)
+    post_delete.connect(invalidate_response_cache, sender=model, dispatch_uid='api-cache-delete-%s' % model._meta.label_lower)
+
+
+def _row_key(instance):
+    return instance.user_id, instance._meta.get_field('date').to_python(instance.date)
+
+
+def remember_rollup_bucket(sender, instance, raw=False, **kwargs):
+    # An update may move the row to another day (or user); keep the old
+    # bucket so it gets refreshed as well.
+    instance._rollup_previous = None
+    if raw or instance.pk is None:
+        return
+    instance._rollup_previous = sender.objects.filter(pk=instance.pk).values_list('user_id', 'date').first()
+
+
+def refresh_rollup_buckets(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    source = rollups.source_for_model(sender)
+    keys = {_row_key(instance)}
+    previous = getattr(instance, '_rollup_previous', None)
+    if previous:
+        keys.add(previous)
+    for user_id, date in keys:
+        rollups.refresh_buckets(source, user_id, [date])
+
+
+for source, (model, _columns) in rollups.SOURCES.items():
+    pre_save.connect(remember_rollup_bucket, sender=model, dispatch_uid='api-rollup-pre-save-%s' % source)
+    post_save.connect(refresh_rollup_buckets, sender=model, dispatch_uid='api-rollup-save-%s' % source)
+    post_delete.connect(refresh_rollup_buckets, sender=model, dispatch_uid='api-rollup-delete-%s' % source)
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    # Saves cover password changes (set_password + save) and deactivation.
+    invalidate_user(instance.pk)
+
+
+post_save.connect(invalidate_cached_user, sender=User, dispatch_uid='api-auth-user-save')
+post_delete.connect(invalidate_cached_user, sender=User, dispatch_uid='api-auth-user-delete')
+
+
+def remember_revoked_token(sender, instance, created=False, raw=False, **kwargs):
+    # Blacklisted through admin or simplejwt's own views: visible to this
+    # worker's revocation store right away instead of at the next sync.
+    if created and not raw:
+        revocation.get_store().add(instance.token.jti, instance.token.expires_at)
+
+
+post_save.connect(remember_revoked_token, sender=BlacklistedToken, dispatch_uid='api-revocation-blacklist')
+
+
+def derive_images(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.enqueue(instance)
+
+
+for source, (model, _image, _variants) in images.SOURCES.items():
+    post_save.connect(derive_images, sender=model, dispatch_uid='api-images-save-%s' % source)
+
+
+connection_created.connect(configure_connection, dispatch_uid='api-sqlite-pragmas')
@@ -0,0 +1,24 @@
+"""
+Per-connection SQLite tuning.
+
+Django 5.0 has no ``init_command`` for SQLite, so ``configure_connection``
+is hooked to ``connection_created`` and runs the ``SQLITE_PRAGMAS`` from
+settings once per new connection. With persistent connections
+(``CONN_MAX_AGE``), that means once per worker, not once per request.
+"""
+from django.conf import settings
+
+
+def apply_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+    finally:
+        cursor.close()
+
+
+def configure_connection(sender, connection, **kwargs):
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', None)
+    if connection.vendor == 'sqlite' and pragmas:
+        apply_pragmas(connection.connection, pragmas)
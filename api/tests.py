@@ -1,3 +1,1217 @@
-from django.test import TestCase
+import base64
+import datetime
+import hashlib
+import io
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import stripe
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import DatabaseError, connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .models import (
+    User, UserProfile, ExternalAuth, UserGoal, Goal, Workout, WorkoutLesson,
+    Notification, UserNotification, Insight, UserProgress, UserActivityLog,
+    SomeModel, Payment, Post, VideoUpload, Food, UserRollup, UserStatistic, Exercise,
+)
+from . import authentication, checks, db_routing, images, payments, revocation, rollups, uploads
+from .activity import ActivityBuffer
+from .db_routing import copy_sqlite
+from .fake_stripe import FakeStripeServer
+from .serializers import PostSerializer, SomeModelSerializer
+from .views import ExerciseViewSet, UserProgressViewSet, UserStatisticViewSet
+
+
+class ListQueryCountTests(TestCase):
+    """List endpoints must run a constant number of queries per page."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner', email='owner@example.com')
+        self.client.force_authenticate(self.user)
+        self.goal = Goal.objects.create(name='Goal')
+        self.workout = Workout.objects.create(
+            goal=self.goal, name='W', description='d', level='easy',
+            duration=10, video_url='http://example.com/w',
+        )
+        self.notification = Notification.objects.create(title='N', text='t', type='info')
+
+    def make_user(self, i):
+        return User.objects.create(username='user%d' % i, email='user%d@example.com' % i)
+
+    def make_rows(self, url, i):
+        user = self.make_user(i)
+        day = datetime.date(2024, 1, 1) + datetime.timedelta(days=i)
+        if url == '/api/v1/users/':
+            return
+        if url == '/api/v1/user-profiles/':
+            UserProfile.objects.create(user=user, first_name='a', last_name='b', gender='m')
+        elif url == '/api/v1/external-auth/':
+            ExternalAuth.objects.create(user=user, another_auth='google', another_auth_id=str(i))
+        elif url == '/api/v1/user-goals/':
+            UserGoal.objects.create(user=user, goal='g', description='d')
+        elif url == '/api/v1/workouts/':
+            Workout.objects.create(goal=self.goal, name='W', description='d', level='easy',
+                                   duration=10, video_url='http://example.com/w')
+        elif url == '/api/v1/workout-lessons/':
+            WorkoutLesson.objects.create(workout=self.workout, name='L', description='d',
+                                         duration=5, video_url='http://example.com/l')
+        elif url == '/api/v1/user-notifications/':
+            UserNotification.objects.create(user=user, notification=self.notification)
+        elif url == '/api/v1/insights/':
+            Insight.objects.create(user=user, date=day, weight=70, workout_duration=30, calories_burned=200)
+        elif url == '/api/v1/user-progress/':
+            UserProgress.objects.create(user=user, date=day, weight=70, calories_burned=200, workout_duration=30)
+        elif url == '/api/v1/user-activity-logs/':
+            UserActivityLog.objects.create(user=self.user, activity='login')
+        elif url == '/api/v1/some-models/':
+            SomeModel.objects.create(user=user, title='t', description='d')
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_list_endpoints_run_constant_queries(self):
+        urls = [
+            '/api/v1/users/',
+            '/api/v1/user-profiles/',
+            '/api/v1/external-auth/',
+            '/api/v1/user-goals/',
+            '/api/v1/workouts/',
+            '/api/v1/workout-lessons/',
+            '/api/v1/user-notifications/',
+            '/api/v1/insights/',
+            '/api/v1/user-progress/',
+            '/api/v1/user-activity-logs/',
+            '/api/v1/some-models/',
+        ]
+        counter = 0
+        for url in urls:
+            with self.subTest(url=url):
+                for _ in range(2):
+                    counter += 1
+                    self.make_rows(url, counter)
+                few = self.count_queries(url)
+                for _ in range(8):
+                    counter += 1
+                    self.make_rows(url, counter)
+                many = self.count_queries(url)
+                self.assertEqual(few, many)
+
+
+class KeysetPaginationTests(TestCase):
+    """Pages seek on (key, id), so runs of equal keys are neither skipped nor offset-scanned."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner', email='owner@example.com')
+        self.client.force_authenticate(self.user)
+        # 25 rows share one timestamp, as bulk-created rows do.
+        moment = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        UserActivityLog.objects.bulk_create(
+            [UserActivityLog(user=self.user, activity='tied', timestamp=moment) for _ in range(25)]
+            + [UserActivityLog(user=self.user, activity='later', timestamp=moment + datetime.timedelta(seconds=i))
+               for i in range(1, 6)])
+        self.expected = list(UserActivityLog.objects.order_by('-timestamp', '-id').values_list('pk', flat=True))
+
+    def test_pages_cover_ties_once_without_offset(self):
+        seen, pages, url = [], [], '/api/v1/user-activity-logs/?page_size=7'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse([q for q in queries if 'OFFSET' in q['sql'].upper()])
+            seen += [row['id'] for row in response.data['results']]
+            pages.append(response.data)
+            url = response.data['next']
+        self.assertEqual(seen, self.expected)
+
+        # And back again from the last page.
+        previous, url = [], pages[-1]['previous']
+        while url:
+            response = self.client.get(url)
+            previous = [row['id'] for row in response.data['results']] + previous
+            url = response.data['previous']
+        self.assertEqual(previous + [row['id'] for row in pages[-1]['results']], self.expected)
+
+    def test_bad_cursor_is_not_found(self):
+        response = self.client.get('/api/v1/user-activity-logs/?cursor=bm9wZQ==')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CACHES={**settings.CACHES, 'api_responses': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sparse-fieldset-tests',
+}})
+class SparseFieldsetTests(TestCase):
+    """?fields= reads only the columns it needs, plus the keyset ordering keys."""
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def add_exercises(self, count):
+        start = Exercise.objects.count()
+        for i in range(start, start + count):
+            Exercise.objects.create(name='E%d' % i, description='long text', duration=10, calories_burned=100 + i // 2)
+
+    def get(self, params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/exercises/', params)
+        self.assertEqual(response.status_code, 200)
+        return response, [query['sql'] for query in queries]
+
+    def test_custom_ordering_keys_are_selected(self):
+        params = {'fields': 'name', 'min_calories': 0, 'page_size': 3}
+        self.add_exercises(2)
+        _response, few = self.get(params)
+        self.add_exercises(4)
+        response, many = self.get(params)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual([row['name'] for row in response.data['results']], ['E5', 'E4', 'E3'])
+        page = next(sql for sql in many if 'LIMIT' in sql)
+        self.assertIn('"calories_burned"', page)
+        self.assertNotIn('"description"', page)
+
+        # On its own, one get_queryset() call already selects the ordering keys.
+        request = Request(RequestFactory().get('/api/v1/exercises/', params))
+        view = ExerciseViewSet(action='list', format_kwarg=None, request=request, kwargs={})
+        columns, deferred = view.get_queryset().query.deferred_loading
+        self.assertFalse(deferred)
+        self.assertIn('calories_burned', columns)
+
+        # The next page seeks from the last row's calories without extra queries.
+        with self.assertNumQueries(len(many)):
+            response = self.client.get(response.data['next'])
+        self.assertEqual([row['name'] for row in response.data['results']], ['E2', 'E1', 'E0'])
+
+
+class StreamingListTests(TestCase):
+    """?stream=1 and Accept: application/x-ndjson stream the whole list."""
+
+    url = '/api/v1/user-statistics/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='exporter', email='exporter@example.com')
+        self.client.force_authenticate(self.user)
+
+    def add_days(self, count):
+        start = UserStatistic.objects.count()
+        UserStatistic.objects.bulk_create(
+            UserStatistic(user=self.user, date=datetime.date(2024, 1, 1) + datetime.timedelta(days=start + i), steps=i)
+            for i in range(count)
+        )
+
+    def stream(self, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, **kwargs)
+            self.assertIsInstance(response, StreamingHttpResponse)
+            body = b''.join(response.streaming_content)
+        return response, body, len(queries)
+
+    def test_json_array(self):
+        self.add_days(5)
+        with mock.patch.object(UserStatisticViewSet, 'stream_chunk_size', 2):
+            response, body, _queries = self.stream(data={'stream': '1'})
+        self.assertEqual(response['Content-Type'], 'application/json')
+        rows = json.loads(body)
+        self.assertEqual([row['steps'] for row in rows], [0, 1, 2, 3, 4])
+
+        UserStatistic.objects.all().delete()
+        self.assertEqual(json.loads(self.stream(data={'stream': '1'})[1]), [])
+
+    def test_ndjson(self):
+        self.add_days(3)
+        response, body, _queries = self.stream(headers={'Accept': 'application/x-ndjson'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line)['steps'] for line in lines], [0, 1, 2])
+
+    def test_queries_do_not_grow_with_rows(self):
+        with mock.patch.object(UserStatisticViewSet, 'stream_chunk_size', 2):
+            self.add_days(3)
+            few = self.stream(data={'stream': '1'})[2]
+            self.add_days(20)
+            many = self.stream(data={'stream': '1'})[2]
+        self.assertEqual(few, many)
+
+
+class ConditionalGetTests(TestCase):
+    """Lists and details carry validators and answer 304 without serializing."""
+
+    url = '/api/v1/some-models/'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='validator', email='validator@example.com')
+        self.client.force_authenticate(self.user)
+        self.row = SomeModel.objects.create(user=self.user, title='t', description='d')
+
+    def test_list_has_validators(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertTrue(response.has_header('Last-Modified'))
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_matching_validators_skip_serialization(self):
+        first = self.client.get(self.url)
+        for headers in ({'If-None-Match': first['ETag']}, {'If-Modified-Since': first['Last-Modified']}):
+            with mock.patch.object(SomeModelSerializer, 'to_representation') as to_representation, \
+                    self.assertNumQueries(1):
+                response = self.client.get(self.url, headers=headers)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], first['ETag'])
+            to_representation.assert_not_called()
+
+        detail = self.client.get('%s%d/' % (self.url, self.row.pk))
+        again = self.client.get('%s%d/' % (self.url, self.row.pk), headers={'If-None-Match': detail['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    def test_tag_changes_with_the_rows(self):
+        def etag():
+            return self.client.get(self.url)['ETag']
+
+        tags = [etag()]
+        other = SomeModel.objects.create(user=self.user, title='t2', description='d')
+        tags.append(etag())
+        self.row.title = 'renamed'
+        self.row.save()
+        tags.append(etag())
+        other.delete()
+        tags.append(etag())
+        self.assertEqual(len(set(tags)), 4)
+        stale = self.client.get(self.url, headers={'If-None-Match': tags[0]})
+        self.assertEqual(stale.status_code, 200)
+
+
+@override_settings(CACHES={**settings.CACHES, 'api_responses': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'response-cache-tests',
+}})
+class CachedResponseTests(TestCase):
+    """Catalog responses come from the cache until the model changes."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.goal = Goal.objects.create(name='Goal')
+
+    def get(self, url='/api/v1/goals/', **kwargs):
+        response = self.client.get(url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_miss_then_hit(self):
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        with self.assertNumQueries(0):
+            response = self.get()
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual([row['name'] for row in response.data['results']], ['Goal'])
+
+    def test_write_invalidates(self):
+        self.get()
+        Goal.objects.create(name='Another')
+        response = self.get()
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(len(response.data['results']), 2)
+        self.goal.delete()
+        self.assertEqual(len(self.get().data['results']), 1)
+
+    def test_key_covers_query_accept_and_user(self):
+        self.get()
+        self.assertEqual(self.get(data={'page_size': 1})['X-Cache'], 'MISS')
+        self.assertEqual(self.get(headers={'Accept': 'application/json; indent=2'})['X-Cache'], 'MISS')
+        self.client.force_authenticate(User.objects.create(username='member', email='member@example.com'))
+        self.assertEqual(self.get()['X-Cache'], 'MISS')
+        self.assertEqual(self.get()['X-Cache'], 'HIT')
+
+    def test_per_process_cache_is_refused(self):
+        self.assertEqual([e.id for e in checks.check_response_cache(None)], ['api.E003'])
+        with override_settings(DEBUG=True):
+            self.assertEqual(checks.check_response_cache(None), [])
+        with override_settings(CACHES={**settings.CACHES, 'api_responses': settings.CACHES['shared']}):
+            self.assertEqual(checks.check_response_cache(None), [])
+
+
+class RollupTests(TestCase):
+    """Every write refreshes the day, week and month buckets it touches."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='charted', email='charted@example.com')
+
+    def progress(self, date, weight=70, user=None):
+        return UserProgress.objects.create(user=user or self.user, date=date, weight=weight,
+                                           calories_burned=100, workout_duration=10)
+
+    def buckets(self, granularity):
+        return {
+            rollup.period_start: (rollup.count, rollup.weight_sum)
+            for rollup in UserRollup.objects.filter(user=self.user, source='progress', granularity=granularity)
+        }
+
+    def test_insert(self):
+        self.progress(datetime.date(2024, 1, 3), weight=70)
+        self.progress(datetime.date(2024, 1, 4), weight=72)
+        self.assertEqual(self.buckets('day'), {datetime.date(2024, 1, 3): (1, 70), datetime.date(2024, 1, 4): (1, 72)})
+        self.assertEqual(self.buckets('week'), {datetime.date(2024, 1, 1): (2, 142)})
+        self.assertEqual(self.buckets('month'), {datetime.date(2024, 1, 1): (2, 142)})
+
+    def test_update_moving_a_row_recomputes_both_buckets(self):
+        row = self.progress(datetime.date(2024, 1, 3))
+        self.progress(datetime.date(2024, 1, 4))
+        row.date = datetime.date(2024, 2, 14)
+        row.save()
+        self.assertEqual(self.buckets('day'), {datetime.date(2024, 1, 4): (1, 70), datetime.date(2024, 2, 14): (1, 70)})
+        self.assertEqual(self.buckets('week'), {datetime.date(2024, 1, 1): (1, 70), datetime.date(2024, 2, 12): (1, 70)})
+        self.assertEqual(self.buckets('month'), {datetime.date(2024, 1, 1): (1, 70), datetime.date(2024, 2, 1): (1, 70)})
+
+    def test_delete(self):
+        row = self.progress(datetime.date(2024, 1, 3))
+        self.progress(datetime.date(2024, 1, 4), weight=72)
+        row.delete()
+        self.assertEqual(self.buckets('week'), {datetime.date(2024, 1, 1): (1, 72)})
+        UserProgress.objects.get().delete()
+        self.assertEqual(self.buckets('week'), {})
+        self.assertEqual(self.buckets('month'), {})
+
+    def test_week_and_month_boundaries(self):
+        # Sunday/Monday split the week; Wednesday 31st/Thursday 1st split the month only.
+        for day in (datetime.date(2024, 1, 7), datetime.date(2024, 1, 8),
+                    datetime.date(2024, 1, 31), datetime.date(2024, 2, 1)):
+            self.progress(day)
+        self.assertEqual(self.buckets('week'), {
+            datetime.date(2024, 1, 1): (1, 70),
+            datetime.date(2024, 1, 8): (1, 70),
+            datetime.date(2024, 1, 29): (2, 140),
+        })
+        self.assertEqual(self.buckets('month'), {datetime.date(2024, 1, 1): (3, 210), datetime.date(2024, 2, 1): (1, 70)})
+        self.assertEqual(rollups.bucket_range(datetime.date(2024, 12, 31), 'month'),
+                         (datetime.date(2024, 12, 1), datetime.date(2025, 1, 1)))
+
+    def test_endpoint_returns_the_callers_buckets(self):
+        other = User.objects.create(username='neighbour', email='neighbour@example.com')
+        self.progress(datetime.date(2024, 1, 3), weight=70)
+        self.progress(datetime.date(2024, 1, 3), weight=90, user=other)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/user-progress/rollup/', {'granularity': 'month'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([(row['period_start'], row['weight_sum']) for row in response.data], [('2024-01-01', 70)])
+        self.assertEqual(set(response.data[0]['averages']), {'weight', 'calories_burned', 'duration'})
+        self.assertEqual(client.get('/api/v1/user-progress/rollup/', {'granularity': 'year'}).status_code, 400)
+
+        UserStatistic.objects.create(user=self.user, date=datetime.date(2024, 1, 3), steps=4000)
+        response = client.get('/api/v1/user-statistics/rollup/', {'granularity': 'day'})
+        self.assertEqual(response.data[0]['averages'], {'calories_burned': 0, 'duration': 0, 'steps': 4000})
+
+
+class NutritionFilterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='eater', email='eater@example.com'))
+        for i, protein in enumerate([5, 25, 40]):
+            Food.objects.create(name='f%d' % i, preparation_time=10, calories=100 * (i + 1), protein=protein,
+                                water_intake=0, description='d', ingredients='i', instructions='i', video_url='')
+
+    def test_range_filters_and_ordering(self):
+        response = self.client.get('/api/v1/foods/nutrition/?protein__gte=20&ordering=-protein')
+        self.assertEqual([row['protein'] for row in response.data['results']], [40, 25])
+
+    def test_rejects_non_finite_numbers_and_unindexed_keys(self):
+        for query in ('protein__gte=nan', 'calories__between=0,inf', 'ordering=preparation_time'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get('/api/v1/foods/nutrition/?' + query).status_code, 400)
+
+
+class BulkUpsertTests(TestCase):
+    """POST <list>/bulk/ upserts the caller's own rows by (user, date)."""
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='logger', email='logger@example.com')
+        self.other = User.objects.create(username='bystander', email='bystander@example.com')
+        self.client.force_authenticate(self.user)
+
+    def row(self, day, **values):
+        return {'date': '2024-01-%02d' % day, 'weight': 70, 'calories_burned': 200, 'workout_duration': 30, **values}
+
+    def bulk(self, rows, url='/api/v1/user-progress/bulk/'):
+        return self.client.post(url, rows, format='json')
+
+    def test_all_rows_valid(self):
+        response = self.bulk([self.row(1), self.row(2, user=self.other.pk)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['written'], 2)
+        # The body can't pick the owner.
+        self.assertEqual(UserProgress.objects.filter(user=self.user).count(), 2)
+        self.assertFalse(UserProgress.objects.filter(user=self.other).exists())
+
+    def test_mixed_rows_report_per_index(self):
+        response = self.bulk([self.row(1), self.row(2, weight='heavy'), self.row(3)])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([r['status'] for r in response.data['results']], ['ok', 'error', 'ok'])
+        self.assertIn('weight', response.data['results'][1]['errors'])
+        self.assertEqual(UserProgress.objects.count(), 2)
+
+    def test_duplicate_day_in_one_payload(self):
+        response = self.bulk([self.row(1), self.row(1, weight=71)])
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['results'][1]['status'], 'error')
+        self.assertEqual(UserProgress.objects.get().weight, 70)
+
+    def test_existing_row_is_updated(self):
+        UserProgress.objects.create(user=self.user, date=datetime.date(2024, 1, 1), weight=80,
+                                    calories_burned=0, workout_duration=0)
+        UserProgress.objects.create(user=self.other, date=datetime.date(2024, 1, 1), weight=90,
+                                    calories_burned=0, workout_duration=0)
+        self.assertEqual(self.bulk([self.row(1)]).status_code, 200)
+        self.assertEqual(UserProgress.objects.get(user=self.user).weight, 70)
+        self.assertEqual(UserProgress.objects.get(user=self.other).weight, 90)
+
+    def test_row_limit(self):
+        with mock.patch.object(UserProgressViewSet, 'bulk_max_rows', 2):
+            response = self.bulk([self.row(1), self.row(2), self.row(3)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserProgress.objects.exists())
+
+    def test_written_rows_refresh_rollups(self):
+        self.bulk([self.row(1), self.row(2, weight=72)])
+        week = UserRollup.objects.get(user=self.user, source='progress', granularity='week')
+        self.assertEqual((week.count, week.weight_sum), (2, 142))
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.bulk([self.row(1)], '/api/v1/user-statistics/bulk/').status_code, 401)
+        self.assertEqual(self.client.get('/api/v1/user-statistics/').status_code, 401)
+
+    def test_statistics_are_scoped_to_the_caller(self):
+        UserStatistic.objects.create(user=self.other, date=datetime.date(2024, 1, 1), steps=100)
+        response = self.client.post('/api/v1/user-statistics/', {
+            'user': self.other.pk, 'date': '2024-01-02', 'steps': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['user'], self.user.pk)
+        results = self.client.get('/api/v1/user-statistics/').data['results']
+        self.assertEqual([r['steps'] for r in results], [5])
+
+
+class ActivityBufferTests(TransactionTestCase):
+    """The flusher thread writes in batches; drops, failures and shutdown are accounted for."""
+
+    def setUp(self):
+        self.user = User.objects.create(username='active', email='active@example.com')
+
+    def make_buffer(self, **options):
+        buffer = ActivityBuffer(**options)
+        self.addCleanup(buffer.stop)
+        return buffer
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail('Timed out waiting for the flusher')
+            time.sleep(0.01)
+
+    def test_full_batches_flush_before_the_interval(self):
+        buffer = self.make_buffer(batch_size=3, flush_interval_ms=60 * 1000)
+        for i in range(7):
+            buffer.log(self.user, 'event %d' % i)
+        self.wait_for(lambda: buffer.metrics()['flushed'] == 6)
+        self.assertEqual(buffer.metrics()['flushes'], 2)
+        self.assertEqual(UserActivityLog.objects.count(), 6)
+
+        # The last, partial batch is written at shutdown, not after the interval.
+        started = time.monotonic()
+        buffer.stop()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(UserActivityLog.objects.count(), 7)
+
+    def test_shutdown_flushes_what_is_queued(self):
+        with mock.patch('api.activity.atexit.register') as register:
+            buffer = self.make_buffer(batch_size=100, flush_interval_ms=60 * 1000)
+            for i in range(5):
+                buffer.log(self.user, 'event %d' % i)
+        register.assert_called_once_with(buffer.stop)
+        self.assertEqual(UserActivityLog.objects.count(), 0)
+        buffer.stop()
+        self.assertEqual(UserActivityLog.objects.count(), 5)
+        self.assertFalse(buffer._thread.is_alive())
+
+    def test_drop_policy_when_full(self):
+        buffer = self.make_buffer(max_queue=2, policy='drop')
+        with mock.patch.object(buffer, 'start'):  # nothing drains the queue
+            results = [buffer.log(self.user, 'event %d' % i) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        metrics = buffer.metrics()
+        self.assertEqual((metrics['enqueued'], metrics['dropped'], metrics['queue_depth']), (2, 2, 2))
+        self.assertEqual(buffer.flush(), 2)
+
+    def test_block_policy_gives_up_after_timeout(self):
+        buffer = self.make_buffer(max_queue=1, policy='block', block_timeout_ms=20)
+        with mock.patch.object(buffer, 'start'):
+            self.assertTrue(buffer.log(self.user, 'first'))
+            started = time.monotonic()
+            self.assertFalse(buffer.log(self.user, 'second'))
+        self.assertGreaterEqual(time.monotonic() - started, 0.02)
+
+    def test_failed_flush_is_counted_and_logged(self):
+        buffer = self.make_buffer()
+        with mock.patch.object(buffer, 'start'):
+            for i in range(3):
+                buffer.log(self.user, 'event %d' % i)
+        with mock.patch.object(UserActivityLog.objects, 'bulk_create', side_effect=DatabaseError('disk full')), \
+                self.assertLogs('api.activity', 'ERROR'):
+            self.assertEqual(buffer.flush(), 0)
+        metrics = buffer.metrics()
+        self.assertEqual((metrics['failed'], metrics['flushed'], metrics['queue_depth']), (3, 0, 0))
+
+
+@override_settings(AUTH_USER_CACHE={'ALIAS': 'default', 'TIMEOUT': 60})
+class AuthUserCacheTests(TestCase):
+    """JWT users come from the cache until they are saved, deactivated or deleted."""
+    url = '/api/v1/user-activity-logs/'
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='cached', email='cached@example.com', password='old-password')
+        self.client = APIClient()
+
+    def get(self, token):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer %s' % token)
+        user_queries = [q for q in queries if 'FROM "api_user"' in q['sql']]
+        return response.status_code, len(user_queries)
+
+    def test_user_is_cached(self):
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(self.get(token), (200, 1))
+        self.assertEqual(self.get(token), (200, 0))
+
+    def test_deactivation_invalidates(self):
+        token = AccessToken.for_user(self.user)
+        self.get(token)
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.get(token)[0], 401)
+
+    def test_password_change_invalidates(self):
+        token = AccessToken.for_user(self.user)
+        self.get(token)
+        self.user.set_password('new-password')
+        self.user.save()
+        # The row is read again, so simplejwt's revoke check sees the new hash.
+        self.assertEqual(self.get(token), (200, 1))
+
+        # simplejwt binds its settings at import, so override_settings can't flip this.
+        with mock.patch.object(authentication.api_settings, 'CHECK_REVOKE_TOKEN', True):
+            token = AccessToken.for_user(self.user)
+            self.assertEqual(self.get(token), (200, 0))
+            self.user.set_password('newer-password')
+            self.user.save()
+            self.assertEqual(self.get(token)[0], 401)
+
+    @override_settings(AUTH_USER_CACHE={'ALIAS': None})
+    def test_disabled_by_default(self):
+        token = AccessToken.for_user(self.user)
+        self.assertEqual(self.get(token), (200, 1))
+        self.assertEqual(self.get(token), (200, 1))
+
+    def test_per_process_cache_is_refused(self):
+        self.assertEqual([e.id for e in checks.check_auth_user_cache(None)], ['api.E001'])
+        with override_settings(DEBUG=True):
+            self.assertEqual(checks.check_auth_user_cache(None), [])
+        with override_settings(AUTH_USER_CACHE={'ALIAS': 'shared'}):
+            self.assertEqual(checks.check_auth_user_cache(None), [])
+
+
+@override_settings(ACTIVITY_LOG={**settings.ACTIVITY_LOG, 'ENABLED': False})
+class TokenRevocationTests(TestCase):
+    """Rotated and logged-out refresh tokens are refused, in this worker and the others."""
+
+    def setUp(self):
+        # Row ids restart after each test's rollback; don't carry last_seen over.
+        revocation.get_store().clear()
+        User.objects.create_user(username='rotator', email='rotator@example.com', password='secret-password')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/v1/login/', {'username': 'rotator', 'password': 'secret-password'})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def refresh(self, token):
+        return self.client.post('/api/v1/token/refresh/', {'refresh': token})
+
+    def test_rotated_token_cannot_be_replayed(self):
+        old = self.login()['refresh']
+        response = self.refresh(old)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, 200)
+        self.assertEqual(self.refresh(old).status_code, 401)
+
+    def test_replay_on_a_worker_that_has_not_synced(self):
+        other_worker = revocation.RevocationStore(sync_interval=3600)
+        other_worker.sync()
+        old = self.login()['refresh']
+        self.assertEqual(self.refresh(old).status_code, 200)
+        # Its set doesn't know the jti yet; the blacklist row created by rotation does.
+        with mock.patch('api.revocation.get_store', return_value=other_worker):
+            self.assertEqual(self.refresh(old).status_code, 401)
+
+    def test_refresh_after_logout(self):
+        tokens = self.login()
+        response = self.client.post('/api/v1/logout/', {'refresh': tokens['refresh']},
+                                    HTTP_AUTHORIZATION='Bearer %s' % tokens['access'])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.refresh(tokens['refresh']).status_code, 401)
+
+    def test_stores_sync_blacklists_from_other_workers(self):
+        store = revocation.RevocationStore(sync_interval=3600)
+        store.sync()
+        now = timezone.now()
+        live = OutstandingToken.objects.create(jti='live', token='t', expires_at=now + datetime.timedelta(hours=1))
+        expired = OutstandingToken.objects.create(jti='expired', token='t', expires_at=now - datetime.timedelta(hours=1))
+        # Written by another worker: no signal reaches this store.
+        with mock.patch.object(revocation.get_store(), 'add'):
+            BlacklistedToken.objects.create(token=live)
+            BlacklistedToken.objects.create(token=expired)
+
+        self.assertFalse(store.is_revoked('live'))  # inside the sync interval
+        store.sync_interval = 0
+        self.assertTrue(store.is_revoked('live'))
+        self.assertFalse(store.is_revoked('expired'))
+        self.assertEqual(len(store), 1)
+
+        # A fresh store loads only the live rows.
+        fresh = revocation.RevocationStore()
+        self.assertTrue(fresh.is_revoked('live'))
+        self.assertEqual(len(fresh), 1)
+
+
+class StickyPrimaryTests(TestCase):
+    """The read-your-writes pin is kept where every worker can see it; no replica needed."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory.name}
+        routing = {**settings.DATABASE_ROUTING, 'REPLICAS': ['replica1'], 'CACHE_ALIAS': 'shared'}
+        override = override_settings(CACHES={**settings.CACHES, 'shared': shared}, DATABASE_ROUTING=routing)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.factory = RequestFactory()
+        self.writer = User.objects.create(username='writer', email='writer@example.com')
+        self.reader = User.objects.create(username='reader', email='reader@example.com')
+
+    def request(self, method, user):
+        router = db_routing.PrimaryReplicaRouter()
+
+        def view(request):
+            if request.method == 'POST':
+                router.db_for_write(UserProgress)
+            return HttpResponse(router.db_for_read(UserProgress))
+
+        request = getattr(self.factory, method.lower())('/')
+        request.user = user
+        return db_routing.PrimaryReplicaMiddleware(view)(request).content.decode()
+
+    def test_write_pins_the_writer_for_every_worker(self):
+        self.assertEqual(self.request('GET', self.writer), 'replica1')
+        self.assertEqual(self.request('POST', self.writer), 'default')
+        self.assertEqual(self.request('GET', self.writer), 'default')
+        self.assertEqual(self.request('GET', self.reader), 'replica1')
+        # Another worker process: a cache connection of its own, same store.
+        other_worker = caches.create_connection('shared')
+        self.assertTrue(other_worker.get(db_routing._pin_key(self.writer.pk)))
+
+    def test_per_process_cache_is_refused(self):
+        self.assertEqual(checks.check_routing_cache(None), [])
+        with override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'REPLICAS': ['replica1'],
+                                                 'CACHE_ALIAS': 'default'}):
+            self.assertEqual([e.id for e in checks.check_routing_cache(None)], ['api.E002'])
+
+
+@unittest.skipUnless(settings.DATABASE_REPLICAS, 'Set DB_REPLICAS to run the replica routing tests.')
+class ReplicaRoutingTests(TransactionTestCase):
+    """GET reads hit a replica (copied by copy_sqlite), a user's writes pin them to the primary."""
+
+    databases = '__all__'
+    url = '/api/v1/user-progress/?date_from=2024-01-01&date_to=2024-12-31'
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create(username='owner', email='owner@example.com')
+        self.client.force_authenticate(self.user)
+        copy_sqlite()
+
+    def list_dates(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return [row['date'] for row in response.data['results']]
+
+    def post_progress(self, day):
+        response = self.client.post('/api/v1/user-progress/', {
+            'user': self.user.pk, 'date': day, 'weight': 70, 'calories_burned': 200, 'workout_duration': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_reads_go_to_replica_until_copied(self):
+        UserProgress.objects.create(user=self.user, date=datetime.date(2024, 1, 1), weight=70,
+                                    calories_burned=200, workout_duration=30)
+        self.assertEqual(self.list_dates(), [])
+        copy_sqlite()
+        self.assertEqual(self.list_dates(), ['2024-01-01'])
+
+    def test_writer_sticks_to_primary(self):
+        self.post_progress('2024-01-02')
+        self.assertEqual(self.list_dates(), ['2024-01-02'])
+
+    @override_settings(DATABASE_ROUTING={**settings.DATABASE_ROUTING, 'STICKY_SECONDS': 0})
+    def test_no_sticky_window(self):
+        self.post_progress('2024-01-03')
+        self.assertEqual(self.list_dates(), [])
+
+
+class AsyncReadViewTests(TestCase):
+    """The /api/v1/async/ views page by id and authenticate per-user reads with the JWT."""
+
+    def setUp(self):
+        self.goals = [Goal.objects.create(name='Goal %d' % i) for i in range(5)]
+        self.user = User.objects.create(username='async', email='async@example.com')
+        other = User.objects.create(username='elsewhere', email='elsewhere@example.com')
+        for user, weight in ((self.user, 70), (other, 90)):
+            UserProgress.objects.create(user=user, date=datetime.date(2024, 1, 1), weight=weight,
+                                        calories_burned=0, workout_duration=0)
+
+    async def test_list_pages_before_an_id(self):
+        response = await self.async_client.get('/api/v1/async/goals/', {'page_size': 2, 'count': 'true'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([row['name'] for row in data['results']], ['Goal 4', 'Goal 3'])
+        self.assertEqual(data['count'], 5)
+        self.assertIn('before=%d' % self.goals[3].pk, data['next'])
+
+        response = await self.async_client.get('/api/v1/async/goals/', {'page_size': 2, 'before': self.goals[1].pk})
+        data = response.json()
+        self.assertEqual([row['name'] for row in data['results']], ['Goal 0'])
+        self.assertIsNone(data['next'])
+        response = await self.async_client.get('/api/v1/async/goals/', {'before': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_detail_and_missing_row(self):
+        response = await self.async_client.get('/api/v1/async/goals/%d/' % self.goals[0].pk)
+        self.assertEqual((response.status_code, response.json()['name']), (200, 'Goal 0'))
+        response = await self.async_client.get('/api/v1/async/goals/999999/')
+        self.assertEqual(response.status_code, 404)
+
+    async def test_per_user_reads_need_a_valid_token(self):
+        url = '/api/v1/async/user-progress/'
+        self.assertEqual((await self.async_client.get(url)).status_code, 401)
+        response = await self.async_client.get(url, headers={'Authorization': 'Bearer not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+        response = await self.async_client.get(url, headers={'Authorization': 'Bearer %s' % token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['weight'] for row in response.json()['results']], [70])
+
+
+@override_settings(PAYMENTS={**settings.PAYMENTS, 'GATEWAY': 'api.payments.FakeGateway', 'RUN_IN_PROCESS': False})
+class PaymentIntentTests(TestCase):
+    """POST /payments/ only records the intent; the worker charges it once."""
+
+    def setUp(self):
+        payments._gateway = None
+        self.gateway = payments.get_gateway()
+        self.client = APIClient()
+        self.user = User.objects.create(username='payer', email='payer@example.com')
+        self.profile = UserProfile.objects.create(user=self.user, first_name='a', last_name='b', gender='m',
+                                                  stripe_customer_id='cus_123')
+        self.client.force_authenticate(self.user)
+
+    def tearDown(self):
+        payments._gateway = None
+
+    def test_create_returns_accepted_without_charging(self):
+        response = self.client.post('/api/v1/payments/', {'amount': '9.99'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['status'], Payment.STATUS_PENDING)
+        self.assertEqual(self.gateway.calls, 0)
+
+        self.assertEqual(payments.process_payment(response.data['id']), Payment.STATUS_SUCCEEDED)
+        payment = Payment.objects.get(pk=response.data['id'])
+        self.assertTrue(payment.success)
+        self.assertTrue(payment.stripe_charge_id.startswith('ch_fake_'))
+
+    def test_idempotency_key_header_reuses_payment(self):
+        first = self.client.post('/api/v1/payments/', {'amount': '5.00'}, format='json',
+                                 HTTP_IDEMPOTENCY_KEY='order-1')
+        second = self.client.post('/api/v1/payments/', {'amount': '5.00'}, format='json',
+                                  HTTP_IDEMPOTENCY_KEY='order-1')
+        self.assertEqual(first.data['id'], second.data['id'])
+        self.assertEqual(Payment.objects.count(), 1)
+
+    def test_retried_charge_is_not_taken_twice(self):
+        payment = Payment.objects.create(user_profile=self.profile, amount='12.50')
+        payments.process_payment(payment.pk)
+        # A worker died after charging: the row is processing again and retried.
+        Payment.objects.filter(pk=payment.pk).update(status=Payment.STATUS_PROCESSING)
+        with override_settings(PAYMENTS={**settings.PAYMENTS, 'STALE_AFTER_SECONDS': -1}):
+            self.assertEqual(payments.process_payment(payment.pk), Payment.STATUS_SUCCEEDED)
+        self.assertEqual(self.gateway.calls, 2)
+        self.assertEqual(len(self.gateway.charges), 1)
+
+    def test_gateway_errors(self):
+        self.profile.stripe_customer_id = 'cus_decline'
+        self.profile.save()
+        declined = Payment.objects.create(user_profile=self.profile, amount='1.00')
+        self.assertEqual(payments.process_payment(declined.pk), Payment.STATUS_FAILED)
+
+        self.profile.stripe_customer_id = 'cus_unavailable'
+        self.profile.save()
+        flaky = Payment.objects.create(user_profile=self.profile, amount='1.00')
+        self.assertEqual(payments.process_payment(flaky.pk), Payment.STATUS_PENDING)
+
+    def test_incomplete_gateway_fails_when_built(self):
+        class ChargeOnly(payments.PaymentGateway):
+            def charge(self, *args):
+                return payments.Charge(id='ch_1', paid=True)
+
+        with self.assertRaisesRegex(TypeError, 'fetch_charges'):
+            ChargeOnly()
+
+
+@override_settings(PAYMENTS={**settings.PAYMENTS, 'GATEWAY': 'api.payments.StripeGateway', 'RUN_IN_PROCESS': False})
+class ReconcilePaymentsTests(TestCase):
+    """reconcile_payments against a local fake of the Stripe API."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = FakeStripeServer().start()
+        cls.stripe_config = stripe.api_base, stripe.api_key, stripe.max_network_retries
+        stripe.api_base, stripe.api_key, stripe.max_network_retries = cls.server.url, 'sk_test_fake', 0
+
+    @classmethod
+    def tearDownClass(cls):
+        stripe.api_base, stripe.api_key, stripe.max_network_retries = cls.stripe_config
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        payments._gateway = None
+        self.server.charges.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'reconcile.json')
+        user = User.objects.create(username='reconciled', email='reconciled@example.com')
+        self.profile = UserProfile.objects.create(user=user, first_name='a', last_name='b', gender='m')
+
+    def tearDown(self):
+        payments._gateway = None
+
+    def payment(self, charge_status='succeeded', status=Payment.STATUS_SUCCEEDED, **charge):
+        charge_id = self.server.add_charge(status=charge_status, **charge)
+        return Payment.objects.create(user_profile=self.profile, amount='3.00', stripe_charge_id=charge_id,
+                                      status=status, success=status == Payment.STATUS_SUCCEEDED)
+
+    def reconcile(self, **options):
+        out = io.StringIO()
+        call_command('reconcile_payments', checkpoint=self.checkpoint, stdout=out, stderr=io.StringIO(), **options)
+        return out.getvalue()
+
+    def test_corrects_mismatches_in_batches(self):
+        matched = [self.payment() for _ in range(5)]
+        refunded = self.payment('failed', failure_message='Charge disputed.')
+        pending = self.payment('pending')
+        requests = len(self.server.requests)
+
+        output = self.reconcile(chunk_size=3, concurrency=2)
+
+        self.assertIn('5 matched, 1 corrected, 1 still pending', output)
+        refunded.refresh_from_db()
+        self.assertEqual((refunded.status, refunded.success, refunded.error),
+                         (Payment.STATUS_FAILED, False, 'Charge disputed.'))
+        self.assertIsNotNone(refunded.reconciled_at)
+        self.assertTrue(all(p.reconciled_at for p in Payment.objects.filter(pk__in=[m.pk for m in matched])))
+        self.assertIsNone(Payment.objects.get(pk=pending.pk).reconciled_at)
+        # Three chunks, one list call each: no per-charge lookups.
+        self.assertEqual(self.server.requests[requests:], [('GET', '/v1/charges')] * 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_missing_charge_is_fetched_then_reported(self):
+        payment = Payment.objects.create(user_profile=self.profile, amount='3.00', stripe_charge_id='ch_unknown',
+                                         status=Payment.STATUS_SUCCEEDED, success=True)
+        self.assertIn('1 missing', self.reconcile())
+        self.assertIn(('GET', '/v1/charges/ch_unknown'), self.server.requests)
+        self.assertIsNone(Payment.objects.get(pk=payment.pk).reconciled_at)
+
+    def test_resumes_from_checkpoint(self):
+        created = [self.payment() for _ in range(4)]
+        output = self.reconcile(chunk_size=2, concurrency=1, max_chunks=1)
+        self.assertIn('run again to continue', output)
+        self.assertEqual(Payment.objects.filter(reconciled_at__isnull=False).count(), 2)
+
+        # Rows before the checkpoint are not looked at again.
+        Payment.objects.filter(pk=created[0].pk).update(reconciled_at=None)
+        self.assertIn('2 matched', self.reconcile(chunk_size=2))
+        self.assertIsNone(Payment.objects.get(pk=created[0].pk).reconciled_at)
+        self.assertIn('1 matched', self.reconcile(reset=True))
+
+    def test_backfilled_rows_list_only_their_own_window(self):
+        created = datetime.datetime(2020, 3, 1, tzinfo=datetime.timezone.utc)
+        old = [self.payment(created=created.timestamp()) for _ in range(2)]
+        # Rows from before migration 0010: updated_at is the migration time.
+        Payment.objects.filter(pk__in=[p.pk for p in old]).update(timestamp=created)
+        for _ in range(150):
+            self.server.add_charge()  # recent charges the window must not page through
+        requests = len(self.server.requests)
+
+        self.assertIn('2 matched', self.reconcile())
+        self.assertEqual(self.server.requests[requests:], [('GET', '/v1/charges')])
+
+    def test_gateway_error_keeps_checkpoint(self):
+        self.payment()
+        stripe.api_base = 'http://127.0.0.1:9'  # nothing listens there
+        try:
+            with self.assertRaises(CommandError):
+                self.reconcile()
+        finally:
+            stripe.api_base = self.server.url
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertEqual(Payment.objects.filter(reconciled_at__isnull=True).count(), 1)
+
+
+def png_upload(size=(2000, 1000), mode='RGB', name='photo.png'):
+    buffer = io.BytesIO()
+    Image.new(mode, size, 'red').save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+def use_temporary_media_root(test):
+    directory = tempfile.TemporaryDirectory()
+    test.addCleanup(directory.cleanup)
+    media = override_settings(MEDIA_ROOT=directory.name)
+    media.enable()
+    test.addCleanup(media.disable)
+
+
+@override_settings(IMAGE_DERIVATIVES={**settings.IMAGE_DERIVATIVES, 'RUN_IN_PROCESS': False})
+class ImageDerivativeTests(TestCase):
+    """Resized copies are written off the request and exposed as a URL map."""
+
+    def setUp(self):
+        use_temporary_media_root(self)
+
+    def test_derive_writes_each_smaller_size(self):
+        post = Post.objects.create(title='t', content='c', image=png_upload())
+        self.assertEqual(PostSerializer(post).data['image_variants'], {'original': post.image.url})
+
+        sizes = images.derive('post', post.pk)
+        self.assertEqual(set(sizes), {'thumb', 'small', 'medium', 'large'})
+        post.refresh_from_db()
+        with post.image.storage.open(sizes['small']) as f, Image.open(f) as small:
+            self.assertEqual((small.format, small.size), ('WEBP', (320, 160)))
+        data = PostSerializer(post).data['image_variants']
+        self.assertEqual(data['thumb'], post.image.storage.url(sizes['thumb']))
+        self.assertIsNone(images.derive('post', post.pk))  # already current
+
+    def test_small_images_are_not_upscaled(self):
+        post = Post.objects.create(title='t', content='c', image=png_upload((300, 200), mode='P'))
+        self.assertEqual(set(images.derive('post', post.pk)), {'thumb'})
+
+    def test_replaced_image_drops_old_derivatives(self):
+        post = Post.objects.create(title='t', content='c', image=png_upload())
+        old = images.derive('post', post.pk)
+        post.refresh_from_db()
+        post.image = png_upload(name='other.png')
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(PostSerializer(post).data['image_variants'], {'original': post.image.url})
+        images.derive('post', post.pk)
+        self.assertFalse(any(post.image.storage.exists(name) for name in old.values()))
+
+    def test_cleared_image_drops_its_derivatives(self):
+        post = Post.objects.create(title='t', content='c', image=png_upload())
+        old = images.derive('post', post.pk)
+        post.refresh_from_db()
+        storage = post.image.storage
+        post.image = None
+        self.assertFalse(images.is_current(post, 'post'))
+        post.save()
+
+        self.assertIsNone(images.derive('post', post.pk))
+        self.assertFalse(any(storage.exists(name) for name in old.values()))
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, {})
+        self.assertTrue(images.is_current(post, 'post'))
+
+    def test_omit_keeps_the_column_pushdown(self):
+        user = User.objects.create(username='pictured', email='pictured@example.com')
+        UserProfile.objects.create(user=user, first_name='a', last_name='b', gender='m', profile_image=png_upload())
+        client = APIClient()
+        client.force_authenticate(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/user-profiles/', {'omit': 'stripe_customer_id'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]['profile_image_variants']), {'original'})
+        sql = next(q['sql'] for q in queries if 'FROM "api_userprofile"' in q['sql'])
+        self.assertNotIn('stripe_customer_id', sql)
+        self.assertIn('profile_image_variants', sql)
+
+    def test_saved_uploads_are_queued_after_commit(self):
+        with mock.patch.object(images, 'get_worker') as get_worker, \
+                self.settings(IMAGE_DERIVATIVES={**settings.IMAGE_DERIVATIVES, 'RUN_IN_PROCESS': True}):
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(title='t', content='c', image=png_upload())
+                Post.objects.create(title='no image', content='c')
+        get_worker.return_value.submit.assert_called_once_with('post', post.pk)
+
+
+@override_settings(IMAGE_DERIVATIVES={**settings.IMAGE_DERIVATIVES, 'RUN_IN_PROCESS': False})
+class DeriveImagesCommandTests(TransactionTestCase):
+    """The command's worker threads need committed rows, hence TransactionTestCase."""
+
+    def setUp(self):
+        use_temporary_media_root(self)
+
+    def test_command_derives_existing_media(self):
+        user = User.objects.create(username='pictured', email='pictured@example.com')
+        UserProfile.objects.create(user=user, first_name='a', last_name='b', gender='m', profile_image=png_upload())
+        Post.objects.create(title='t', content='c', image=png_upload())
+        Post.objects.create(title='broken', content='c', image=SimpleUploadedFile('x.png', b'not an image'))
+        out = io.StringIO()
+        call_command('derive_images', workers=1, stdout=out, stderr=io.StringIO())
+        self.assertIn('profile: derived 1 of 1 images, 0 failed', out.getvalue())
+        self.assertIn('post: derived 1 of 2 images, 1 failed', out.getvalue())
+
+        out = io.StringIO()
+        call_command('derive_images', 'profile', stdout=out)
+        self.assertIn('derived 0 of 1', out.getvalue())  # already current
+
+
+class VideoUploadTests(TestCase):
+    """Post.video arrives in resumable, checksummed chunks."""
+
+    def setUp(self):
+        use_temporary_media_root(self)
+        self.client = APIClient()
+        self.user = User.objects.create(username='filmmaker', email='filmmaker@example.com')
+        self.user.user_permissions.add(Permission.objects.get(codename='change_post'))
+        self.client.force_authenticate(self.user)
+        self.post = Post.objects.create(title='t', content='c')
+        self.video = os.urandom(300 * 1024)
+
+    def open_upload(self, **extra):
+        response = self.client.post('/api/v1/video-uploads/', {
+            'post': self.post.pk, 'filename': 'clip.mp4', 'size': len(self.video), **extra,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return '/api/v1/video-uploads/%s/' % response.data['id']
+
+    def send(self, url, offset, chunk, checksum=None):
+        headers = {'Upload-Offset': str(offset)}
+        if checksum is not None:
+            headers['Upload-Checksum'] = 'sha256 %s' % base64.b64encode(checksum).decode()
+        return self.client.generic('PATCH', url, chunk, content_type='application/offset+octet-stream',
+                                   headers=headers)
+
+    def test_chunks_then_finalize(self):
+        url = self.open_upload(checksum=hashlib.sha256(self.video).hexdigest())
+        for offset in range(0, len(self.video), 100 * 1024):
+            chunk = self.video[offset:offset + 100 * 1024]
+            response = self.send(url, offset, chunk, hashlib.sha256(chunk).digest())
+            self.assertEqual(response.status_code, 204)
+            self.assertEqual(int(response['Upload-Offset']), offset + len(chunk))
+
+        response = self.client.post(url + 'finalize/')
+        self.assertEqual(response.status_code, 200)
+        self.post.refresh_from_db()
+        with self.post.video.open('rb') as f:
+            self.assertEqual(f.read(), self.video)
+        self.assertFalse(os.path.exists(uploads.temp_path(VideoUpload.objects.get())))
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 200)  # idempotent
+
+    def test_wrong_offset_and_checksum_are_rejected(self):
+        url = self.open_upload()
+        self.send(url, 0, self.video[:1000])
+        response = self.send(url, 500, self.video[500:1500])
+        self.assertEqual((response.status_code, response.data['offset']), (409, 1000))
+
+        response = self.send(url, 1000, self.video[1000:2000], hashlib.sha256(b'other').digest())
+        self.assertEqual(response.status_code, 460)
+        self.assertEqual(self.client.head(url)['Upload-Offset'], '1000')
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 409)
+
+    def test_dropped_connection_keeps_received_bytes(self):
+        url = self.open_upload()
+        upload = VideoUpload.objects.get()
+        # Only 4000 of the announced 10000 bytes arrive.
+        self.assertEqual(uploads.write_chunk(upload, 0, io.BytesIO(self.video[:4000]), 10000), 4000)
+        self.assertEqual(self.send(url, 4000, self.video[4000:]).status_code, 204)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 200)
+
+    def test_one_writer_at_a_time(self):
+        url = self.open_upload()
+        upload = VideoUpload.objects.get()
+        self.assertTrue(uploads.claim(upload, 0))
+        self.assertEqual(self.send(url, 0, self.video[:10]).status_code, 409)
+
+    def test_stale_writer_keeps_its_hands_off(self):
+        self.open_upload()
+        upload = VideoUpload.objects.get()
+
+        class TakenOver(io.BytesIO):
+            def read(self, size=-1):
+                # The claim looks stale to another worker, which takes it.
+                VideoUpload.objects.filter(pk=upload.pk).update(writing_since=timezone.now())
+                return super().read(size)
+
+        with self.assertRaises(uploads.UploadBusy):
+            uploads.write_chunk(upload, 0, TakenOver(self.video[:1000]), 1000)
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 0)
+        self.assertIsNotNone(upload.writing_since)  # still the new writer's
+
+    def test_finalize_replaces_the_previous_video(self):
+        self.post.video = SimpleUploadedFile('old.mp4', b'old')
+        self.post.save()
+        old = self.post.video.name
+        url = self.open_upload()
+        self.send(url, 0, self.video)
+        self.assertEqual(self.client.post(url + 'finalize/').status_code, 200)
+        self.post.refresh_from_db()
+        self.assertNotEqual(self.post.video.name, old)
+        self.assertFalse(self.post.video.storage.exists(old))
+
+    def test_changing_posts_takes_permission(self):
+        self.client.force_authenticate(User.objects.create(username='anyone', email='anyone@example.com'))
+        response = self.client.post('/api/v1/video-uploads/', {
+            'post': self.post.pk, 'filename': 'clip.mp4', 'size': len(self.video),
+        }, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(VideoUpload.objects.exists())
+
+    def test_uploads_are_private(self):
+        url = self.open_upload()
+        self.client.force_authenticate(User.objects.create(username='other', email='other@example.com'))
+        self.assertEqual(self.send(url, 0, self.video[:10]).status_code, 404)
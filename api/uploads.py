@@ -0,0 +1,261 @@
+"""
+Resumable, chunked uploads for ``Post.video``.
+
+The client opens an upload with the total size (and optionally the
+sha256 of the whole file). It then PATCHes the bytes in chunks, each
+carrying the ``Upload-Offset`` it starts at and, optionally, an
+``Upload-Checksum: sha256 <base64 digest>`` of the chunk (the tus
+protocol's headers). Chunks are streamed from the request straight into
+``<TEMP_DIR>/<upload id>.part`` and fsynced before the offset moves.
+Nothing is held in memory beyond ``BUFFER_SIZE``.
+
+If a connection drops mid-chunk, the bytes that arrived are kept. The
+client asks for the offset and continues from there. A chunk sent with
+a checksum is all-or-nothing: a mismatch, or a short chunk, is
+discarded. A write claims the upload first with a conditional UPDATE,
+like the payment worker does, so two writers never interleave. The claim
+is the ``writing_since`` timestamp it set: a writer renews it while a
+slow chunk trickles in, and only truncates the file or moves the offset
+while the timestamp is still its own. A claim that wasn't renewed for
+STALE_AFTER_SECONDS (a crashed worker) can be taken over.
+
+``finalize`` checks the size and whole-file checksum, then moves the
+file into storage as the post's video, deleting the one it replaces. On
+the filesystem storage this is a rename, not a copy.
+``manage.py clean_video_uploads`` removes abandoned uploads.
+
+Settings (``VIDEO_UPLOADS`` in settings.py): MAX_SIZE, MAX_CHUNK_SIZE,
+TEMP_DIR, BUFFER_SIZE, STALE_AFTER_SECONDS, EXPIRE_AFTER_SECONDS.
+"""
+import base64
+import binascii
+import datetime
+import hashlib
+import os
+import time
+
+from django.conf import settings
+from django.core.files import File
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import VideoUpload
+
+DEFAULTS = {
+    'MAX_SIZE': 2 * 1024 ** 3,
+    'MAX_CHUNK_SIZE': 16 * 1024 ** 2,
+    'TEMP_DIR': None,  # default: MEDIA_ROOT/uploads/partial
+    'BUFFER_SIZE': 64 * 1024,
+    'STALE_AFTER_SECONDS': 120,
+    'EXPIRE_AFTER_SECONDS': 60 * 60 * 24,
+}
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'VIDEO_UPLOADS', {})}
+
+
+class UploadError(Exception):
+    status_code = 400
+
+
+class OffsetMismatch(UploadError):
+    """The chunk doesn't start where the upload stands; resend from ``offset``."""
+    status_code = 409
+
+    def __init__(self, offset):
+        super().__init__('Upload is at offset %d' % offset)
+        self.offset = offset
+
+
+class UploadBusy(UploadError):
+    """Another request is writing to this upload."""
+    status_code = 409
+
+
+class ChecksumMismatch(UploadError):
+    status_code = 460  # tus: checksum mismatch
+
+
+def temp_dir():
+    return _options()['TEMP_DIR'] or os.path.join(settings.MEDIA_ROOT, 'uploads', 'partial')
+
+
+def temp_path(upload):
+    return os.path.join(temp_dir(), '%s.part' % upload.pk)
+
+
+def parse_checksum(header):
+    """The digest from an ``Upload-Checksum: sha256 <base64>`` header, or None."""
+    if not header:
+        return None
+    algorithm, _, value = header.strip().partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise UploadError('Unsupported checksum algorithm %r; use sha256' % algorithm)
+    try:
+        return base64.b64decode(value.strip(), validate=True)
+    except binascii.Error:
+        raise UploadError('Malformed Upload-Checksum header')
+
+
+def start(user, post, filename, size, checksum=''):
+    if size > _options()['MAX_SIZE']:
+        raise UploadError('Upload exceeds the %d byte limit' % _options()['MAX_SIZE'])
+    upload = VideoUpload.objects.create(user=user, post=post, filename=os.path.basename(filename),
+                                        size=size, checksum=checksum.lower())
+    os.makedirs(temp_dir(), exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def claim(upload, offset):
+    """
+    Reserve the upload for one writer at ``offset``. Returns the claim
+    token (the ``writing_since`` it set), or None if another writer has it.
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=_options()['STALE_AFTER_SECONDS'])
+    claimed = VideoUpload.objects.filter(
+        Q(writing_since__isnull=True) | Q(writing_since__lt=stale),
+        pk=upload.pk, offset=offset, completed_at__isnull=True,
+    ).update(writing_since=now)
+    return now if claimed else None
+
+
+def renew(upload, token):
+    """Refresh a claim that is still ``token``. Returns the new token, or None if it was taken over."""
+    now = timezone.now()
+    if VideoUpload.objects.filter(pk=upload.pk, writing_since=token).update(writing_since=now):
+        return now
+    return None
+
+
+def _release(upload, token, **fields):
+    """Drop the claim, saving ``fields`` with it. False if it was taken over."""
+    return VideoUpload.objects.filter(pk=upload.pk, writing_since=token).update(
+        writing_since=None, updated_at=timezone.now(), **fields) == 1
+
+
+def _claim_or_raise(upload, offset):
+    token = claim(upload, offset)
+    if token is not None:
+        return token
+    upload.refresh_from_db()
+    if upload.completed_at is not None:
+        raise UploadError('Upload is already finalized')
+    if upload.offset != offset:
+        raise OffsetMismatch(upload.offset)
+    raise UploadBusy('Another request is writing to this upload')
+
+
+def write_chunk(upload, offset, stream, length, checksum=None):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``. Returns the
+    new offset. Without ``checksum`` whatever arrived is kept; with it the
+    chunk is kept only if it arrived whole and matches.
+    """
+    options = _options()
+    if length > options['MAX_CHUNK_SIZE']:
+        raise UploadError('Chunks are limited to %d bytes' % options['MAX_CHUNK_SIZE'])
+    if offset + length > upload.size:
+        raise UploadError('Chunk ends past the declared size of %d bytes' % upload.size)
+    token = _claim_or_raise(upload, offset)
+    # Renewing well inside the stale window means nothing can take the
+    # claim over between a renewal and the writes that follow it.
+    renew_every = options['STALE_AFTER_SECONDS'] / 4
+
+    written, verified = 0, checksum is None
+    digest = hashlib.sha256()
+    try:
+        with open(temp_path(upload), 'r+b') as f:
+            f.seek(offset)
+            try:
+                renewed_at = time.monotonic()
+                while written < length:
+                    data = stream.read(min(options['BUFFER_SIZE'], length - written))
+                    if not data:
+                        break
+                    if time.monotonic() - renewed_at > renew_every:
+                        token = renew(upload, token)
+                        if token is None:
+                            break
+                        renewed_at = time.monotonic()
+                    f.write(data)
+                    digest.update(data)
+                    written += len(data)
+            finally:
+                if checksum is not None:
+                    verified = written == length and digest.digest() == checksum
+                    if not verified:
+                        written = 0
+                if token is not None:
+                    # A fresh claim, so the file is still ours while we cut it.
+                    token = renew(upload, token)
+                if token is not None:
+                    # Drop anything past what we keep, e.g. from an earlier failed chunk.
+                    f.truncate(offset + written)
+                    f.flush()
+                    os.fsync(f.fileno())
+    finally:
+        if token is None or not _release(upload, token, offset=offset + written):
+            upload.refresh_from_db()
+            raise UploadBusy('Another request took over this upload; resume from its offset')
+        upload.offset = offset + written
+    if not verified:
+        raise ChecksumMismatch('Chunk checksum mismatch; resend from offset %d' % offset)
+    return upload.offset
+
+
+class _PartialFile(File):
+    # FileSystemStorage moves files that expose a temporary path instead of
+    # copying them.
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def finalize(upload):
+    """Attach the finished file to ``upload.post`` and return the post."""
+    if upload.completed_at is not None:
+        return upload.post
+    token = _claim_or_raise(upload, upload.size)
+    completed_at = None
+    try:
+        path = temp_path(upload)
+        if upload.checksum:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(_options()['BUFFER_SIZE']), b''):
+                    digest.update(block)
+            if digest.hexdigest() != upload.checksum:
+                raise ChecksumMismatch('File checksum mismatch; abort and upload again')
+        # Hashing a large file can take a while; make sure nobody took over.
+        token = renew(upload, token)
+        if token is None:
+            raise UploadBusy('Another request is finalizing this upload')
+        post = upload.post
+        previous = post.video.name
+        with open(path, 'rb') as f:
+            post.video.save(upload.filename, _PartialFile(f), save=False)
+        post.save(update_fields=['video'])
+        if previous and previous != post.video.name:
+            post.video.storage.delete(previous)
+        if os.path.exists(path):  # storages other than the filesystem copy it
+            os.remove(path)
+        completed_at = timezone.now()
+    finally:
+        if token is not None:
+            _release(upload, token, completed_at=completed_at)
+            upload.completed_at = completed_at
+    return post
+
+
+def abort(upload):
+    if os.path.exists(temp_path(upload)):
+        os.remove(temp_path(upload))
+    upload.delete()
+
+
+def expired():
+    """Unfinished uploads that haven't received a chunk for EXPIRE_AFTER_SECONDS."""
+    cutoff = timezone.now() - datetime.timedelta(seconds=_options()['EXPIRE_AFTER_SECONDS'])
+    return VideoUpload.objects.filter(completed_at__isnull=True, updated_at__lt=cutoff)
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import ASYNC_VIEWS
 from django.contrib.auth.models import AbstractUser
 from .views import (
     FoodViewSet,
@@ -8,6 +9,7 @@ from .views import (
     ExerciseViewSet,
     MealPlanViewSet,
     UserProgressViewSet,
+    UserStatisticViewSet,
     HealthTipsViewSet,
     UserProfileViewSet,
     ExternalAuthViewSet,
@@ -19,8 +21,10 @@ from .views import (
     InsightViewSet,
     UserNotificationViewSet,
     PaymentCreateViewSet,
+    VideoUploadViewSet,
     UserLoginViewSet,
     UserLogoutViewSet,
+    TokenRefreshView,
     ChangePasswordViewSet,
     PasswordResetRequestViewSet,
     PasswordResetViewSet,
@@ -37,6 +41,7 @@ router.register(r'foods', FoodViewSet, basename='foods')
 router.register(r'exercises', ExerciseViewSet, basename='exercises')
 router.register(r'meal-plans', MealPlanViewSet, basename='meal-plans')
 router.register(r'user-progress', UserProgressViewSet, basename='user-progress')
+router.register(r'user-statistics', UserStatisticViewSet, basename='user-statistics')
 router.register(r'health-tips', HealthTipsViewSet, basename='health-tips')
 router.register(r'user-profiles', UserProfileViewSet, basename='user-profiles')
 router.register(r'external-auth', ExternalAuthViewSet, basename='external-auth')
@@ -47,7 +52,8 @@ router.register(r'workout-lessons', WorkoutLessonViewSet, basename='workout-less
 router.register(r'notifications', NotificationViewSet, basename='notifications')
 router.register(r'insights', InsightViewSet, basename='insights')
 router.register(r'user-notifications', UserNotificationViewSet, basename='user-notifications')
-# router.register(r'payments', PaymentCreateViewSet, basename='payments')
+router.register(r'payments', PaymentCreateViewSet, basename='payments')
+router.register(r'video-uploads', VideoUploadViewSet, basename='video-uploads')
 # router.register(r'activity-logs', UserActivityLogViewSet, basename='activity-logs')
 router.register(r'some-models', SomeModelViewSet, basename='some-models')
 
@@ -56,7 +62,15 @@ urlpatterns = [
     path('register/', UserRegistrationView.as_view(), name='user-registration'),
     path('login/', UserLoginViewSet.as_view({'post': 'create'}), name='user-login'),
     path('logout/', UserLogoutViewSet.as_view({'post': 'create'}), name='user-logout'),
+    path('token/refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('change-password/', ChangePasswordViewSet.as_view({'post': 'create'}), name='change-password'),
     path('password-reset-request/', PasswordResetRequestViewSet.as_view({'post': 'create'}), name='password-reset-request'),
     path('password-reset/', PasswordResetViewSet.as_view({'post': 'create'}), name='password-reset'),
 ]
+
+# Async read-only variants, served through config.asgi (api/async_views.py)
+for prefix, view in ASYNC_VIEWS:
+    urlpatterns += [
+        path('async/%s/' % prefix, view.as_view(), name='async-%s-list' % prefix),
+        path('async/%s/<int:pk>/' % prefix, view.as_view(), name='async-%s-detail' % prefix),
+    ]
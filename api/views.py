@@ -1,8 +1,12 @@
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action  
-from django.contrib.auth import login, logout
+from rest_framework.exceptions import PermissionDenied
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.views import TokenRefreshView as BaseTokenRefreshView
+from django.contrib.auth.models import update_last_login
 from django.conf import settings
 import stripe
 from .models import Food 
@@ -11,9 +15,21 @@ from .models import (
     Workout, WorkoutLesson, Notification, Insight,
     UserNotification, Post, Food, Exercise, MealPlan,
     UserProgress, HealthTips, PasswordResetRequest,
-    UserActivityLog, Payment
+    UserActivityLog, Payment, UserStatistic, VideoUpload
 )
+import hashlib
 import uuid
+from django.db.models import Sum
+from .activity import log_activity
+from .payments import enqueue as enqueue_payment
+from . import uploads
+from .revocation import RevocableRefreshToken
+from .filters import nutrient_filters, nutrient_ordering
+from .mixins import (
+    BulkUpsertMixin, CachedResponseMixin, ConditionalGetMixin,
+    EagerLoadingViewSetMixin, RollupMixin, SparseFieldsetViewSetMixin,
+    StreamingListMixin,
+)
 from rest_framework import generics
 from .serializers import (
     UserSerializer, UserProfileSerializer, ExternalAuthSerializer,
@@ -24,7 +40,9 @@ from .serializers import (
     HealthTipsSerializer, UserRegistrationSerializer,
     UserLoginSerializer, ChangePasswordSerializer,
     PasswordResetRequestSerializer, PasswordResetSerializer,
-    UserActivityLogSerializer, PaymentSerializer
+    UserActivityLogSerializer, PaymentSerializer, UserStatisticSerializer,
+    TokenRefreshSerializer, LogoutSerializer, PaymentCreateSerializer,
+    VideoUploadSerializer,
 )
 from rest_framework import viewsets
 from .models import UserActivityLog, PasswordResetRequest
@@ -89,7 +107,7 @@ class PasswordResetRequestViewSet(viewsets.ModelViewSet):
     serializer_class = PasswordResetRequestSerializer
 
 
-class SomeModelViewSet(viewsets.ModelViewSet):
+class SomeModelViewSet(ConditionalGetMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = SomeModel.objects.all()
     serializer_class = SomeModelSerializer
 
@@ -100,11 +118,11 @@ class FoodViewSet(viewsets.ModelViewSet):
     queryset = Food.objects.all()
     serializer_class = FoodSerializer
 
-class PostViewSet(viewsets.ModelViewSet):
+class PostViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Post.objects.all()
     serializer_class = PostSerializer
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()  # Bunda `User` modeli bo'lishi kerak
     serializer_class = UserSerializer  # Bunda to'g'ri serializer aniqlangan bo'lishi kerak
 
@@ -112,53 +130,70 @@ class UserRegistrationView(generics.CreateAPIView):
     queryset = User.objects.all()
     serializer_class = UserRegistrationSerializer
 
-class FoodViewSet(viewsets.ModelViewSet):
+class FoodViewSet(CachedResponseMixin, ConditionalGetMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Food.objects.all()
     serializer_class = FoodSerializer
 
+    def filtered_response(self, **filters):
+        queryset = self.filter_queryset(self.get_queryset()).filter(**filters)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def high_protein(self, request):
-        high_protein_foods = self.queryset.filter(protein__gte=20)
-        serializer = self.get_serializer(high_protein_foods, many=True)
-        return Response(serializer.data)
+        return self.filtered_response(protein__gte=20)
 
     @action(detail=False, methods=['get'])
     def low_carb(self, request):
-        low_carb_foods = self.queryset.filter(carbs__lte=10)
-        serializer = self.get_serializer(low_carb_foods, many=True)
-        return Response(serializer.data)
+        return self.filtered_response(carbs__lte=10)
 
     @action(detail=False, methods=['get'])
     def vegetarian(self, request):
-        vegetarian_foods = self.queryset.filter(is_vegetarian=True)
-        serializer = self.get_serializer(vegetarian_foods, many=True)
-        return Response(serializer.data)
+        return self.filtered_response(is_vegetarian=True)
+
+    @action(detail=False, methods=['get'])
+    def nutrition(self, request):
+        # e.g. ?protein__gte=20&carbs__lte=10&calories__between=100,500&ordering=-protein
+        ordering = nutrient_ordering(request.query_params)
+        if ordering:
+            self.keyset_ordering = ordering
+        return self.filtered_response(**nutrient_filters(request.query_params))
 
     @action(detail=False, methods=['post'])
     def total_calories(self, request):
         food_ids = request.data.get('food_ids', [])
-        selected_foods = self.queryset.filter(id__in=food_ids)
-        total_calories = sum(food.calories for food in selected_foods)
-        return Response({'total_calories': total_calories})
-
-class ExerciseViewSet(viewsets.ModelViewSet):
+        totals = self.queryset.filter(id__in=food_ids).aggregate(
+            total_calories=Sum('calories'),
+            total_protein=Sum('protein'),
+            total_carbs=Sum('carbs'),
+            total_fat=Sum('fat'),
+        )
+        return Response({name: value or 0 for name, value in totals.items()})
+
+class ExerciseViewSet(CachedResponseMixin, ConditionalGetMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Exercise.objects.all()
     serializer_class = ExerciseSerializer
 
     def get_queryset(self):
-        queryset = super().get_queryset()
         min_calories = self.request.query_params.get('min_calories')
+        if min_calories:
+            # Highest first, so the page is read straight off the calories_burned
+            # index. Set before super(), whose .only() adds the ordering columns.
+            self.keyset_ordering = ('-calories_burned', '-id')
+        queryset = super().get_queryset()
         if min_calories:
             queryset = queryset.filter(calories_burned__gte=min_calories)
         return queryset
 
-class MealPlanViewSet(viewsets.ModelViewSet):
+class MealPlanViewSet(CachedResponseMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = MealPlan.objects.all()
     serializer_class = MealPlanSerializer
 
-class UserProgressViewSet(viewsets.ModelViewSet):
+class UserProgressViewSet(BulkUpsertMixin, RollupMixin, StreamingListMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = UserProgress.objects.all()
     serializer_class = UserProgressSerializer
+    rollup_source = 'progress'
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -169,7 +204,19 @@ class UserProgressViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(user=user, date__range=[date_from, date_to])
         return queryset
 
-class HealthTipsViewSet(viewsets.ModelViewSet):
+class UserStatisticViewSet(BulkUpsertMixin, RollupMixin, StreamingListMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
+    queryset = UserStatistic.objects.all()
+    serializer_class = UserStatisticSerializer
+    permission_classes = [IsAuthenticated]
+    rollup_source = 'statistic'
+
+    def get_queryset(self):
+        return super().get_queryset().filter(user=self.request.user)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+class HealthTipsViewSet(CachedResponseMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = HealthTips.objects.all()
     serializer_class = HealthTipsSerializer
 
@@ -180,86 +227,180 @@ class HealthTipsViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(category=category)
         return queryset
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
 
-class ExternalAuthViewSet(viewsets.ModelViewSet):
+class ExternalAuthViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = ExternalAuth.objects.all()
     serializer_class = ExternalAuthSerializer
 
-class GoalViewSet(viewsets.ModelViewSet):
+class GoalViewSet(CachedResponseMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Goal.objects.all()
     serializer_class = GoalSerializer
 
-class UserGoalViewSet(viewsets.ModelViewSet):
+class UserGoalViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = UserGoal.objects.all()
     serializer_class = UserGoalSerializer
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+class WorkoutViewSet(CachedResponseMixin, ConditionalGetMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
 
-class WorkoutLessonViewSet(viewsets.ModelViewSet):
+class WorkoutLessonViewSet(CachedResponseMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = WorkoutLesson.objects.all()
     serializer_class = WorkoutLessonSerializer
 
-class NotificationViewSet(viewsets.ModelViewSet):
+class NotificationViewSet(ConditionalGetMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Notification.objects.all()
     serializer_class = NotificationSerializer
 
-class InsightViewSet(viewsets.ModelViewSet):
+class InsightViewSet(RollupMixin, ConditionalGetMixin, StreamingListMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = Insight.objects.all()
     serializer_class = InsightSerializer
+    rollup_source = 'insight'
 
-class UserNotificationViewSet(viewsets.ModelViewSet):
+class UserNotificationViewSet(EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ModelViewSet):
     queryset = UserNotification.objects.all()
     serializer_class = UserNotificationSerializer
 
-class PaymentCreateViewSet(viewsets.ViewSet):
+class PaymentCreateViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    permission_classes = [IsAuthenticated]
+    serializer_class = PaymentSerializer
+
+    def get_queryset(self):
+        return Payment.objects.filter(user_profile__user=self.request.user)
+
     def create(self, request):
-        user_profile = UserProfile.objects.get(user=request.user)
-        amount = request.data.get('amount')
-        try:
-            amount_in_cents = int(float(amount) * 100)
-        except ValueError:
-            return Response({'error': 'Invalid amount'}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = PaymentCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        user_profile = UserProfile.objects.filter(user=request.user).first()
+        if user_profile is None:
+            return Response({'error': 'User profile not found'}, status=status.HTTP_400_BAD_REQUEST)
+
+        defaults = {'user_profile': user_profile, 'amount': serializer.validated_data['amount']}
+        client_key = request.headers.get('Idempotency-Key')
+        if client_key:
+            # A retried POST returns the payment it already created.
+            key = hashlib.sha256(('%s:%s' % (user_profile.pk, client_key)).encode()).hexdigest()
+            payment, created = Payment.objects.get_or_create(idempotency_key=key, defaults=defaults)
+        else:
+            payment, created = Payment.objects.create(**defaults), True
+        if created:
+            enqueue_payment(payment)
+        # Charged by the payment worker; poll GET /payments/<id>/ for the outcome.
+        return Response(PaymentSerializer(payment).data, status=status.HTTP_202_ACCEPTED)
+
+class VideoUploadViewSet(mixins.RetrieveModelMixin, mixins.DestroyModelMixin, viewsets.GenericViewSet):
+    permission_classes = [IsAuthenticated]
+    serializer_class = VideoUploadSerializer
+
+    def get_queryset(self):
+        return VideoUpload.objects.filter(user=self.request.user).select_related('post')
+
+    def upload_response(self, upload, status_code=status.HTTP_200_OK, data=None):
+        response = Response(data, status=status_code)
+        response['Upload-Offset'] = str(upload.offset)
+        response['Upload-Length'] = str(upload.size)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+    def error_response(self, upload, error):
+        data = {'error': str(error)}
+        if upload is not None:
+            data['offset'] = upload.offset
+        response = Response(data, status=error.status_code)
+        if upload is not None:
+            response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    def check_can_change_posts(self):
+        # Posts have no owner; replacing a video is an edit to the post, so
+        # it takes the same permission as changing posts in the admin.
+        if not self.request.user.has_perm('api.change_post'):
+            raise PermissionDenied('You do not have permission to change posts.')
 
+    def create(self, request):
+        self.check_can_change_posts()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         try:
-            charge = stripe.Charge.create(
-                amount=amount_in_cents,
-                currency='usd',
-                customer=user_profile.stripe_customer_id,
-                description=f'Charge for {user_profile.user.email}'
-            )
-
-            payment = Payment.objects.create(
-                user_profile=user_profile,
-                stripe_charge_id=charge.id,
-                amount=amount,
-                success=True
-            )
-            return Response(PaymentSerializer(payment).data, status=status.HTTP_201_CREATED)
-        except stripe.error.StripeError as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            upload = uploads.start(request.user, **serializer.validated_data)
+        except uploads.UploadError as e:
+            return self.error_response(None, e)
+        response = self.upload_response(upload, status.HTTP_201_CREATED, self.get_serializer(upload).data)
+        response['Location'] = request.build_absolute_uri('%s/' % upload.pk)
+        return response
+
+    def retrieve(self, request, pk=None):
+        upload = self.get_object()
+        return self.upload_response(upload, data=self.get_serializer(upload).data)
+
+    def partial_update(self, request, pk=None):
+        # The body is the raw chunk; request.data is never touched, so DRF
+        # doesn't parse or buffer it.
+        upload = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response({'error': 'Upload-Offset and Content-Length headers are required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            checksum = uploads.parse_checksum(request.headers.get('Upload-Checksum'))
+            uploads.write_chunk(upload, offset, request.stream, length, checksum)
+        except uploads.UploadError as e:
+            return self.error_response(upload, e)
+        return self.upload_response(upload, status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        upload = self.get_object()
+        self.check_can_change_posts()
+        try:
+            post = uploads.finalize(upload)
+        except uploads.UploadError as e:
+            return self.error_response(upload, e)
+        return Response(PostSerializer(post, context=self.get_serializer_context()).data)
+
+    def perform_destroy(self, instance):
+        uploads.abort(instance)
 
 class UserLoginViewSet(viewsets.ViewSet):
+    # Credentials only; a stale bearer header must not block a new login.
+    authentication_classes = []
+
     def create(self, request):
         serializer = UserLoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data
-            login(request, user)
-            return Response({"message": "Login successful."}, status=status.HTTP_200_OK)
+            refresh = RevocableRefreshToken.for_user(user)
+            if jwt_settings.UPDATE_LAST_LOGIN:
+                update_last_login(None, user)
+            log_activity(user, 'login')
+            return Response({
+                "message": "Login successful.",
+                "refresh": str(refresh),
+                "access": str(refresh.access_token),
+            }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class UserLogoutViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
     def create(self, request):
-        request.user.auth_token.delete()
-        logout(request)
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            RevocableRefreshToken(serializer.validated_data['refresh']).revoke()
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        log_activity(request.user, 'logout')
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+class TokenRefreshView(BaseTokenRefreshView):
+    serializer_class = TokenRefreshSerializer
+
 class ChangePasswordViewSet(viewsets.ViewSet):
     permission_classes = [IsAuthenticated]
 
@@ -301,7 +442,7 @@ class PasswordResetViewSet(viewsets.ViewSet):
             return Response({"error": "Invalid or used token."}, status=status.HTTP_400_BAD_REQUEST)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-class UserActivityLogViewSet(viewsets.ReadOnlyModelViewSet):
+class UserActivityLogViewSet(StreamingListMixin, EagerLoadingViewSetMixin, SparseFieldsetViewSetMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = UserActivityLogSerializer
     permission_classes = [IsAuthenticated]
 
@@ -0,0 +1,96 @@
+import statistics
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+from django.template import engines
+from django.template.loader import render_to_string
+from django.test import RequestFactory, override_settings
+
+from api.benchmarking import throwaway_database
+from appui import highlight
+from appui.models import API_Model, Messages
+from appui.views import Message, list_version
+
+BENCH_PREFIX = 'bench-tpl'
+
+CODE = '''def get(request, pk):
+    food = Food.objects.get(pk=pk)
+    return Response(FoodSerializer(food).data)
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        "Time rendering the appui pages over --rows rows: the home page's "
+        "Messages loop through the view, and show.html's API_Model loop "
+        "rendered with every row at once. Each page is timed without fragment "
+        "caching, with a cold fragment cache, warm, and warm after one row "
+        "changed (the list fragment misses, the other rows' fragments hit). "
+        "Runs against a scratch database created and dropped like the test "
+        "runner's, so the pages hold exactly --rows rows."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help='Warm renders to average.')
+
+    def handle(self, *args, **options):
+        with throwaway_database():
+            self.run(options['rows'], options['repeat'])
+
+    def run(self, rows, repeat):
+        self.seed(rows)
+        request = RequestFactory().get('/')
+        apis = list(API_Model.objects.order_by('pk'))
+        message = Messages.objects.first()
+
+        def render_show():
+            context = {'appui': apis, 'list_version': list_version(API_Model)}
+            return render_to_string('show.html', context, request)
+
+        cases = [
+            ('home', lambda: Message.as_view()(request).render(), message),
+            ('show', render_show, apis[0]),
+        ]
+        for label, render, row in cases:
+            with override_settings(CACHES={
+                **settings.CACHES,
+                'template_fragments': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+            }):
+                uncached = self.measure(render, repeat)
+            caches['template_fragments'].clear()
+            cold = self.measure(render, 1)
+            warm = self.measure(render, repeat)
+            row.save()
+            changed = self.measure(render, 1)
+            self.stdout.write(
+                '%-5s %6d rows  no fragment cache %8.1f ms  cold %8.1f ms  warm %8.1f ms  '
+                'one row changed %8.1f ms' % (label, rows, uncached, cold, warm, changed))
+        self.stdout.write('Template loaders: %s' % ', '.join(
+            type(loader).__module__ for loader in engines['django'].engine.template_loaders))
+
+    def seed(self, rows):
+        code_html, key = highlight.render(CODE, 'language-python'), highlight.highlight_key(CODE, 'language-python')
+        API_Model.objects.bulk_create(
+            (API_Model(name='%s-%d' % (BENCH_PREFIX, i), text='Returns one food', code=CODE,
+                       api='/api/v1/foods/%d/' % i, type='Get', type_lang='language-python',
+                       code_html=code_html, code_html_key=key)
+             for i in range(rows)),
+            batch_size=1000,
+        )
+        # The home page lists every message; the scratch database holds only these.
+        Messages.objects.bulk_create(
+            (Messages(name='%s-%d' % (BENCH_PREFIX, i), text='Deployed build %d to staging.' % i)
+             for i in range(rows)),
+            batch_size=1000,
+        )
+
+    def measure(self, render, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            render()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.mean(timings)
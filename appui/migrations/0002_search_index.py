@@ -0,0 +1,34 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:40
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from appui import search
+
+    for model in search.INDEXES:
+        for sql in search.create_index_sql(model):
+            schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from appui import search
+
+    for model in search.INDEXES:
+        for sql in search.drop_index_sql(model):
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appui', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
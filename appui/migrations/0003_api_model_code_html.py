@@ -0,0 +1,47 @@
+# Generated by Django 5.0.7 on 2026-10-18 23:55
+
+from django.db import migrations, models
+
+
+def render_code(apps, schema_editor):
+    from appui import highlight
+
+    API_Model = apps.get_model('appui', 'API_Model')
+    for api in API_Model.objects.all().iterator():
+        api.code_html = highlight.render(api.code, api.type_lang)
+        api.code_html_key = highlight.highlight_key(api.code, api.type_lang)
+        api.save(update_fields=['code_html', 'code_html_key'])
+
+
+def rebuild_search_index(apps, schema_editor):
+    # SQLite rebuilt appui_api_model for the new columns, dropping its
+    # search triggers with the old table.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from appui import search
+    from appui.models import API_Model
+
+    for sql in search.drop_index_sql(API_Model) + search.create_index_sql(API_Model):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appui', '0002_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='api_model',
+            name='code_html',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='api_model',
+            name='code_html_key',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.RunPython(rebuild_search_index, migrations.RunPython.noop),
+        migrations.RunPython(render_code, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.7 on 2026-10-19 00:20
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+def rebuild_search_indexes(apps, schema_editor):
+    # Adding the columns rebuilt both tables on SQLite, dropping their
+    # search triggers with the old tables.
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    from appui import search
+
+    for model in search.INDEXES:
+        for sql in search.drop_index_sql(model) + search.create_index_sql(model):
+            schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appui', '0003_api_model_code_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='api_model',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='messages',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(rebuild_search_indexes, migrations.RunPython.noop),
+    ]
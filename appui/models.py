@@ -1,4 +1,7 @@
 from django.db import models
+from django.utils.safestring import mark_safe
+
+from . import highlight
 
 # Create your models here.
 class API_Model(models.Model):
@@ -147,14 +150,34 @@ class API_Model(models.Model):
 
     type = models.CharField(max_length=20, choices=TYPE_CHOICES)
     type_lang = models.CharField(max_length=100,choices=type_lang)
+    # Pygments HTML for `code`, and the hash of (type_lang, code) it was rendered from
+    code_html = models.TextField(blank=True, default='', editable=False)
+    code_html_key = models.CharField(max_length=64, blank=True, default='', editable=False)
+    # Version of the {% cache %} fragments; queryset.update() must set it too
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        key = highlight.highlight_key(self.code, self.type_lang)
+        if key != self.code_html_key:
+            self.code_html, self.code_html_key = highlight.render(self.code, self.type_lang), key
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'code_html', 'code_html_key'}
+        super().save(*args, **kwargs)
+
+    def highlighted_code(self):
+        key = highlight.highlight_key(self.code, self.type_lang)
+        if key == self.code_html_key:
+            return mark_safe(self.code_html)
+        return highlight.cached_render(self.code, self.type_lang, key)
+
 class Messages(models.Model):
     name = models.CharField(max_length=100)
     text = models.TextField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
     
     def __str__(self):
         return self.name
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+Full-text search over ``Messages`` and ``API_Model``.
+
+On SQLite each model has an external-content FTS5 table (created in
+migration 0002) that triggers keep in step with every insert, update and
+delete, bulk and raw SQL included. Searches go through the index, are
+ordered by bm25 with ``name`` weighted highest, and carry a highlighted
+``snippet``. Other database backends fall back to ``icontains`` filters
+without ranking or snippets.
+
+SQLite rebuilds a table for most column changes, which drops its
+triggers. A migration that alters ``appui_messages`` or
+``appui_api_model`` must re-run ``drop_index_sql`` and
+``create_index_sql`` for that model (see 0003).
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import API_Model, Messages
+
+# Table, indexed columns and their bm25 weights.
+INDEXES = {
+    Messages: ('appui_messages_fts', {'name': 10.0, 'text': 1.0}),
+    API_Model: ('appui_api_model_fts', {'name': 10.0, 'text': 1.0, 'code': 1.0, 'api': 5.0}),
+}
+
+# snippet() markers; plain control characters so the text around them can
+# be escaped before they become <mark> tags.
+_OPEN, _CLOSE = '\x02', '\x03'
+_TOKEN = re.compile(r'\w+')
+
+
+def create_index_sql(model):
+    table, columns = INDEXES[model]
+    source = model._meta.db_table
+    names = ', '.join(columns)
+    new = ', '.join('new.%s' % c for c in columns)
+    old = ', '.join('old.%s' % c for c in columns)
+    return [
+        "CREATE VIRTUAL TABLE %s USING fts5(%s, content='%s', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')" % (table, names, source),
+        "CREATE TRIGGER %s_ai AFTER INSERT ON %s BEGIN "
+        "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (table, source, table, names, new),
+        "CREATE TRIGGER %s_ad AFTER DELETE ON %s BEGIN "
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); END" % (table, source, table, table, names, old),
+        "CREATE TRIGGER %s_au AFTER UPDATE ON %s BEGIN "
+        "INSERT INTO %s(%s, rowid, %s) VALUES ('delete', old.id, %s); "
+        "INSERT INTO %s(rowid, %s) VALUES (new.id, %s); END" % (table, source, table, table, names, old, table, names, new),
+        "INSERT INTO %s(%s) VALUES ('rebuild')" % (table, table),
+    ]
+
+
+def drop_index_sql(model):
+    table = INDEXES[model][0]
+    return ['DROP TRIGGER IF EXISTS %s_%s' % (table, suffix) for suffix in ('ai', 'ad', 'au')] + [
+        'DROP TABLE IF EXISTS %s' % table,
+    ]
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every word must match, as a prefix."""
+    return ' '.join('"%s"*' % token for token in _TOKEN.findall(query))
+
+
+def highlight(snippet):
+    return mark_safe(escape(snippet).replace(_OPEN, '<mark>').replace(_CLOSE, '</mark>'))
+
+
+def search(model, query, limit=50):
+    """
+    Up to ``limit`` ``model`` instances matching ``query``, best first, each
+    with a ``snippet`` of the matching text (safe HTML).
+    """
+    if connection.vendor != 'sqlite':
+        return _search_fallback(model, query, limit)
+    expression = match_expression(query)
+    if not expression:
+        return []
+    table, columns = INDEXES[model]
+    weights = ', '.join(str(w) for w in columns.values())
+    results = list(model.objects.raw(
+        "SELECT m.*, snippet({t}, -1, %s, %s, '…', 16) AS fts_snippet "
+        "FROM {t} JOIN {source} m ON m.id = {t}.rowid "
+        "WHERE {t} MATCH %s ORDER BY bm25({t}, {weights}) LIMIT %s".format(
+            t=table, source=model._meta.db_table, weights=weights),
+        [_OPEN, _CLOSE, expression, limit],
+    ))
+    for obj in results:
+        obj.snippet = highlight(obj.fts_snippet)
+    return results
+
+
+def _search_fallback(model, query, limit):
+    condition = Q()
+    for column in INDEXES[model][1]:
+        condition |= Q(**{'%s__icontains' % column: query})
+    results = list(model.objects.filter(condition)[:limit])
+    for obj in results:
+        obj.snippet = escape(obj.text[:200])
+    return results
@@ -1,3 +1,171 @@
-from django.test import TestCase
+import gzip
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import caches
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, TestCase, override_settings
+
+from .models import API_Model, Messages
+from config.staticfiles import PrecompressedStaticMiddleware
+from . import highlight, search
+
+
+class SearchIndexTests(TestCase):
+    """The FTS5 index follows the tables through its triggers."""
+
+    def setUp(self):
+        self.login = API_Model.objects.create(name='Login', text='Returns a JWT pair', code='POST /login/',
+                                              api='/api/v1/login/', type='Get', type_lang='language-http')
+        self.foods = API_Model.objects.create(name='Foods', text='Catalog of foods with login-free reads',
+                                              code='GET /foods/', api='/api/v1/foods/', type='Get',
+                                              type_lang='language-http')
+        Messages.objects.create(name='Deploy', text='Release <b>notes</b> for the payments worker')
+
+    def test_ranked_by_name_first(self):
+        results = search.search(API_Model, 'login')
+        self.assertEqual(results, [self.login, self.foods])
+        self.assertIn('<mark>Login</mark>', results[0].snippet)
+
+    def test_prefix_and_escaped_snippet(self):
+        [message] = search.search(Messages, 'paym')
+        self.assertIn('&lt;b&gt;notes&lt;/b&gt;', message.snippet)
+        self.assertIn('<mark>payments</mark>', message.snippet)
+
+    def test_updates_and_deletes_are_indexed(self):
+        self.foods.name = 'Meals'
+        self.foods.save()
+        self.assertEqual(search.search(API_Model, 'meals'), [self.foods])
+        self.assertEqual(search.search(API_Model, 'foods'), [self.foods])  # still in text and api
+        API_Model.objects.filter(pk=self.login.pk).delete()
+        self.assertEqual(search.search(API_Model, 'jwt'), [])
+
+    def test_query_syntax_is_not_passed_through(self):
+        self.assertEqual(search.search(Messages, 'notes OR "'), [])
+        self.assertEqual(search.search(Messages, '*'), [])
+
+    def test_search_page(self):
+        response = self.client.get('/search', {'q': 'worker'})
+        self.assertContains(response, '<mark>worker</mark>', html=False)
+        self.assertContains(response, 'No APIs found.')
+
+
+class HighlightTests(TestCase):
+    """Code is highlighted on save, and only when code or language change."""
+
+    def create(self, **kwargs):
+        fields = dict(name='Foods', text='List foods', code='def get(request):\n    return foods\n',
+                      api='/api/v1/foods/', type='Get', type_lang='language-python')
+        fields.update(kwargs)
+        return API_Model.objects.create(**fields)
+
+    def test_rendered_on_save(self):
+        api = self.create()
+        self.assertIn('<span class="k">def</span>', api.code_html)
+        self.assertEqual(api.code_html_key, highlight.highlight_key(api.code, api.type_lang))
+
+        with mock.patch.object(highlight, 'render', wraps=highlight.render) as render:
+            api.name = 'Meals'
+            api.save()
+            self.assertFalse(render.called)
+            api.type_lang = 'language-ruby'
+            api.save(update_fields=['type_lang'])
+            self.assertTrue(render.called)
+        api.refresh_from_db()
+        self.assertEqual(api.code_html_key, highlight.highlight_key(api.code, 'language-ruby'))
+
+    def test_rows_written_without_save_use_the_cache(self):
+        api = self.create()
+        API_Model.objects.filter(pk=api.pk).update(code='<script>alert(1)</script>', type_lang='language-wiki')
+        api.refresh_from_db()
+        self.assertNotIn('<script>', api.highlighted_code())
+        self.assertIn('&lt;script&gt;', api.highlighted_code())
+
+    def test_show_page_is_paginated(self):
+        API_Model.objects.bulk_create(
+            API_Model(name='api-%d' % i, text='', code='x = %d' % i, api='/x/', type='Get',
+                      type_lang='language-python')
+            for i in range(25)
+        )
+        response = self.client.get('/show')
+        self.assertEqual(len(response.context['appui']), 20)
+        self.assertContains(response, '<span class="n">x</span>')
+        self.assertContains(response, '?page=2')
+        self.assertNotContains(response, 'prism')
+
+
+class FragmentCacheTests(TestCase):
+    """The list fragments follow row changes without rendering the rows again."""
+
+    def setUp(self):
+        caches['template_fragments'].clear()
+        self.message = Messages.objects.create(name='Deploy', text='First build')
+        Messages.objects.create(name='Rollback', text='Reverted')
+
+    def test_warm_page_skips_the_list_query(self):
+        self.client.get('/')
+        with self.assertNumQueries(1):  # list_version only
+            response = self.client.get('/')
+        self.assertContains(response, 'First build')
+
+    def test_saved_and_deleted_rows_show_up(self):
+        self.client.get('/')
+        self.message.text = 'Second build'
+        self.message.save()
+        self.assertContains(self.client.get('/'), 'Second build')
+        self.message.delete()
+        self.assertNotContains(self.client.get('/'), 'Deploy')
+
+
+class StaticAssetTests(TestCase):
+    """collectstatic output is served hashed, precompressed and immutable."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        settings_override = override_settings(STATIC_ROOT=directory.name)
+        settings_override.enable()
+        cls.addClassCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.hashed = staticfiles_storage.url('css/pygments.css')
+
+    def test_gzip_variant_is_immutable(self):
+        self.assertRegex(self.hashed, r'^/static/css/pygments\.[0-9a-f]{12}\.css$')
+        response = self.client.get(self.hashed, headers={'Accept-Encoding': 'gzip, deflate'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn(b'.highlight', gzip.decompress(b''.join(response.streaming_content)))
+
+    def test_identity_and_unhashed_names(self):
+        response = self.client.get(self.hashed, headers={'Accept-Encoding': 'gzip;q=0'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        response = self.client.get('/static/css/pygments.css')
+        self.assertNotIn('immutable', response['Cache-Control'])
+        again = self.client.get('/static/css/pygments.css', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(again.status_code, 304)
+
+    async def test_async_stack_stays_async(self):
+        async def view(request):
+            return HttpResponse('page')
+
+        middleware = PrecompressedStaticMiddleware(view)
+        factory = AsyncRequestFactory()
+        with mock.patch('config.staticfiles.sync_to_async', wraps=sync_to_async) as to_thread:
+            self.assertEqual((await middleware(factory.get('/api/v1/foods/'))).content, b'page')
+            to_thread.assert_not_called()
+            response = await middleware(factory.get(self.hashed, headers={'Accept-Encoding': 'gzip'}))
+            to_thread.assert_called_once()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+
+    def test_pages_link_hashed_assets(self):
+        bootstrap = staticfiles_storage.url('bootstrap-examples/assets/dist/css/bootstrap.min.css')
+        self.assertRegex(bootstrap, r'bootstrap\.min\.[0-9a-f]{12}\.css$')
+        self.assertContains(self.client.get('/'), bootstrap)
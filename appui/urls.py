@@ -4,4 +4,5 @@ from .views import *
 urlpatterns = [
     path('',Message.as_view(), name='home'),
     path('show',Show.as_view(), name='show'),
-]
\ No newline at end of file
+    path('search',Search.as_view(), name='search'),
+]
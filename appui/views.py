@@ -1,18 +1,33 @@
+from django.db.models import Count, Max
 from django.shortcuts import render
 from django.views.generic import*
 from django.views.generic import ListView
 from .models import Messages
 from .models import *
+from . import search
 # Create your views here.
 
 
+def list_version(model):
+    # Changes whenever a row is saved, added or deleted; keys the cached
+    # list fragments, so every worker process sees the same version.
+    stats = model.objects.aggregate(count=Count('pk'), updated=Max('updated_at'))
+    return '%s-%s' % (stats['count'], stats['updated'].timestamp() if stats['updated'] else 0)
+
+
 # class Base(TemplateView):
 #     template_name = "base.html"
 
 class Show(ListView):
     template_name = "show.html"
-    model = API_Model
+    queryset = API_Model.objects.order_by('pk')
     context_object_name = "appui"
+    paginate_by = 20
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['list_version'] = list_version(API_Model)
+        return context
 
 class Message(ListView):
     template_name = "base.html"
@@ -23,6 +38,22 @@ class Message(ListView):
         
         query = self.request.GET.get('q')
         if query:
-            return Messages.objects.filter(name__icontains=query) | Messages.objects.filter(api__icontains=query)
+            return search.search(Messages, query)
         else:
-            return Messages.objects.all()
\ No newline at end of file
+            return Messages.objects.all()
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['list_version'] = list_version(Messages)
+        return context
+
+class Search(TemplateView):
+    template_name = "search.html"
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        context['query'] = query
+        context['messages_found'] = search.search(Messages, query) if query else []
+        context['apis_found'] = search.search(API_Model, query) if query else []
+        return context
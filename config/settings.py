@@ -32,11 +32,14 @@ INSTALLED_APPS = [
     'api.apps.ApiConfig',  # API app
     'rest_framework',  # Django REST Framework
     'rest_framework_simplejwt',  # JWT Authentication
+    'rest_framework_simplejwt.token_blacklist',  # Refresh token blacklist
 ]
 
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'config.staticfiles.PrecompressedStaticMiddleware',  # Hashed, precompressed STATIC_ROOT
+    'api.db_routing.PrimaryReplicaMiddleware',  # Read replica routing context
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Locale Middleware for translation
@@ -49,12 +52,13 @@ MIDDLEWARE = [
 # URL configuration
 ROOT_URLCONF = 'config.urls'
 
-# Templates
+# Templates. In production the loaders are wrapped explicitly in the cached
+# loader, so each template is read and compiled once per process.
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [str(os.path.join(BASE_DIR, 'templates'))],
-        'APP_DIRS': True,
+        'APP_DIRS': DEBUG,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -65,29 +69,149 @@ TEMPLATES = [
         },
     },
 ]
+if not DEBUG:
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 # WSGI application
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# Database configuration (SQLite for development, consider using PostgreSQL/MySQL for production)
-DATABASES = {
-    'default': {
+# Database configuration. DB_PROFILE selects:
+#   development - SQLite, a new connection per request, default pragmas
+#   production  - SQLite with persistent, health-checked connections and
+#                 the api.sqlite.PRODUCTION_PRAGMAS (WAL, busy_timeout, ...)
+#   postgres    - PostgreSQL with persistent connections; set
+#                 DB_PGBOUNCER=True when behind PgBouncer transaction pooling
+DB_PROFILE = os.getenv('DB_PROFILE', 'development')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '600'))
+
+if DB_PROFILE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DB_NAME', 'your_db_name'),
+            'USER': os.getenv('DB_USER', 'your_db_user'),
+            'PASSWORD': os.getenv('DB_PASSWORD', 'your_db_password'),
+            'HOST': os.getenv('DB_HOST', 'localhost'),
+            'PORT': os.getenv('DB_PORT', '5432'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            # PgBouncer (transaction mode) can't keep named cursors across transactions
+            'DISABLE_SERVER_SIDE_CURSORS': os.getenv('DB_PGBOUNCER', 'False') == 'True',
+            'OPTIONS': {'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', '5'))},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    if DB_PROFILE == 'production':
+        DATABASES['default'].update({
+            'NAME': BASE_DIR / os.getenv('DB_NAME', 'db.sqlite3'),
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+        })
+
+# Run on every new SQLite connection (api.sqlite.configure_connection):
+# readers don't block the writer (WAL), fsync only at checkpoints, wait
+# instead of failing with "database is locked", keep hot pages in memory.
+# Empty in development so the committed db.sqlite3 stays in rollback
+# journal mode (WAL would add -wal/-shm files next to it).
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '5000')),
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,  # negative = KiB, i.e. ~64 MB
+}
+SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS if DB_PROFILE == 'production' else {}
+
+# Read replicas: DB_REPLICAS is a comma-separated list of SQLite files
+# (e.g. "replica1.sqlite3"). Locally, `manage.py replicate_sqlite` copies
+# the primary into them. GET/HEAD reads go to a replica, writes to the
+# primary, and a user who just wrote reads from the primary for
+# DB_STICKY_SECONDS.
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(filter(None, os.getenv('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES['replica%d' % _index] = {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / _name.strip(),
+        'CONN_MAX_AGE': DATABASES['default'].get('CONN_MAX_AGE', 0),
+        'CONN_HEALTH_CHECKS': DATABASES['default'].get('CONN_HEALTH_CHECKS', False),
     }
+    DATABASE_REPLICAS.append('replica%d' % _index)
+
+DATABASE_ROUTERS = ['api.db_routing.PrimaryReplicaRouter']
+DATABASE_ROUTING = {
+    'REPLICAS': DATABASE_REPLICAS,
+    'STICKY_SECONDS': float(os.getenv('DB_STICKY_SECONDS', '5')),
+    # Read-your-writes pins; every worker must see them (CACHES['shared']).
+    'CACHE_ALIAS': os.getenv('DB_STICKY_CACHE_ALIAS', 'shared'),
+}
+
+# Caches. 'api_responses' backs the catalog response cache (api/cache.py):
+# API_CACHE_BACKEND=file (the default) is shared between workers on the
+# same host, so a write invalidates the cached lists on all of them.
+# API_CACHE_BACKEND=locmem is a per-process LRU bounded by MAX_ENTRIES; it
+# fails the api.E003 check unless DEBUG is on (runserver, one process).
+API_CACHE_BACKEND = os.getenv('API_CACHE_BACKEND', 'file')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api_responses': {
+        'BACKEND': (
+            'django.core.cache.backends.filebased.FileBasedCache'
+            if API_CACHE_BACKEND == 'file'
+            else 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': (
+            os.getenv('API_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'api_responses'))
+            if API_CACHE_BACKEND == 'file'
+            else 'api-responses'
+        ),
+        'TIMEOUT': int(os.getenv('API_CACHE_TTL', '300')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('API_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+    # State every worker must see (api.checks): on the filesystem by default,
+    # which covers workers on one host; use Redis or Memcached across hosts,
+    # e.g. SHARED_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+    # SHARED_CACHE_LOCATION=redis://127.0.0.1:6379/1.
+    'shared': {
+        'BACKEND': os.getenv('SHARED_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('SHARED_CACHE_LOCATION', os.path.join(BASE_DIR, 'cache', 'shared')),
+    },
+    # {% cache %} fragments of the appui pages. Keys carry the row's
+    # updated_at, so a changed row gets a new fragment; superseded ones
+    # expire (the templates set a day) or are culled past MAX_ENTRIES.
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'template-fragments',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('TEMPLATE_FRAGMENT_CACHE_MAX_ENTRIES', '50000')),
+        },
+    },
 }
 
-# Uncomment and configure for PostgreSQL in production
-# DATABASES = {
-#     'default': {
-#         'ENGINE': 'django.db.backends.postgresql',
-#         'NAME': os.getenv('DB_NAME', 'your_db_name'),
-#         'USER': os.getenv('DB_USER', 'your_db_user'),
-#         'PASSWORD': os.getenv('DB_PASSWORD', 'your_db_password'),
-#         'HOST': os.getenv('DB_HOST', 'localhost'),
-#         'PORT': os.getenv('DB_PORT', '5432'),
-#     }
-# }
+# Buffered UserActivityLog writes (api/activity.py)
+ACTIVITY_LOG = {
+    'ENABLED': os.getenv('ACTIVITY_LOG_BUFFERED', 'True') == 'True',
+    'MAX_QUEUE': int(os.getenv('ACTIVITY_LOG_MAX_QUEUE', '10000')),
+    'BATCH_SIZE': int(os.getenv('ACTIVITY_LOG_BATCH_SIZE', '500')),
+    'FLUSH_INTERVAL_MS': int(os.getenv('ACTIVITY_LOG_FLUSH_INTERVAL_MS', '200')),
+    'POLICY': os.getenv('ACTIVITY_LOG_POLICY', 'drop'),  # 'drop' or 'block'
+    'BLOCK_TIMEOUT_MS': int(os.getenv('ACTIVITY_LOG_BLOCK_TIMEOUT_MS', '50')),
+}
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -122,7 +246,22 @@ LOCALE_PATHS = [
 AUTH_USER_MODEL = 'api.User'
 
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
+STATICFILES_DIRS = [
+    os.path.join(BASE_DIR, 'static'),
+    ('bootstrap-examples', os.path.join(BASE_DIR, 'templates', 'bootstrap-5.3.3-examples')),
+]
+# collectstatic writes hashed copies plus .gz/.br siblings here (config/staticfiles.py)
+STATIC_ROOT = os.getenv('STATIC_ROOT', os.path.join(BASE_DIR, 'staticfiles'))
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'config.staticfiles.CompressedManifestStaticFilesStorage'},
+}
+STATIC_ASSETS = {
+    # Serve STATIC_ROOT from the app; turn off when a proxy or CDN serves it.
+    'SERVE': os.getenv('STATIC_SERVE', 'True') == 'True',
+    'MAX_AGE': 60 * 60 * 24 * 365,
+    'UNHASHED_MAX_AGE': int(os.getenv('STATIC_UNHASHED_MAX_AGE', '60')),
+}
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
@@ -130,8 +269,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        # JWTAuthentication with the user row served from a short-TTL cache
+        # when AUTH_USER_CACHE is configured
+        'api.authentication.CachedJWTAuthentication',
     ),
+    # Keyset (cursor) pagination: no COUNT(*), bounded page size
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
 }
 
 # JWT settings
@@ -142,10 +286,55 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
 }
 
+# Refresh-token revocation is checked in memory (api.revocation); other
+# workers' blacklists are picked up at most SYNC_INTERVAL seconds later.
+TOKEN_REVOCATION = {
+    'SYNC_INTERVAL': float(os.getenv('TOKEN_REVOCATION_SYNC_INTERVAL', '5')),
+}
+
+# User cache for api.authentication.CachedJWTAuthentication. Off unless
+# AUTH_USER_CACHE_ALIAS names a cache every worker shares, e.g. 'shared' on
+# Redis: deactivations and password changes must reach all of them. A
+# LocMemCache alias fails the api.E001 check unless DEBUG is on.
+AUTH_USER_CACHE = {
+    'ALIAS': os.getenv('AUTH_USER_CACHE_ALIAS') or None,
+    'TIMEOUT': int(os.getenv('AUTH_USER_CACHE_TTL', '60')),
+}
+
 # Stripe API keys (use environment variables for security)
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', 'your-stripe-secret-key')
 STRIPE_PUBLISHABLE_KEY = os.getenv('STRIPE_PUBLISHABLE_KEY', 'your-publishable-key')
 
+# Payment processing (api/payments.py). PAYMENT_GATEWAY=api.payments.FakeGateway
+# runs without Stripe. Pending payments left over by the in-process workers
+# are charged by `manage.py process_payments`.
+PAYMENTS = {
+    'GATEWAY': os.getenv('PAYMENT_GATEWAY', 'api.payments.StripeGateway'),
+    'CURRENCY': 'usd',
+    'WORKERS': int(os.getenv('PAYMENT_WORKERS', '4')),
+    'RUN_IN_PROCESS': os.getenv('PAYMENT_RUN_IN_PROCESS', 'True') == 'True',
+    'MAX_ATTEMPTS': int(os.getenv('PAYMENT_MAX_ATTEMPTS', '5')),
+    'STALE_AFTER_SECONDS': int(os.getenv('PAYMENT_STALE_AFTER_SECONDS', '300')),
+    'FAKE_LATENCY_MS': int(os.getenv('PAYMENT_FAKE_LATENCY_MS', '0')),
+}
+
+# Resized copies of profile and post images (api/images.py)
+IMAGE_DERIVATIVES = {
+    'SIZES': {'thumb': 128, 'small': 320, 'medium': 640, 'large': 1280},
+    'FORMAT': os.getenv('IMAGE_DERIVATIVE_FORMAT', 'webp'),
+    'QUALITY': int(os.getenv('IMAGE_DERIVATIVE_QUALITY', '80')),
+    'WORKERS': int(os.getenv('IMAGE_WORKERS', '2')),
+    'RUN_IN_PROCESS': os.getenv('IMAGE_RUN_IN_PROCESS', 'True') == 'True',
+}
+
+# Resumable Post.video uploads (api/uploads.py)
+VIDEO_UPLOADS = {
+    'MAX_SIZE': int(os.getenv('VIDEO_UPLOAD_MAX_SIZE', str(2 * 1024 ** 3))),
+    'MAX_CHUNK_SIZE': int(os.getenv('VIDEO_UPLOAD_MAX_CHUNK_SIZE', str(16 * 1024 ** 2))),
+    'TEMP_DIR': os.getenv('VIDEO_UPLOAD_TEMP_DIR') or None,  # default: MEDIA_ROOT/uploads/partial
+    'EXPIRE_AFTER_SECONDS': int(os.getenv('VIDEO_UPLOAD_EXPIRE_AFTER_SECONDS', str(60 * 60 * 24))),
+}
+
 # Django translation support settings
 USE_L10N = True
 
@@ -0,0 +1,192 @@
+"""
+Hashed, precompressed static files.
+
+``collectstatic`` runs through ``CompressedManifestStaticFilesStorage``:
+every file gets a content-hashed copy (``style.css`` ->
+``style.5f1c2b9e0a7d.css``), and each text asset gets ``.gz`` and, when the
+``brotli`` package is installed, ``.br`` siblings, written once at build
+time.
+
+``PrecompressedStaticMiddleware`` serves ``STATIC_URL`` from
+``STATIC_ROOT``. It sends the best precompressed variant the client
+accepts (br, then gzip) and marks hashed names ``immutable`` for a year, so repeat page loads
+revalidate nothing. Unhashed names are served with a short max-age and
+an ETag. Templates must use ``{% static %}`` to get the hashed URLs.
+Under ASGI the middleware stays async; only static requests go to a
+thread for the file I/O.
+
+Settings (``STATIC_ASSETS`` in settings.py): SERVE, MAX_AGE,
+UNHASHED_MAX_AGE, COMPRESS_EXTENSIONS, COMPRESS_MIN_SIZE.
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import re
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SERVE': True,
+    'MAX_AGE': 60 * 60 * 24 * 365,
+    'UNHASHED_MAX_AGE': 60,
+    'COMPRESS_EXTENSIONS': ('.css', '.js', '.mjs', '.map', '.html', '.svg', '.json', '.txt', '.xml', '.ico'),
+    'COMPRESS_MIN_SIZE': 256,
+}
+
+# Preferred first.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def _options():
+    return {**DEFAULTS, **getattr(settings, 'STATIC_ASSETS', {})}
+
+
+def compress(path):
+    """Write ``path``.gz and ``path``.br next to ``path`` where they are smaller."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    written = []
+    variants = [('.gz', lambda d: gzip.compress(d, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        variants.append(('.br', lambda d: brotli.compress(d, quality=11)))
+    for suffix, compressor in variants:
+        compressed = compressor(data)
+        if len(compressed) < len(data):
+            with open(path + suffix, 'wb') as f:
+                f.write(compressed)
+            written.append(path + suffix)
+    return written
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    # Before collectstatic has run (tests, local runs without DEBUG) names
+    # missing from the manifest fall back to their unhashed URL.
+    manifest_strict = False
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run=dry_run, **options)
+        if dry_run:
+            return
+        opts = _options()
+        names = {*paths, *self.hashed_files.values()}
+        for name in sorted(names):
+            if not name.endswith(tuple(opts['COMPRESS_EXTENSIONS'])) or not self.exists(name):
+                continue
+            if self.size(name) < opts['COMPRESS_MIN_SIZE']:
+                continue
+            compress(self.path(name))
+
+    _uncollected = set()
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            if name not in self._uncollected:
+                self._uncollected.add(name)
+                logger.warning('Static file %s is not collected; run collectstatic.', name)
+            return name
+
+
+def accepted_encodings(header):
+    """Content codings from an Accept-Encoding header, minus those with q=0."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = re.search(r'q=([0-9.]+)', params)
+        if coding and not (q and float(q.group(1)) == 0):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL if settings.STATIC_URL.startswith('/') else '/' + settings.STATIC_URL
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            # Keep async views on the event loop instead of a thread.
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if self.is_static(request):
+            response = self.serve(request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if self.is_static(request):
+            # stat() and open() block; everything else stays on the loop.
+            response = await sync_to_async(self.serve, thread_sensitive=False)(
+                request, request.path[len(self.prefix):])
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+    def is_static(self, request):
+        return (request.method in ('GET', 'HEAD') and request.path.startswith(self.prefix)
+                and settings.STATIC_ROOT and _options()['SERVE'])
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except ValueError:
+            return None
+        if not os.path.isfile(path):
+            return None
+        options = _options()
+        accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+        encoding, served = None, path
+        for coding, suffix in ENCODINGS:
+            if coding in accepted and os.path.isfile(path + suffix):
+                encoding, served = coding, path + suffix
+                break
+
+        stat = os.stat(served)
+        etag = '"%x-%x%s"' % (int(stat.st_mtime), stat.st_size, '-' + encoding if encoding else '')
+        immutable = name in self.hashed_names()
+        if not immutable and etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+            response = FileResponse(open(served, 'rb'), content_type=content_type)
+            # FileResponse names the (possibly .gz/.br) file; browsers don't need it.
+            response.headers.pop('Content-Disposition', None)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['ETag'] = etag
+        if immutable:
+            response['Cache-Control'] = 'public, max-age=%d, immutable' % options['MAX_AGE']
+        else:
+            response['Cache-Control'] = 'public, max-age=%d' % options['UNHASHED_MAX_AGE']
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
+
+    def hashed_names(self):
+        # The manifest's values are exactly the hashed names collectstatic wrote.
+        storage = staticfiles_storage
+        if not hasattr(storage, 'hashed_files'):
+            return set()
+        if getattr(self, '_manifest', None) is not storage.hashed_files:
+            self._manifest, self._hashed = storage.hashed_files, set(storage.hashed_files.values())
+        return self._hashed